@@ -0,0 +1,22 @@
+"""Django settings for benchmark runs: the real settings, a throwaway database and eager Celery"""
+import os
+from django_app.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ["BENCH_DB_PATH"],
+        # Concurrent submissions write from several threads; wait for the lock instead of failing
+        'OPTIONS': {'timeout': 30, 'transaction_mode': 'IMMEDIATE', 'init_command': 'PRAGMA journal_mode=WAL;'},
+    }
+}
+ALLOWED_HOSTS = ['*']
+DEBUG = False
+
+# analyze_repo_task runs inside the submitting process, so the Django endpoints measure the whole analysis
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# Every run reviews every file: results cached by an earlier run would hide the pipeline's cost
+LLM_CACHE_ENABLED = False
+PR_ANALYSIS_SINGLE_FLIGHT_ENABLED = False
@@ -0,0 +1,353 @@
+"""Offline end-to-end benchmarks against local GitHub and Groq stand-ins (benchmarks/stubs.py).
+
+    python benchmarks/run.py                              # every scenario, JSON report on stdout
+    python benchmarks/run.py -s pr30,pr300 --engine both -o bench.json
+    python benchmarks/run.py --llm-error-rate 0.05 --baseline bench.json
+
+Each scenario runs in its own process (so peak RSS is its own) with fresh stubs, a throwaway
+SQLite database and eager Celery: analyze_repo_task runs inside the process that submits it.
+Redis is only used when --redis-url is given. The report is one JSON document with throughput,
+p50/p95/p99 latency, failed files, stub request counts and peak RSS per scenario, tagged with
+the git commit, so reports of different commits can be compared with --baseline.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+DJANGO_DIR = os.path.join(ROOT_DIR, "django_app")
+REPO_URL = "https://github.com/bench/repo"
+RESULT_MARKER = "BENCH_RESULT "
+# Refused at once, so runs without Redis never wait on a connect timeout
+NO_REDIS_URL = "redis://127.0.0.1:1/0"
+
+# name -> (driver, files per PR)
+SCENARIOS = {
+    "pr1": ("analyze_pr", 1),
+    "pr30": ("analyze_pr", 30),
+    "pr300": ("analyze_pr", 300),
+    "task30": ("task", 30),
+    "django_concurrent": ("django", 30),
+    "gateway_concurrent": ("gateway", 30),
+}
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of values (0 <= q <= 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def failed_files(entries):
+    """Entries that are not a review: error issues or files parked for a later retry"""
+    return sum(
+        1 for entry in entries
+        if entry.get("parked") or any(issue.get("type") == "error" for issue in (entry.get("analysis") or {}).get("issues", []))
+    )
+
+
+# --- child process: one scenario -------------------------------------------------------------
+
+def _setup_django(args, github, groq):
+    os.environ.update({
+        "DJANGO_SETTINGS_MODULE": "bench_settings",
+        "BENCH_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="pr-bench-"), "db.sqlite3"),
+        "GITHUB_API_URL": github.url,
+        # Read by the Groq SDK itself
+        "GROQ_BASE_URL": groq.url,
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY") or "bench",
+        "REDIS_URL": args.redis_url or NO_REDIS_URL,
+        "CELERY_RESULT_BACKEND": args.redis_url or NO_REDIS_URL,
+        "PR_ANALYSIS_ENGINE": args.engine,
+        "RESILIENCE_BACKOFF_BASE": str(args.backoff_base),
+    })
+    if args.review_mode:
+        os.environ["PR_ANALYSIS_REVIEW_MODE"] = args.review_mode
+    sys.path[:0] = [BENCH_DIR, DJANGO_DIR, ROOT_DIR]
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+    from django_app.celery import app as celery_app
+    import Home.task  # noqa: F401  (registers the tasks)
+    # Home/task.py creates a Celery app of its own; tasks must run on the configured one
+    celery_app.set_current()
+
+
+def _serve_django():
+    """Django on a threaded WSGI server on a free port; returns its base URL"""
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    server = make_server("127.0.0.1", 0, get_wsgi_application(), server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _run_analyze_pr(args, files_per_pr):
+    from Home.utils.github import analyze_pr
+    from Home.utils.async_engine import analyze_pr_with_asyncio
+    analyze = analyze_pr_with_asyncio if args.engine == "async" else analyze_pr
+    # Warm-up: imports, connection pools and the first LLM client are not part of the numbers
+    analyze(REPO_URL, 1)
+    latencies, files, failed = [], 0, 0
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        begun = time.perf_counter()
+        result = analyze(REPO_URL, files_per_pr)
+        latencies.append(time.perf_counter() - begun)
+        files += len(result["result"])
+        failed += failed_files(result["result"])
+    return latencies, files, failed, time.perf_counter() - started
+
+
+def _saved_files(files_per_pr):
+    """(files, failed files) over every analysis saved for the scenario's PR"""
+    from Home.models import PRAnalysisResult
+    entries = [entry for saved in PRAnalysisResult.objects.filter(pr_number=files_per_pr) for entry in saved.analysis_result]
+    return len(entries), failed_files(entries)
+
+
+def _run_task(args, files_per_pr):
+    from Home.task import analyze_repo_task
+    analyze_repo_task.apply(args=(REPO_URL, 1)).get()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        begun = time.perf_counter()
+        analyze_repo_task.apply(args=(REPO_URL, files_per_pr)).get()
+        latencies.append(time.perf_counter() - begun)
+    duration = time.perf_counter() - started
+    return (latencies, *_saved_files(files_per_pr), duration)
+
+
+def _run_django(args, files_per_pr):
+    import requests
+    base_url = _serve_django()
+    session = requests.Session()
+    session.post(f"{base_url}/start_task/", json={"repo_url": REPO_URL, "pr_number": 1, "force": True}).raise_for_status()
+
+    def submit(_):
+        begun = time.perf_counter()
+        response = session.post(f"{base_url}/start_task/", json={"repo_url": REPO_URL, "pr_number": files_per_pr, "force": True})
+        response.raise_for_status()
+        return time.perf_counter() - begun
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.submitters) as submitters:
+        latencies = list(submitters.map(submit, range(args.submissions)))
+    duration = time.perf_counter() - started
+    return (latencies, *_saved_files(files_per_pr), duration)
+
+
+def _run_gateway(args, files_per_pr):
+    import httpx
+    os.environ["DJANGO_URL"] = _serve_django()
+    os.environ["GATEWAY_READ_TIMEOUT"] = str(max(float(os.environ.get("GATEWAY_READ_TIMEOUT", "30")), 600))
+    from fastapi_app.main import app
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=None) as client:
+                (await client.post("/start_task", json={"repo_url": REPO_URL, "pr_number": 1, "force": True})).raise_for_status()
+                slots = asyncio.Semaphore(args.submitters)
+
+                async def submit():
+                    async with slots:
+                        begun = time.perf_counter()
+                        response = await client.post("/start_task", json={"repo_url": REPO_URL, "pr_number": files_per_pr, "force": True})
+                        response.raise_for_status()
+                        if "error" in response.json():
+                            raise RuntimeError(response.json())
+                        return time.perf_counter() - begun
+
+                started = time.perf_counter()
+                latencies = await asyncio.gather(*(submit() for _ in range(args.submissions)))
+                return list(latencies), time.perf_counter() - started
+
+    latencies, duration = asyncio.run(run())
+    return (latencies, *_saved_files(files_per_pr), duration)
+
+
+DRIVERS = {"analyze_pr": _run_analyze_pr, "task": _run_task, "django": _run_django, "gateway": _run_gateway}
+
+
+def run_scenario(args, name):
+    from stubs import StubConfig, start_github_stub, start_groq_stub
+    config = StubConfig(
+        github_latency_ms=args.github_latency_ms, llm_latency_ms=args.llm_latency_ms, jitter=args.jitter,
+        github_error_rate=args.github_error_rate, llm_error_rate=args.llm_error_rate,
+        file_lines=args.file_lines, patch_lines=args.patch_lines, issues_per_file=args.issues_per_file, seed=args.seed,
+    )
+    github, groq = start_github_stub(config), start_groq_stub(config)
+    driver, files_per_pr = SCENARIOS[name]
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with output:
+        _setup_django(args, github, groq)
+        latencies, files, failed, duration = DRIVERS[driver](args, files_per_pr)
+    return {
+        "scenario": name,
+        "driver": driver,
+        "engine": args.engine,
+        "files_per_pr": files_per_pr,
+        "prs": len(latencies),
+        "files": files,
+        "failed_files": failed,
+        "duration_seconds": round(duration, 3),
+        "throughput": {
+            "prs_per_second": round(len(latencies) / duration, 3) if duration else None,
+            "files_per_second": round(files / duration, 2) if duration else None,
+        },
+        "latency_ms": {
+            key: round(value * 1000, 1)
+            for key, value in (
+                ("p50", percentile(latencies, 50)), ("p95", percentile(latencies, 95)), ("p99", percentile(latencies, 99)),
+                ("max", max(latencies)), ("mean", sum(latencies) / len(latencies)),
+            )
+        },
+        # The warm-up run is included in the stub counters
+        "github": github.counters.snapshot(),
+        "groq": groq.counters.snapshot(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# --- parent process: every scenario, report ---------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _child_command(argv, name, engine):
+    return [sys.executable, os.path.abspath(__file__), *argv, "--child", name, "--engine", engine]
+
+
+def run_all(args, argv):
+    engines = ("sync", "async") if args.engine == "both" else (args.engine,)
+    results = []
+    for name in args.scenarios:
+        for engine in engines:
+            print(f"Running {name} ({engine} engine)...", file=sys.stderr)
+            child = subprocess.run(_child_command(argv, name, engine), stdout=subprocess.PIPE, text=True)
+            lines = [line for line in child.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+            if child.returncode != 0 or not lines:
+                results.append({"scenario": name, "engine": engine, "error": f"exit status {child.returncode}"})
+                continue
+            results.append(json.loads(lines[-1][len(RESULT_MARKER):]))
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("child", "output", "baseline", "verbose")},
+        "scenarios": results,
+    }
+
+
+def compare(report, baseline):
+    """Lines comparing p95 latency, files/s and peak RSS with an earlier report"""
+    earlier = {(entry["scenario"], entry["engine"]): entry for entry in baseline.get("scenarios", []) if "error" not in entry}
+    lines = [f"Compared with {baseline.get('commit')} ({baseline.get('timestamp')}):"]
+    for entry in report["scenarios"]:
+        before = earlier.get((entry["scenario"], entry["engine"]))
+        if before is None or "error" in entry:
+            continue
+
+        def change(now, then):
+            return f"{(now - then) / then * 100:+.1f}%" if then else "n/a"
+        lines.append(
+            f"  {entry['scenario']:<20} {entry['engine']:<5} "
+            f"p95 {entry['latency_ms']['p95']:>9.1f} ms ({change(entry['latency_ms']['p95'], before['latency_ms']['p95'])})  "
+            f"{entry['throughput']['files_per_second']:>8.2f} files/s ({change(entry['throughput']['files_per_second'], before['throughput']['files_per_second'])})  "
+            f"RSS {entry['peak_rss_mb']:>7.1f} MB ({change(entry['peak_rss_mb'], before['peak_rss_mb'])})"
+        )
+    return lines
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline PR analysis benchmarks against local GitHub/Groq stubs")
+    parser.add_argument("-s", "--scenarios", default=",".join(SCENARIOS), help=f"comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--engine", choices=("sync", "async", "both"), default="sync")
+    parser.add_argument("--review-mode", choices=("full", "hunks"), default=None, help="default: PR_ANALYSIS_REVIEW_MODE")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per PR scenario")
+    parser.add_argument("--submitters", type=int, default=8, help="concurrent clients in the endpoint scenarios")
+    parser.add_argument("--submissions", type=int, default=16, help="requests in the endpoint scenarios")
+    parser.add_argument("--github-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--github-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--file-lines", type=int, default=60)
+    parser.add_argument("--patch-lines", type=int, default=10)
+    parser.add_argument("--issues-per-file", type=int, default=2)
+    parser.add_argument("--backoff-base", type=float, default=0.05, help="RESILIENCE_BACKOFF_BASE for the run")
+    parser.add_argument("--redis-url", default=None, help="use this Redis (default: none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare with (printed to stderr)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="keep the pipeline's own output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.child:
+        print(RESULT_MARKER + json.dumps(run_scenario(args, args.child)), flush=True)
+        return 0
+    report = run_all(args, argv)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            print("\n".join(compare(report, json.load(baseline))), file=sys.stderr)
+    return 1 if any("error" in entry for entry in report["scenarios"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
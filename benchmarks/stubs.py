@@ -0,0 +1,223 @@
+"""Local stand-ins for api.github.com (plus raw file URLs) and the Groq chat-completions API.
+
+Both run on ThreadingHTTPServer in background threads. Latency, error rates and payload sizes
+come from a StubConfig; each server counts its requests, injected errors and peak concurrency.
+
+GitHub: PR number N of any repository has N changed files, f0.py .. f{N-1}.py.
+    GET /repos/{owner}/{repo}/pulls/{n}                     PR details (head sha, changed_files, additions)
+    GET /repos/{owner}/{repo}/pulls/{n}/files?page=&per_page=  paginated file list with patches
+    GET /raw/{owner}/{repo}/{sha}/{path}                    raw file content
+    GET /repos/{owner}/{repo}/contents/{path}               base64 file content
+Groq: POST /openai/v1/chat/completions answers with a valid review in the JSON the prompts ask
+    for: a "files" list for batch prompts, "issues" otherwise, plus risk/complexity when asked.
+"""
+import base64
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class StubConfig:
+    github_latency_ms: float = 20.0
+    llm_latency_ms: float = 300.0
+    jitter: float = 0.2              # latencies vary uniformly by +-jitter
+    github_error_rate: float = 0.0   # share of GitHub requests answered with a 503
+    llm_error_rate: float = 0.0      # share of chat completions answered with a 429 (half) or 503
+    file_lines: int = 60             # lines per file
+    patch_lines: int = 10            # added lines per file's patch
+    issues_per_file: int = 2
+    seed: int = 0
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def enter(self):
+        with self.lock:
+            self.values["requests"] += 1
+            self.values["in_flight"] += 1
+            self.values["max_in_flight"] = max(self.values["max_in_flight"], self.values["in_flight"])
+
+    def leave(self, error=False):
+        with self.lock:
+            self.values["in_flight"] -= 1
+            self.values["errors"] += int(error)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: value for key, value in self.values.items() if key != "in_flight"}
+
+
+def _file_content(path, lines):
+    body = [f"# {path}"]
+    for number in range(1, lines):
+        body.append(f"def func_{number}(value):" if number % 4 == 1 else f"    value = value * {number} + 1" if number % 4 != 0 else "    return value")
+    return "\n".join(body) + "\n"
+
+
+def _patch(lines):
+    added = "\n".join(f"+    value = value + {number}" for number in range(lines))
+    return f"@@ -1,2 +1,{lines + 2} @@\n def func_1(value):\n{added}\n     return value"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        payload = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _sleep(self, latency_ms):
+        config = self.stub.config
+        time.sleep(max(0.0, latency_ms * (1 + self.stub.random.uniform(-config.jitter, config.jitter))) / 1000)
+
+    def _handle(self, route):
+        self.stub.counters.enter()
+        error = False
+        try:
+            error = route()
+        finally:
+            self.stub.counters.leave(error)
+
+
+class _GitHubHandler(_Handler):
+    def do_GET(self):
+        self._handle(self._route)
+
+    def _route(self):
+        config = self.stub.config
+        self._sleep(config.github_latency_ms)
+        if self.stub.roll(config.github_error_rate):
+            self._send(503, json.dumps({"message": "Service unavailable (stub)"}))
+            return True
+        url = urlparse(self.path)
+        base = self.stub.url
+        match = re.match(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)(/files)?$", url.path)
+        if match:
+            owner, repo, number, files = match.groups()
+            count = int(number)
+            if not files:
+                self._send(200, json.dumps({"number": count, "head": {"sha": f"head{count}"}, "changed_files": count, "additions": count * config.patch_lines}))
+                return False
+            query = parse_qs(url.query)
+            per_page = int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            first = (page - 1) * per_page
+            listed = [
+                {
+                    "sha": f"blob{count}x{index}", "filename": f"f{index}.py", "status": "modified",
+                    "additions": config.patch_lines, "deletions": 0, "changes": config.patch_lines,
+                    "raw_url": f"{base}/raw/{owner}/{repo}/head{count}/f{index}.py",
+                    "patch": _patch(config.patch_lines),
+                }
+                for index in range(first, min(count, first + per_page))
+            ]
+            headers = {}
+            if first + per_page < count:
+                headers["Link"] = f'<{base}{url.path}?per_page={per_page}&page={page + 1}>; rel="next"'
+            self._send(200, json.dumps(listed), headers=headers)
+            return False
+        if url.path.startswith("/raw/"):
+            self._send(200, _file_content(url.path, config.file_lines), "text/plain")
+            return False
+        match = re.match(r"^/repos/[^/]+/[^/]+/contents/(.+)$", url.path)
+        if match:
+            content = base64.b64encode(_file_content(match.group(1), config.file_lines).encode()).decode()
+            self._send(200, json.dumps({"encoding": "base64", "content": content}))
+            return False
+        self._send(404, json.dumps({"message": "Not Found"}))
+        return False
+
+
+class _GroqHandler(_Handler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._handle(lambda: self._route(body))
+
+    def _issues(self, name):
+        return [
+            {"type": ("bugs", "style", "performance", "best_practice")[number % 4], "line": number + 1,
+             "description": f"Stub finding {number} in {name}", "suggestion": "Stub suggestion"}
+            for number in range(self.stub.config.issues_per_file)
+        ]
+
+    def _route(self, body):
+        config = self.stub.config
+        self._sleep(config.llm_latency_ms)
+        if self.stub.roll(config.llm_error_rate):
+            status = 429 if self.stub.roll(0.5) else 503
+            self._send(status, json.dumps({"error": {"message": "stub failure", "type": "rate_limit" if status == 429 else "server_error"}}), headers={"retry-after": "0"})
+            return True
+        prompt = body.get("messages", [{}])[0].get("content", "")
+        rate = {"risk": "medium", "complexity": 4} if '"risk"' in prompt else {}
+        names = re.findall(r"=== File: (\S+)", prompt)
+        if names:
+            answer = {"files": [dict(file_name=name, issues=self._issues(name), **rate) for name in names]}
+        else:
+            answer = dict(issues=self._issues("file"), **rate)
+        completion = {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(answer)}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(json.dumps(answer)) // 4, "total_tokens": 0},
+        }
+        self._send(200, json.dumps(completion))
+        return False
+
+
+class StubServer:
+    """One stub API on 127.0.0.1 (port 0 picks a free one); stop() shuts it down"""
+
+    def __init__(self, handler, config, port=0):
+        self.config = config
+        self.counters = _Counters()
+        self.random = random.Random(config.seed)
+        self._random_lock = threading.Lock()
+        handler_class = type(handler.__name__, (handler,), {"stub": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            return self.random.random() < rate
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_github_stub(config, port=0):
+    return StubServer(_GitHubHandler, config, port)
+
+
+def start_groq_stub(config, port=0):
+    return StubServer(_GroqHandler, config, port)
+
+
+if __name__ == "__main__":
+    # Run both stubs by hand, e.g. to point a local worker at them
+    github = start_github_stub(StubConfig(), 8765)
+    groq = start_groq_stub(StubConfig(), 8766)
+    print(f"GITHUB_API_URL={github.url} GROQ_BASE_URL={groq.url}/openai/v1")
+    threading.Event().wait()
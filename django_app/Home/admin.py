@@ -1,7 +1,25 @@
 from django.contrib import admin
-from .models import PRAnalysisResult
+from .models import PRAnalysisResult, LLMCacheEntry, IssueStatistic, Issue
 
 @admin.register(PRAnalysisResult)
 class PRAnalysisResultAdmin(admin.ModelAdmin):
     list_display = ('task_id', 'repo_url', 'pr_number', 'created_at')
     search_fields = ('task_id', 'repo_url', 'pr_number')
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'created_at', 'last_accessed_at')
+    search_fields = ('key',)
+
+@admin.register(IssueStatistic)
+class IssueStatisticAdmin(admin.ModelAdmin):
+    list_display = ('repo_url', 'day', 'analyses', 'total_issues', 'style', 'bugs', 'performance', 'best_practice')
+    list_filter = ('day',)
+    search_fields = ('repo_url',)
+
+@admin.register(Issue)
+class IssueAdmin(admin.ModelAdmin):
+    list_display = ('repo_url', 'pr_number', 'file_path', 'type', 'line', 'created_at')
+    list_filter = ('type',)
+    search_fields = ('repo_url', 'file_path', 'description')
+    raw_id_fields = ('analysis',)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Home.utils.issue_stats import rebuild_issue_statistics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-repository, per-day issue counts behind /api/statistics/ from stored analyses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows read and written per query")
+
+    def handle(self, *args, **options):
+        read = rebuild_issue_statistics(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt issue statistics from {read} analyses"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Home.utils.issue_stats import rebuild_issues
+
+
+class Command(BaseCommand):
+    help = "Recreate the normalized Issue rows behind /api/issues/ from stored analyses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Analyses read and issues inserted per query")
+
+    def handle(self, *args, **options):
+        written = rebuild_issues(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} issues"))
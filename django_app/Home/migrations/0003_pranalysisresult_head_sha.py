@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0002_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pranalysisresult',
+            name='head_sha',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0003_pranalysisresult_head_sha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repo_url', models.URLField()),
+                ('day', models.DateField()),
+                ('analyses', models.IntegerField(default=0)),
+                ('total_issues', models.IntegerField(default=0)),
+                ('style', models.IntegerField(default=0)),
+                ('bugs', models.IntegerField(default=0)),
+                ('performance', models.IntegerField(default=0)),
+                ('best_practice', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('repo_url', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0004_issuestatistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Issue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repo_url', models.URLField()),
+                ('pr_number', models.IntegerField()),
+                ('file_path', models.CharField(max_length=1000)),
+                ('type', models.CharField(max_length=50)),
+                ('line', models.IntegerField(blank=True, null=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('suggestion', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField()),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='Home.pranalysisresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['repo_url', 'pr_number'], name='Home_issue_repo_ur_ba7262_idx'), models.Index(fields=['repo_url', 'type', 'created_at'], name='Home_issue_repo_ur_db24f7_idx'), models.Index(fields=['type', 'created_at'], name='Home_issue_type_d56287_idx'), models.Index(fields=['created_at'], name='Home_issue_created_7dee4c_idx')],
+            },
+        ),
+    ]
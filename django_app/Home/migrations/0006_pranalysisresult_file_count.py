@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+def fill_file_count(apps, schema_editor):
+    PRAnalysisResult = apps.get_model('Home', 'PRAnalysisResult')
+    batch = []
+    for result in PRAnalysisResult.objects.only('id', 'analysis_result').iterator(chunk_size=500):
+        result.file_count = len(result.analysis_result) if isinstance(result.analysis_result, list) else 0
+        batch.append(result)
+        if len(batch) == 500:
+            PRAnalysisResult.objects.bulk_update(batch, ['file_count'])
+            batch = []
+    if batch:
+        PRAnalysisResult.objects.bulk_update(batch, ['file_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0005_issue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pranalysisresult',
+            name='file_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_file_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pranalysisresult',
+            index=models.Index(fields=['-created_at', '-id'], name='home_analysis_listing_idx'),
+        ),
+    ]
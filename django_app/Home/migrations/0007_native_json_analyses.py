@@ -0,0 +1,109 @@
+import json
+
+from django.db import migrations
+
+# A frozen copy of the answer parsing in Home.utils.llm_output as it was when this migration was
+# written, so later changes to that module never change what this migration does.
+TYPE_ALIASES = {
+    "bug": "bugs", "error_prone": "bugs",
+    "best practice": "best_practice", "best-practice": "best_practice", "best_practices": "best_practice",
+    "formatting": "style", "code_style": "style",
+    "perf": "performance",
+}
+
+
+def _extract_json(text):
+    # The JSON object embedded in an answer (prose and ``` fences are ignored), or None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def _clean_line(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    return value if value and value[0].isdigit() else None
+
+
+def _clean_issue(issue):
+    if not isinstance(issue, dict):
+        return None
+    description = issue.get("description")
+    if not isinstance(description, str) or not description.strip():
+        return None
+    issue_type = str(issue.get("type") or "best_practice").strip().lower()
+    cleaned = {
+        "type": TYPE_ALIASES.get(issue_type, issue_type),
+        "description": description.strip(),
+        "suggestion": str(issue.get("suggestion") or "").strip(),
+    }
+    line = _clean_line(issue.get("line"))
+    if line is not None:
+        cleaned["line"] = line
+    return cleaned
+
+
+def _clean_analysis(data):
+    if not isinstance(data, dict) or not isinstance(data.get("issues", []), list):
+        return None
+    issues = [_clean_issue(issue) for issue in data.get("issues", [])]
+    analysis = {"issues": [issue for issue in issues if issue is not None]}
+    if isinstance(data.get("raw"), str):
+        analysis["raw"] = data["raw"]
+    return analysis
+
+
+def _coerce_analysis(value):
+    # Validated dicts pass through, JSON text is parsed once, anything else is kept under "raw"
+    if isinstance(value, dict):
+        analysis = _clean_analysis(value)
+        return analysis if analysis is not None else {"issues": [], "raw": json.dumps(value)}
+    if isinstance(value, str):
+        try:
+            data = json.loads(value)
+        except ValueError:
+            data = _extract_json(value)
+        analysis = _clean_analysis(data)
+        return analysis if analysis is not None else {"issues": [], "raw": value}
+    return {"issues": []}
+
+
+def to_native_json(apps, schema_editor):
+    # Per-file analyses used to be stored as the raw LLM text; parse them once here
+    PRAnalysisResult = apps.get_model('Home', 'PRAnalysisResult')
+    batch = []
+    for result in PRAnalysisResult.objects.only('id', 'analysis_result').iterator(chunk_size=500):
+        if not isinstance(result.analysis_result, list):
+            continue
+        if all(not isinstance(entry, dict) or isinstance(entry.get('analysis'), dict) for entry in result.analysis_result):
+            continue
+        result.analysis_result = [
+            dict(entry, analysis=_coerce_analysis(entry.get('analysis'))) if isinstance(entry, dict) else entry
+            for entry in result.analysis_result
+        ]
+        batch.append(result)
+        if len(batch) == 500:
+            PRAnalysisResult.objects.bulk_update(batch, ['analysis_result'])
+            batch = []
+    if batch:
+        PRAnalysisResult.objects.bulk_update(batch, ['analysis_result'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0006_pranalysisresult_file_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_native_json, migrations.RunPython.noop),
+    ]
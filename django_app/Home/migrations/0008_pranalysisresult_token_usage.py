@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0007_native_json_analyses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pranalysisresult',
+            name='token_usage',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0008_pranalysisresult_token_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pranalysisresult',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
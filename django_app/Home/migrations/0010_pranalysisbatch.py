@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0009_pranalysisresult_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PRAnalysisBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(default='LISTING', max_length=20)),
+                ('repos', models.JSONField(blank=True, default=list)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PRAnalysisBatchItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repo_url', models.URLField()),
+                ('pr_number', models.IntegerField()),
+                ('task_id', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(default='QUEUED', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='Home.pranalysisbatch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['batch', 'status'], name='Home_pranal_batch_i_e94ed3_idx')],
+                'unique_together': {('batch', 'repo_url', 'pr_number')},
+            },
+        ),
+    ]
@@ -5,6 +5,87 @@ class PRAnalysisResult(models.Model):
     repo_url = models.URLField()
     pr_number = models.IntegerField()
     analysis_result = models.JSONField()  # Store the AI output as JSON
+    head_sha = models.CharField(max_length=40, blank=True, default="")  # PR head commit that was analyzed
+    file_count = models.IntegerField(default=0)  # len(analysis_result), so listings never load the JSON
+    token_usage = models.JSONField(default=dict, blank=True)  # Requests, tokens, latency and cost per model tier
+    timings = models.JSONField(default=dict, blank=True)  # Seconds per pipeline stage, bytes fetched, queue wait
     created_at = models.DateTimeField(auto_now_add=True)  # Store timestamp
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the analysis list, newest first
+            models.Index(fields=["-created_at", "-id"], name="home_analysis_listing_idx"),
+        ]
 
+
+class LLMCacheEntry(models.Model):
+    # Database fallback for the LLM result cache when Redis is unavailable
+    key = models.CharField(max_length=64, unique=True)  # sha256 of blob sha, prompt version, model, temperature
+    analysis = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)  # Drives TTL and LRU eviction
+
+
+class IssueStatistic(models.Model):
+    # Issue counts per repository and day, updated whenever an analysis is saved so the
+    # statistics endpoint never has to parse stored results (see Home/utils/issue_stats.py)
+    repo_url = models.URLField()
+    day = models.DateField()
+    analyses = models.IntegerField(default=0)
+    total_issues = models.IntegerField(default=0)
+    style = models.IntegerField(default=0)
+    bugs = models.IntegerField(default=0)
+    performance = models.IntegerField(default=0)
+    best_practice = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("repo_url", "day")
+
+
+class Issue(models.Model):
+    # One row per reported issue, copied out of analysis_result when a result is saved so
+    # issues can be filtered with index lookups instead of parsing every stored analysis
+    analysis = models.ForeignKey(PRAnalysisResult, on_delete=models.CASCADE, related_name="issues")
+    repo_url = models.URLField()  # Denormalized from the analysis for the indexes below
+    pr_number = models.IntegerField()
+    file_path = models.CharField(max_length=1000)
+    type = models.CharField(max_length=50)  # Lower-cased: style, bugs, performance, best_practice, error, ...
+    line = models.IntegerField(null=True, blank=True)  # First line the issue refers to, if any
+    description = models.TextField(blank=True, default="")
+    suggestion = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField()  # Copied from the analysis
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["repo_url", "pr_number"]),
+            models.Index(fields=["repo_url", "type", "created_at"]),
+            models.Index(fields=["type", "created_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+
+class PRAnalysisBatch(models.Model):
+    # One start_batch request: explicit PRs and/or every open PR of some repositories
+    batch_id = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, default="LISTING")  # LISTING (open PRs), RUNNING, DONE
+    repos = models.JSONField(default=list, blank=True)  # Repositories swept for open PRs
+    errors = models.JSONField(default=list, blank=True)  # [{"repo_url", "error"}] of repositories that could not be listed
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+class PRAnalysisBatchItem(models.Model):
+    # One PR of a batch; progress is counted from these rows (see Home/utils/batches.py)
+    batch = models.ForeignKey(PRAnalysisBatch, on_delete=models.CASCADE, related_name="items")
+    repo_url = models.URLField()
+    pr_number = models.IntegerField()
+    task_id = models.CharField(max_length=100, blank=True, default="")  # Analysis serving this PR, once started or coalesced
+    status = models.CharField(max_length=20, default="QUEUED")  # QUEUED, RUNNING, SAVED, COALESCED, ERROR
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("batch", "repo_url", "pr_number")
+        indexes = [
+            models.Index(fields=["batch", "status"]),
+        ]
@@ -1,7 +1,14 @@
 from rest_framework import serializers
-from .models import PRAnalysisResult
+from .models import PRAnalysisResult, Issue
 
 class PRAnalysisResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = PRAnalysisResult
         fields = '__all__'
+
+class IssueSerializer(serializers.ModelSerializer):
+    task_id = serializers.CharField(source='analysis.task_id', read_only=True)
+
+    class Meta:
+        model = Issue
+        fields = ('id', 'task_id', 'repo_url', 'pr_number', 'file_path', 'type', 'line', 'description', 'suggestion', 'created_at')
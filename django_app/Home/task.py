@@ -1,70 +1,415 @@
+import time
+import uuid
 from celery import Celery
-from Home.models import PRAnalysisResult
+from celery import chord, group
+from celery.exceptions import Ignore
+from celery.signals import before_task_publish, task_prerun
+from django.conf import settings
+from django.utils import timezone
+from Home.models import PRAnalysisResult, PRAnalysisBatch, PRAnalysisBatchItem
 from celery import shared_task
 app=Celery('django_app')
 app.config_from_object('django.cong.settings',namespace="CELERY")
-from Home.utils.github import analyze_pr
+from Home.utils.github import analyze_pr, fetch_pr_details, fetch_pr_files, fetch_open_pr_numbers, file_error_entry, previous_entries_by_name, new_token_usage, merge_token_usage
+from Home.utils.tiering import with_costs
+from Home.utils.async_engine import analyze_pr_with_asyncio
+from Home.utils.progress import publish_event, publish_file_result
+from Home.utils.issue_stats import save_analysis_result
+from Home.utils.single_flight import analysis_key, claim_analysis, release_analysis
+from Home.utils.webhooks import is_superseded
+from Home.utils.routing import route_analysis, split_batches, MAX_PRIORITY
+from Home.utils.batches import acquire_budget, holding_slot, finish_item, close_batch_if_done
+from Home.utils.metrics import record, new_timings, merge_timings, rounded, queue_wait_seconds, stamp_enqueued_at, observe_queue_wait
 
+# Queue wait: tasks are stamped when published and measured when a worker starts them
+before_task_publish.connect(stamp_enqueued_at)
+task_prerun.connect(observe_queue_wait)
 
 
-@shared_task
-def analyze_repo_task(repo_url,pr_number,github_token=None):
-    # Use the Celery task ID instead of generating a new UUID
-    task_id = analyze_repo_task.request.id
-    try:
-        result = analyze_pr(repo_url, pr_number, github_token, task_id)
-        print(f"Analysis result for task {task_id}: {len(result.get('result', []))} files analyzed")
-        
-        # Check if result is empty
-        if not result.get("result") or len(result.get("result", [])) == 0:
-            print(f"WARNING: No analysis results for task {task_id}. This might mean:")
-            print(f"  - PR has no files changed")
-            print(f"  - GitHub API returned no files")
-            print(f"  - Error occurred during analysis")
-            # Save empty result with error message
-            error_result = [{
-                "file_name": "No files analyzed",
-                "analysis": '{"issues": [{"type": "warning", "description": "No files were found or analyzed in this PR", "suggestion": "Please verify the PR number and repository URL"}]}'
-            }]
-            PRAnalysisResult.objects.update_or_create(
-                task_id=task_id,
-                defaults={
-                    "repo_url": repo_url,
-                    "pr_number": pr_number,
-                    "analysis_result": error_result
-                }
-            )
-            return {"task_id": task_id, "status": "SAVED", "files_analyzed": 0, "warning": "No files analyzed"}
-        
-        PRAnalysisResult.objects.update_or_create(
+def _engine():
+    # PR_ANALYSIS_ENGINE picks the thread pool or the asyncio pipeline; both return the same result
+    engine = "async" if settings.PR_ANALYSIS_ENGINE == "async" else "sync"
+    return engine, analyze_pr_with_asyncio if engine == "async" else analyze_pr
+
+
+def _save_timed(task_id, defaults, timings):
+    """save_analysis_result with the timing breakdown; returns the seconds the save took"""
+    started = time.monotonic()
+    save_analysis_result(task_id=task_id, defaults=dict(defaults, timings=timings))
+    seconds = time.monotonic() - started
+    timings["db_write_seconds"] = round(seconds, 3)
+    # A single-row update, so the stored breakdown includes the save itself
+    PRAnalysisResult.objects.filter(task_id=task_id).update(timings=timings)
+    return seconds
+
+
+def _save_result(task_id, repo_url, pr_number, result, single_flight_key=None, engine=None, elapsed=None, timings=None):
+    """Save a finished analysis result, publish "done" and return the task result.
+
+    timings (queue wait, ...) are added to the result's own timing breakdown and stored with it.
+    """
+    # Check if result is empty
+    if not result.get("result") or len(result.get("result", [])) == 0:
+        print(f"WARNING: No analysis results for task {task_id}. This might mean:")
+        print(f"  - PR has no files changed")
+        print(f"  - GitHub API returned no files")
+        print(f"  - Error occurred during analysis")
+        # Save empty result with error message
+        error_result = [{
+            "file_name": "No files analyzed",
+            "analysis": {"issues": [{"type": "warning", "description": "No files were found or analyzed in this PR", "suggestion": "Please verify the PR number and repository URL"}]}
+        }]
+        save_analysis_result(
             task_id=task_id,
             defaults={
                 "repo_url": repo_url,
                 "pr_number": pr_number,
-                "analysis_result": result["result"]
+                "analysis_result": error_result,
+                "head_sha": result.get("head_sha", ""),
             }
         )
-        print(f"Task {task_id} saved to database successfully")
-        return {"task_id": task_id, "status": "SAVED", "files_analyzed": len(result.get("result", []))}
+        publish_event(task_id, "done", {"status": "SAVED", "files_analyzed": 0})
+        return {"task_id": task_id, "status": "SAVED", "files_analyzed": 0, "warning": "No files analyzed"}
+
+    timings = rounded(dict(result.get("timings") or {}, **(timings or {}), analysis_seconds=elapsed))
+    db_write = _save_timed(task_id, {
+        "repo_url": repo_url,
+        "pr_number": pr_number,
+        "analysis_result": result["result"],
+        "head_sha": result.get("head_sha", ""),
+        "token_usage": result.get("token_usage", {}),
+    }, timings)
+    record(observations=[("db_write", db_write), ("analysis", elapsed)], counters=[("pr_analysis_tasks_total", 1, {"status": "SAVED"})])
+    print(f"Task {task_id} saved to database successfully")
+    if not result.get("head_sha"):
+        # analyze_pr failed before it knew the head; identical requests should retry, not reuse this
+        release_analysis(single_flight_key, task_id)
+    # Sent after the save so clients can fetch the stored analysis right away
+    publish_event(task_id, "done", {"status": "SAVED", "files_analyzed": len(result["result"])})
+    return {"task_id": task_id, "status": "SAVED", "files_analyzed": len(result.get("result", [])), "files_carried_forward": result.get("carried_forward", 0), "token_usage": result.get("token_usage", {}), "connection_stats": result.get("connection_stats", {}), "engine": engine, "elapsed_seconds": elapsed, "timings": timings, "files_parked": len(result.get("parked_files", []))}
+
+
+def _save_error(task_id, repo_url, pr_number, error, single_flight_key=None):
+    """Save the error state of a failed analysis, publish "done" and return the task result"""
+    # Save error state to database with proper structure
+    error_result = [{
+        "file_name": "Analysis Error",
+        "analysis": {"issues": [{"type": "error", "line": 0, "description": str(error), "suggestion": "Please check repository URL, PR number, and API credentials"}]}
+    }]
+    save_analysis_result(
+        task_id=task_id,
+        defaults={
+            "repo_url": repo_url,
+            "pr_number": pr_number,
+            "analysis_result": error_result
+        }
+    )
+    release_analysis(single_flight_key, task_id)
+    record(counters=[("pr_analysis_tasks_total", 1, {"status": "ERROR"})])
+    publish_event(task_id, "done", {"status": "ERROR", "error": str(error)})
+    return {"task_id": task_id, "status": "ERROR", "error": str(error)}
+
+
+def _superseded(task_id, single_flight_key=None):
+    """Result of a webhook analysis that a newer push replaced before it started: nothing is saved"""
+    print(f"Task {task_id} superseded by a newer push, skipping")
+    release_analysis(single_flight_key, task_id)
+    record(counters=[("pr_analysis_tasks_total", 1, {"status": "SUPERSEDED"})])
+    publish_event(task_id, "done", {"status": "SUPERSEDED"})
+    return {"task_id": task_id, "status": "SUPERSEDED"}
+
+
+def _schedule_parked(task_id, repo_url, pr_number, github_token, head_sha, parked, review_mode, attempt=1):
+    """Queue retry_parked_task for files parked because Groq or GitHub kept failing"""
+    if not parked or not head_sha:
+        return
+    if attempt > settings.PR_ANALYSIS_PARK_MAX_RETRIES:
+        print(f"Giving up on {len(parked)} parked files of task {task_id} after {attempt - 1} retries")
+        return
+    # Later rounds wait longer, so a long outage is not hammered
+    countdown = settings.PR_ANALYSIS_PARK_RETRY_DELAY * (2 ** (attempt - 1))
+    print(f"Retrying {len(parked)} parked files of task {task_id} in {countdown}s (round {attempt})")
+    retry_parked_task.apply_async(
+        (task_id, repo_url, pr_number, github_token, head_sha, parked, review_mode, attempt),
+        countdown=countdown, queue=settings.PR_ANALYSIS_SMALL_QUEUE,
+    )
+
+
+def _split_analysis(task, repo_url, pr_number, github_token, previous_result, review_mode, single_flight_key, queue_wait=None, webhook=False, batch_item_id=None):
+    """Chord of per-batch subtasks plus a merge step for a large PR, or None if it fits one batch"""
+    head_sha = fetch_pr_details(repo_url, pr_number, github_token)['head']['sha']
+    files = fetch_pr_files(repo_url, pr_number, github_token)
+    batches = split_batches(files)
+    if len(batches) < 2:
+        return None
+    task_id = task.request.id
+    previous_by_name = previous_entries_by_name(previous_result)
+    # Subtasks keep the queue and priority the PR was routed with
+    options = {"queue": settings.PR_ANALYSIS_LARGE_QUEUE}
+    priority = (task.request.delivery_info or {}).get("priority")
+    if priority is not None:
+        options["priority"] = priority
+    header = [
+        analyze_files_task.s(
+            repo_url, pr_number, github_token, batch, first_index, head_sha, review_mode, task_id,
+            # Each batch only needs the earlier entries of its own files for incremental mode
+            [previous_by_name[file['filename']] for file in batch if file['filename'] in previous_by_name],
+            webhook=webhook, batch_item_id=batch_item_id,
+        ).set(**options)
+        for first_index, batch in batches
+    ]
+    body = merge_analysis_task.s(repo_url, pr_number, head_sha, single_flight_key, github_token, review_mode, queue_wait).set(**options)
+    print(f"Splitting {len(files)} files of {repo_url} #{pr_number} into {len(batches)} subtasks")
+    return chord(header, body).on_error(split_analysis_failed.s(task_id, repo_url, pr_number, single_flight_key))
+
+
+@shared_task(bind=True)
+def analyze_repo_task(self,repo_url,pr_number,github_token=None,incremental=False,review_mode=None,single_flight_key=None,split=False,webhook=False,batch_item_id=None):
+    # Use the Celery task ID instead of generating a new UUID
+    task_id = self.request.id
+    queue_wait = queue_wait_seconds(self.request)
+    # Webhook analyses wait out the debounce window; a newer push may have replaced this one meanwhile
+    if webhook and is_superseded(repo_url, pr_number, task_id):
+        return _superseded(task_id, single_flight_key)
+    publish_event(task_id, "started", {"repo_url": repo_url, "pr_number": pr_number})
+    try:
+        # Incremental mode reuses per-file results of the latest analysis that recorded a head sha
+        previous_result = None
+        if incremental:
+            previous = PRAnalysisResult.objects.filter(repo_url=repo_url, pr_number=pr_number).exclude(head_sha="").order_by('-created_at').first()
+            if previous:
+                print(f"Incremental analysis for task {task_id} based on head {previous.head_sha} (task {previous.task_id})")
+                previous_result = previous.analysis_result
+        # A batch PR keeps its slot's lease fresh while it runs
+        with holding_slot(batch_item_id):
+            if split:
+                # Large PR: spread it over workers. The chord's merge step takes over this task id,
+                # so status, events and the saved result look the same as for a single task.
+                split_chord = _split_analysis(self, repo_url, pr_number, github_token, previous_result, review_mode, single_flight_key, queue_wait, webhook, batch_item_id)
+                if split_chord is not None:
+                    raise self.replace(split_chord)
+            engine, analyze = _engine()
+            started = time.monotonic()
+            result = analyze(repo_url, pr_number, github_token, task_id, previous_result=previous_result, review_mode=review_mode)
+        elapsed = round(time.monotonic() - started, 3)
+        print(f"Analysis result for task {task_id}: {len(result.get('result', []))} files analyzed in {elapsed}s ({engine} engine)")
+        saved = _save_result(task_id, repo_url, pr_number, result, single_flight_key, engine, elapsed, {"queue_wait_seconds": queue_wait})
+        _schedule_parked(task_id, repo_url, pr_number, github_token, result.get("head_sha"), result.get("parked_files"), review_mode)
+        return saved
+    except Ignore:
+        raise
     except Exception as e:
         print(f"ERROR in analyze_repo_task for task {task_id}: {str(e)}")
         import traceback
         traceback.print_exc()
-        # Save error state to database with proper structure
-        error_result = [{
-            "file_name": "Analysis Error",
-            "analysis": f'{{"issues": [{{"type": "error", "line": 0, "description": "{str(e)}", "suggestion": "Please check repository URL, PR number, and API credentials"}}]}}'
-        }]
-        PRAnalysisResult.objects.update_or_create(
-            task_id=task_id,
-            defaults={
-                "repo_url": repo_url,
-                "pr_number": pr_number,
-                "analysis_result": error_result
-            }
+        return _save_error(task_id, repo_url, pr_number, e, single_flight_key)
+
+
+@shared_task(bind=True)
+def analyze_files_task(self,repo_url,pr_number,github_token,files,first_index,head_sha,review_mode=None,task_id=None,previous_result=None,webhook=False,batch_item_id=None):
+    """One batch of a split analysis: the entries of files, which start at first_index in the PR"""
+    queue_wait = queue_wait_seconds(self.request)
+    if webhook and is_superseded(repo_url, pr_number, task_id):
+        # Batches still queued when a newer push arrives are dropped; the merge step saves nothing
+        print(f"Batch at {first_index} of task {task_id} superseded by a newer push, skipping")
+        return {"first_index": first_index, "superseded": True}
+    engine, analyze = _engine()
+    started = time.monotonic()
+    with holding_slot(batch_item_id):
+        result = analyze(repo_url, pr_number, github_token, task_id, previous_result=previous_result, review_mode=review_mode,
+                         files=files, head_sha=head_sha, first_index=first_index)
+    entries = result.get("result", [])
+    if not result.get("head_sha"):
+        # The batch failed as a whole; keep one entry per file so the merged list stays aligned
+        error = entries[0]["analysis"]["issues"][0]["description"] if entries else "Analysis failed"
+        entries = [file_error_entry(file['filename'], error) for file in files]
+    return {
+        "first_index": first_index,
+        "entries": entries,
+        "carried_forward": result.get("carried_forward", 0),
+        "token_usage": result.get("token_usage", {}),
+        "timings": dict(result.get("timings") or {}, subtask_queue_wait_seconds=queue_wait or 0.0),
+        "parked_files": result.get("parked_files", []),
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+        "engine": engine,
+    }
+
+
+@shared_task(bind=True)
+def merge_analysis_task(self,batch_results,repo_url,pr_number,head_sha,single_flight_key=None,github_token=None,review_mode=None,queue_wait=None):
+    """Chord body of a split analysis; runs under the original task id and saves the merged result"""
+    task_id = self.request.id
+    if any(batch.get("superseded") for batch in batch_results):
+        return _superseded(task_id, single_flight_key)
+    try:
+        batch_results = sorted(batch_results, key=lambda batch: batch["first_index"])
+        token_usage = new_token_usage()
+        timings = new_timings()
+        for batch in batch_results:
+            merge_token_usage(token_usage, batch["token_usage"])
+            merge_timings(timings, batch.get("timings"))
+        with_costs(token_usage)
+        result = {
+            "task_id": task_id,
+            "head_sha": head_sha,
+            "result": [entry for batch in batch_results for entry in batch["entries"]],
+            "carried_forward": sum(batch["carried_forward"] for batch in batch_results),
+            "token_usage": token_usage,
+            "timings": timings,
+            "connection_stats": {"subtasks": len(batch_results)},
+            "parked_files": [parked for batch in batch_results for parked in batch.get("parked_files", [])],
+        }
+        # Slowest batch: the subtasks run side by side
+        elapsed = max(batch["elapsed_seconds"] for batch in batch_results)
+        print(f"Merged {len(batch_results)} subtasks for task {task_id}: {len(result['result'])} files analyzed")
+        saved = _save_result(task_id, repo_url, pr_number, result, single_flight_key, batch_results[0]["engine"], elapsed, {"queue_wait_seconds": queue_wait})
+        _schedule_parked(task_id, repo_url, pr_number, github_token, head_sha, result["parked_files"], review_mode)
+        return saved
+    except Exception as e:
+        print(f"ERROR merging split analysis for task {task_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return _save_error(task_id, repo_url, pr_number, e, single_flight_key)
+
+
+@shared_task
+def split_analysis_failed(request,exc,traceback,task_id,repo_url,pr_number,single_flight_key=None):
+    """Errback of a split analysis whose subtask crashed: record the error like a failed single task"""
+    print(f"ERROR in split analysis for task {task_id}: {str(exc)}")
+    _save_error(task_id, repo_url, pr_number, exc, single_flight_key)
+
+
+@shared_task
+def retry_parked_task(task_id,repo_url,pr_number,github_token,head_sha,parked,review_mode=None,attempt=1):
+    """Analyze the parked files of a saved analysis again and patch the answers into it"""
+    engine, analyze = _engine()
+    files = [file for _, file in parked]
+    # No task id: the entries are published below at their place in the PR
+    result = analyze(repo_url, pr_number, github_token, None, review_mode=review_mode, files=files, head_sha=head_sha)
+    entries = result.get("result", []) if result.get("head_sha") else []
+    if len(entries) != len(parked):
+        # The whole retry failed; keep every file parked
+        entries = [None] * len(parked)
+    stored = PRAnalysisResult.objects.filter(task_id=task_id).first()
+    if stored is None:
+        return {"task_id": task_id, "status": "MISSING"}
+    analysis_result = list(stored.analysis_result)
+    still_parked = []
+    for (index, file), entry in zip(parked, entries):
+        if entry is None or entry.get("parked"):
+            still_parked.append([index, file])
+            continue
+        analysis_result[index] = entry
+        publish_file_result(task_id, index, entry)
+    token_usage = dict(stored.token_usage or {})
+    if token_usage:
+        merge_token_usage(token_usage, result.get("token_usage", {}))
+        with_costs(token_usage)
+    # The retry's fetch and LLM time adds to the analysis it completes
+    timings = rounded(merge_timings(dict(stored.timings or {}), result.get("timings")))
+    recovered = len(parked) - len(still_parked)
+    if recovered:
+        save_analysis_result(task_id=task_id, defaults={
+            "repo_url": stored.repo_url,
+            "pr_number": stored.pr_number,
+            "analysis_result": analysis_result,
+            "head_sha": stored.head_sha,
+            "token_usage": token_usage,
+            "timings": timings,
+        })
+    print(f"Parked files of task {task_id}, round {attempt}: {recovered} analyzed, {len(still_parked)} still parked")
+    _schedule_parked(task_id, repo_url, pr_number, github_token, head_sha, still_parked, review_mode, attempt + 1)
+    return {"task_id": task_id, "status": "SAVED", "files_recovered": recovered, "files_parked": len(still_parked), "engine": engine}
+
+
+@shared_task
+def expand_batch_task(batch_id,repos,github_token=None,incremental=False,review_mode=None,force=False):
+    """List the open PRs of a batch's repositories, then fan every PR of the batch out as a group"""
+    batch = PRAnalysisBatch.objects.get(batch_id=batch_id)
+    errors = []
+    for repo_url in repos:
+        room = settings.BATCH_MAX_PRS - batch.items.count()
+        if room <= 0:
+            errors.append({"repo_url": repo_url, "error": f"Batch limit of {settings.BATCH_MAX_PRS} PRs reached"})
+            continue
+        try:
+            numbers = fetch_open_pr_numbers(repo_url, github_token)
+        except Exception as e:
+            print(f"Could not list open PRs of {repo_url} for batch {batch_id}: {str(e)}")
+            errors.append({"repo_url": repo_url, "error": str(e)})
+            continue
+        if len(numbers) > room:
+            errors.append({"repo_url": repo_url, "error": f"Batch limit of {settings.BATCH_MAX_PRS} PRs reached, {len(numbers) - room} open PRs left out"})
+        # ignore_conflicts: a PR listed explicitly and through its repository is analyzed once
+        PRAnalysisBatchItem.objects.bulk_create(
+            [PRAnalysisBatchItem(batch=batch, repo_url=repo_url, pr_number=number) for number in numbers[:room]],
+            ignore_conflicts=True,
         )
-        return {"task_id": task_id, "status": "ERROR", "error": str(e)}
+    PRAnalysisBatch.objects.filter(id=batch.id).update(status="RUNNING", errors=errors)
+    item_ids = list(batch.items.filter(status="QUEUED").order_by("id").values_list("id", flat=True))
+    print(f"Batch {batch_id}: {len(item_ids)} PRs to analyze, {len(errors)} repositories with errors")
+    if not item_ids:
+        close_batch_if_done(batch.id)
+        return {"batch_id": batch_id, "prs": 0, "repo_errors": len(errors)}
+    # Batch work waits behind interactive requests: small queue, lowest priority
+    group(
+        analyze_batch_pr_task.s(item_id, github_token, incremental, review_mode, force).set(queue=settings.PR_ANALYSIS_SMALL_QUEUE, priority=MAX_PRIORITY)
+        for item_id in item_ids
+    ).apply_async()
+    return {"batch_id": batch_id, "prs": len(item_ids), "repo_errors": len(errors)}
 
 
+@shared_task(bind=True, max_retries=None)
+def analyze_batch_pr_task(self,item_id,github_token=None,incremental=False,review_mode=None,force=False):
+    """Start the analysis of one PR of a batch once the shared batch budget allows it"""
+    item = PRAnalysisBatchItem.objects.filter(id=item_id, status="QUEUED").first()
+    if item is None:
+        return {"item_id": item_id, "status": "SKIPPED"}  # Redelivered after it started
+    wait = acquire_budget(item_id)
+    if wait:
+        # QUEUED items are not written after they are created, so updated_at is when this one was queued
+        if (timezone.now() - item.updated_at).total_seconds() + wait > settings.BATCH_MAX_WAIT:
+            error = f"No batch slot within BATCH_MAX_WAIT ({settings.BATCH_MAX_WAIT}s)"
+            finish_item(item_id, "ERROR", error=error)
+            return {"item_id": item_id, "status": "ERROR", "error": error}
+        raise self.retry(countdown=wait)
+    try:
+        details = fetch_pr_details(item.repo_url, item.pr_number, github_token)
+    except Exception as e:
+        finish_item(item_id, "ERROR", error=str(e))
+        return {"item_id": item_id, "status": "ERROR", "error": str(e)}
 
+    # Single flight, as in start_task: a PR head analyzed recently (or right now) is not analyzed again
+    task_id = str(uuid.uuid4())
+    owner = task_id
+    key = None
+    if settings.PR_ANALYSIS_SINGLE_FLIGHT_ENABLED and not force:
+        key = analysis_key(item.repo_url, item.pr_number, details['head']['sha'], review_mode or settings.PR_ANALYSIS_REVIEW_MODE)
+        owner = claim_analysis(key, task_id)
+    if owner != task_id:
+        finish_item(item_id, "COALESCED", owner)
+        return {"item_id": item_id, "status": "COALESCED", "task_id": owner}
 
+    route = route_analysis(details)
+    PRAnalysisBatchItem.objects.filter(id=item_id).update(status="RUNNING", task_id=task_id)
+    # The slot is held until the analysis (or the merge step of a split one) reports back
+    analyze_repo_task.apply_async(
+        (item.repo_url, item.pr_number, github_token, incremental, review_mode),
+        {"single_flight_key": key, "split": route["split"], "batch_item_id": item_id},
+        task_id=task_id, queue=route["queue"], priority=MAX_PRIORITY,
+        link=batch_item_done.s(item_id), link_error=batch_item_failed.s(item_id),
+    )
+    return {"item_id": item_id, "status": "RUNNING", "task_id": task_id}
+
+
+@shared_task
+def batch_item_done(result,item_id):
+    """Callback of a batch PR's analysis"""
+    status = "SAVED" if result.get("status") == "SAVED" else "ERROR"
+    finish_item(item_id, status, result.get("task_id"), result.get("error", ""))
+
+
+@shared_task
+def batch_item_failed(request,exc,traceback,item_id):
+    """Errback of a batch PR's analysis that crashed"""
+    finish_item(item_id, "ERROR", error=str(exc))
@@ -1,3 +1,1707 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextlib
+import fcntl
+import hashlib
+import importlib
+import hmac
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import celery
+import groq
+import httpx
+import redis
+import requests
+from celery.exceptions import Retry
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from django_app import celery_app
+from Home import task
+from Home.models import PRAnalysisResult, IssueStatistic, Issue, PRAnalysisBatch, PRAnalysisBatchItem
+
+from Home.utils.diff_hunks import parse_patch, _window, build_hunk_excerpt, remap_issue_lines
+from Home.utils.chunking import CHARS_PER_TOKEN, estimate_tokens, split_on_boundaries, plan_llm_requests, merge_chunk_results
+from Home.utils.single_flight import analysis_key, claim_analysis, release_analysis, _is_reusable, REPLACE_SCRIPT, RELEASE_SCRIPT
+from Home.utils.file_filter import classify_file, file_rules
+from Home.utils.webhooks import verify_signature, latest_analysis, is_superseded
+from Home.utils.routing import route_analysis, split_batches, MAX_PRIORITY
+from Home.utils.ai_agent import llm_cache_key, PROMPT_TEMPLATE, HUNK_PROMPT_TEMPLATE, BATCH_STRUCTURE
+from Home.utils.github import (
+    analyze_pr, plan_units, new_token_usage, single_file_prompt, finish_file, parked_entry, parked_files, run_llm_unit,
+    carry_forward, previous_entries_by_name, _fetch_new_content,
+)
+from Home.utils.async_engine import analyze_pr_async, analyze_pr_with_asyncio
+from Home.utils.tiering import should_escalate, split_triaged, mark_escalated
+from Home.utils import git_mirror, github_client, metrics, resilience
+from Home.utils.git_mirror import PRMirror, evict_mirrors, pr_mirror
+from Home.utils.github_client import github_get, CachedResponse, GitHubRateLimitError, TOKEN_BUCKET_SCRIPT
+from Home.utils.resilience import (
+    ProviderGuard, CircuitOpenError, TransientHTTPError, backoff_delay, retry_after, guarded_call, guarded_call_async,
+    get_resilience_stats, _bump,
+)
+from Home.utils.issue_stats import save_analysis_result
+from Home.utils.batches import (
+    acquire_budget, renew_slot, holding_slot, finish_item, batch_progress, SLOTS_KEY, ACQUIRE_SLOT_SCRIPT, RENEW_SLOT_SCRIPT,
+)
+
+
+TWO_HUNK_PATCH = """@@ -1,4 +1,5 @@
+ import os
++import sys
+
+ def main():
+     pass
+@@ -20,4 +21,4 @@ def helper():
+     a = 1
+-    b = 2
++    b = 3
+     return a + b
+\\ No newline at end of file"""
+
+
+class DiffHunksTests(SimpleTestCase):
+    def test_parse_patch_numbers_new_file_lines_per_hunk(self):
+        hunks = parse_patch(TWO_HUNK_PATCH)
+        self.assertEqual(len(hunks), 2)
+        self.assertEqual(hunks[0][1], ("+", 2, "import sys", 2))
+        self.assertEqual([line[1] for line in hunks[0]], [1, 2, 3, 4, 5])
+        # The removed line has no new-file number and sits before the line that replaced it
+        self.assertEqual(hunks[1][1], ("-", None, "    b = 2", 22))
+        self.assertEqual(hunks[1][2], ("+", 22, "    b = 3", 22))
+
+    def test_parse_patch_ignores_no_newline_marker(self):
+        hunks = parse_patch(TWO_HUNK_PATCH)
+        self.assertEqual(hunks[1][-1], (" ", 23, "    return a + b", 23))
+        self.assertFalse(any(line[2].startswith(" No newline") for hunk in hunks for line in hunk))
+
+    def test_parse_patch_pure_deletion(self):
+        hunks = parse_patch("@@ -1,2 +0,0 @@\n-first\n-second")
+        self.assertEqual(hunks, [[("-", None, "first", 0), ("-", None, "second", 0)]])
+
+    def test_window_trims_context(self):
+        hunk = parse_patch(TWO_HUNK_PATCH)[0]
+        window = _window(hunk, 1, None)
+        self.assertEqual([line[1] for line in window], [1, 2, 3])
+
+    def test_window_extends_context_from_new_content(self):
+        new_lines = [f"line {n}" for n in range(1, 31)]
+        hunk = parse_patch("@@ -10,1 +10,1 @@\n-old\n+new")[0]
+        window = _window(hunk, 2, new_lines)
+        self.assertEqual([line[1] for line in window], [8, 9, None, 10, 11, 12])
+        self.assertEqual(window[0], (" ", 8, "line 8", 8))
+
+    def test_window_of_context_only_hunk_is_empty(self):
+        self.assertEqual(_window([(" ", 1, "a", 1), (" ", 2, "b", 2)], 3, None), [])
+
+    def test_build_hunk_excerpt_maps_excerpt_lines_to_file_lines(self):
+        excerpt, line_map = build_hunk_excerpt(TWO_HUNK_PATCH, context_lines=1)
+        self.assertEqual(line_map, {1: 1, 2: 2, 3: 3, 4: 21, 5: 22, 6: 23})
+        lines = excerpt.splitlines()
+        self.assertEqual(lines[1], "    2 + import sys")
+        self.assertEqual(lines[3], "...")
+        self.assertIn("      -     b = 2", lines)
+
+    def test_build_hunk_excerpt_of_pure_deletion(self):
+        excerpt, line_map = build_hunk_excerpt("@@ -1,2 +0,0 @@\n-first\n-second")
+        self.assertEqual(excerpt, "      - first\n      - second")
+        self.assertEqual(line_map, {})
+
+    def test_remap_issue_lines(self):
+        line_map = {1: 1, 2: 2, 4: 21, 5: 22}
+        analysis = {"issues": [
+            {"line": 2, "description": "a"},
+            {"line": "4-5", "description": "b"},
+            {"line": 40, "description": "outside every hunk"},
+            {"description": "no line"},
+        ]}
+        issues = remap_issue_lines(analysis, line_map)["issues"]
+        self.assertEqual([issue.get("line") for issue in issues], [2, "21-22", 40, None])
+        # The original analysis is left alone
+        self.assertEqual(analysis["issues"][1]["line"], "4-5")
+
+
+def _planned_item(index, text, file_name="f"):
+    return {"index": index, "file_name": file_name, "llm_input": text}
+
+
+class ChunkingTests(SimpleTestCase):
+    SOURCE = "\n\n".join(f"def function_{n}(value):\n    return value * {n}" for n in range(1, 6))
+
+    def test_split_on_boundaries_cuts_at_definitions(self):
+        pieces = split_on_boundaries(self.SOURCE, 15)
+        self.assertGreater(len(pieces), 1)
+        for start_line, text in pieces:
+            self.assertTrue(text.startswith("def function_"))
+            self.assertEqual(self.SOURCE.splitlines()[start_line - 1], text.splitlines()[0])
+            self.assertLessEqual(len(text) + 1, 15 * CHARS_PER_TOKEN)
+        self.assertEqual("\n".join(text for _, text in pieces), self.SOURCE)
+
+    def test_split_on_boundaries_cuts_oversized_definition_by_lines(self):
+        source = "def big():\n" + "\n".join(f"    x_{n} = {n}" for n in range(40))
+        pieces = split_on_boundaries(source, 10)
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(pieces[0][0], 1)
+        self.assertEqual("\n".join(text for _, text in pieces), source)
+        starts = [start for start, _ in pieces]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_file_at_the_prompt_budget_is_not_chunked(self):
+        item = _planned_item(0, self.SOURCE)
+        tokens = estimate_tokens(self.SOURCE) + estimate_tokens("f")
+        units = plan_llm_requests([item], tokens + 5, 0, 8, prompt_overhead_tokens=5)
+        self.assertEqual([unit["kind"] for unit in units], ["single"])
+        self.assertEqual(units[0]["planned_tokens"], tokens + 5)
+
+    def test_file_over_the_prompt_budget_is_chunked(self):
+        item = _planned_item(0, self.SOURCE)
+        tokens = estimate_tokens(self.SOURCE) + estimate_tokens("f")
+        units = plan_llm_requests([item], tokens + 4, 0, 8, prompt_overhead_tokens=5)
+        self.assertTrue(all(unit["kind"] == "chunk" for unit in units))
+        self.assertEqual([unit["part"] for unit in units], list(range(1, len(units) + 1)))
+        self.assertEqual({unit["parts"] for unit in units}, {len(units)})
+        self.assertEqual(units[0]["start_line"], 1)
+
+    def test_small_files_are_batched_up_to_the_batch_budget(self):
+        items = [_planned_item(n, "x" * 36) for n in range(3)]  # 10 + 1 tokens each
+        units = plan_llm_requests(items, 1000, 22, 8)
+        self.assertEqual([unit["kind"] for unit in units], ["batch", "single"])
+        self.assertEqual([item["index"] for item in units[0]["items"]], [0, 1])
+        self.assertEqual(units[0]["planned_tokens"], 22)
+
+    def test_batch_file_limit(self):
+        items = [_planned_item(n, "x" * 36) for n in range(5)]
+        units = plan_llm_requests(items, 1000, 1000, 2)
+        self.assertEqual([len(unit["items"]) for unit in units], [2, 2, 1])
+        self.assertEqual([unit["kind"] for unit in units], ["batch", "batch", "single"])
+
+    def test_file_over_the_batch_budget_goes_alone(self):
+        items = [_planned_item(0, "x" * 36), _planned_item(1, "x" * 40), _planned_item(2, "x" * 36)]
+        units = plan_llm_requests(items, 1000, 11, 8)
+        self.assertEqual([(unit["kind"], unit["items"][0]["index"]) for unit in units],
+                         [("single", 1), ("single", 0), ("single", 2)])
+
+    def test_every_rendered_chunk_prompt_fits_the_limit(self):
+        # Typical short code lines, where the line number column costs the most
+        source = "\n\n".join(
+            f"def handler_{n}(request):\n    value = request.get('v{n}')\n    return value or {n}" for n in range(300)
+        )
+        for tiering in (False, True):
+            with override_settings(PR_ANALYSIS_MAX_PROMPT_TOKENS=800, PR_ANALYSIS_BATCH_MAX_TOKENS=400,
+                                   PR_ANALYSIS_BATCH_MAX_FILES=8, LLM_TIERING_ENABLED=tiering):
+                item = dict(_planned_item(0, source, "app/handlers.py"), prompt_template=PROMPT_TEMPLATE, line_map=None)
+                units = plan_units([item], new_token_usage())
+                self.assertGreater(len(units), 1)
+                for unit in units:
+                    prompt_tokens = estimate_tokens(single_file_prompt(item, unit, triage=tiering))
+                    self.assertLessEqual(prompt_tokens, 800)
+                    self.assertLessEqual(prompt_tokens, unit["planned_tokens"])
+
+    def test_merge_chunk_results_keeps_lines_and_drops_repeats(self):
+        file_wide = {"type": "style", "description": "Missing module docstring", "suggestion": "Add one"}
+        merged = merge_chunk_results([
+            {"issues": [dict(file_wide), {"type": "bugs", "line": 3, "description": "Off by one", "suggestion": ""}]},
+            {"issues": [dict(file_wide), {"type": "bugs", "line": 120, "description": "Off by one", "suggestion": ""}]},
+        ])
+        self.assertEqual([issue.get("line") for issue in merged["issues"]], [None, 3, 120])
+        self.assertNotIn("triage", merged)
+
+    def test_merge_chunk_results_keeps_the_riskiest_triage(self):
+        merged = merge_chunk_results([
+            {"issues": [], "triage": {"risk": "low", "complexity": 2}},
+            {"issues": [], "triage": {"risk": "high", "complexity": 5, "escalated": True}},
+        ])
+        self.assertEqual(merged["triage"], {"risk": "high", "complexity": 5, "escalated": True})
+
+
+def _encoded(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class FakeRedis:
+    """The Redis commands and Lua scripts this app uses, kept in a dict.
+
+    Scripts run against the client they are called with (client=...), like redis-py's Script;
+    script_calls counts the calls each client served. The token bucket answers from bucket_waits.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.script_calls = 0
+        self.bucket_waits = []
+        self.now = 1000.0  # Redis TIME for the batch slot scripts
+
+    def set(self, key, value, nx=False, ex=None, get=False):
+        previous = self.data.get(key)
+        if nx and previous is not None:
+            return None
+        self.data[key] = _encoded(value)
+        return previous if get else True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def expireat(self, key, when):
+        return key in self.data
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        table = self.data.setdefault(key, {})
+        for name, item in dict(mapping or {}, **({field: value} if field is not None else {})).items():
+            table[_encoded(name)] = _encoded(item)
+
+    def hincrby(self, key, field, amount=1):
+        table = self.data.setdefault(key, {})
+        table[_encoded(field)] = _encoded(int(table.get(_encoded(field), 0)) + amount)
+        return int(table[_encoded(field)])
+
+    def hincrbyfloat(self, key, field, amount=1.0):
+        table = self.data.setdefault(key, {})
+        table[_encoded(field)] = _encoded(float(table.get(_encoded(field), 0)) + amount)
+        return float(table[_encoded(field)])
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def zrem(self, key, *members):
+        return sum(self.data.get(key, {}).pop(member, None) is not None for member in members)
+
+    def pipeline(self, transaction=True):
+        self.pipelines = getattr(self, "pipelines", 0) + 1
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        def run(keys, args, client=None):
+            return (client or self).run_script(script, keys, args)
+        return run
+
+    def run_script(self, script, keys, args):
+        self.script_calls += 1
+        if script == REPLACE_SCRIPT:
+            # Swap the owner only if it is still args[0]
+            if self.data.get(keys[0]) == _encoded(args[0]):
+                self.data[keys[0]] = _encoded(args[1])
+                return 1
+            return 0
+        if script == RELEASE_SCRIPT:
+            return self.delete(keys[0]) if self.data.get(keys[0]) == _encoded(args[0]) else 0
+        if script == ACQUIRE_SLOT_SCRIPT:
+            slots = self.data.setdefault(keys[0], {})
+            for member, expiry in list(slots.items()):
+                if expiry <= self.now:
+                    del slots[member]
+            if args[2] in slots or len(slots) < int(args[0]):
+                slots[args[2]] = self.now + args[1]
+                return 1
+            return 0
+        if script == RENEW_SLOT_SCRIPT:
+            slots = self.data.get(keys[0], {})
+            if args[1] in slots:
+                slots[args[1]] = self.now + args[0]
+                return 1
+            return 0
+        if script == TOKEN_BUCKET_SCRIPT:
+            return str(self.bucket_waits.pop(0) if self.bucket_waits else 0)
+        raise NotImplementedError(script)
+
+
+class FakePipeline:
+    """Queues FakeRedis commands until execute(), like a redis-py pipeline"""
+
+    def __init__(self, client):
+        self.client, self.commands = client, []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeClock:
+    """Stands in for the time module: the clock only moves when sleep() is called"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class SingleFlightTests(TestCase):
+    KEY_ARGS = ("https://github.com/owner/repo", 7, "a" * 40, "full")
+
+    def test_analysis_key_normalizes_the_repo_url(self):
+        self.assertEqual(analysis_key(*self.KEY_ARGS), analysis_key("https://GitHub.com/Owner/Repo/", 7, "a" * 40, "full"))
+
+    def test_analysis_key_changes_with_each_input(self):
+        key = analysis_key(*self.KEY_ARGS)
+        self.assertNotEqual(key, analysis_key("https://github.com/owner/repo", 7, "b" * 40, "full"))
+        self.assertNotEqual(key, analysis_key("https://github.com/owner/repo", 8, "a" * 40, "full"))
+        self.assertNotEqual(key, analysis_key("https://github.com/owner/repo", 7, "a" * 40, "hunks"))
+        with override_settings(PR_ANALYSIS_SKIP_GLOBS=["docs/*"]):
+            self.assertNotEqual(key, analysis_key(*self.KEY_ARGS))
+        with mock.patch("Home.utils.ai_agent.LLM_MODEL", "another-model"):
+            self.assertNotEqual(key, analysis_key(*self.KEY_ARGS))
+        with mock.patch("Home.utils.single_flight.PROMPT_TEMPLATE", "Review {file_name}: {file_content}"):
+            self.assertNotEqual(key, analysis_key(*self.KEY_ARGS))
+
+    def test_hunk_context_only_matters_in_hunk_mode(self):
+        full, hunks = analysis_key(*self.KEY_ARGS), analysis_key("https://github.com/owner/repo", 7, "a" * 40, "hunks")
+        with override_settings(PR_ANALYSIS_HUNK_CONTEXT_LINES=10):
+            self.assertEqual(full, analysis_key(*self.KEY_ARGS))
+            self.assertNotEqual(hunks, analysis_key("https://github.com/owner/repo", 7, "a" * 40, "hunks"))
+
+    def test_claim_analysis_coalesces_with_a_running_owner(self):
+        client = FakeRedis()
+        with mock.patch("Home.utils.single_flight.get_redis", return_value=client), \
+                mock.patch("Home.utils.single_flight.AsyncResult") as result:
+            result.return_value.state = "STARTED"
+            self.assertEqual(claim_analysis("k", "first"), "first")
+            self.assertEqual(claim_analysis("k", "second"), "first")
+
+    def test_claim_analysis_replaces_a_failed_owner(self):
+        client = FakeRedis()
+        with mock.patch("Home.utils.single_flight.get_redis", return_value=client), \
+                mock.patch("Home.utils.single_flight.AsyncResult") as result:
+            claim_analysis("k", "first")
+            result.return_value.state = "FAILURE"
+            self.assertEqual(claim_analysis("k", "second"), "second")
+            self.assertEqual(client.get("single_flight:k"), b"second")
+
+    def test_scripts_run_on_the_current_client(self):
+        first, second = FakeRedis(), FakeRedis()
+        with mock.patch("Home.utils.single_flight._replace", None), mock.patch("Home.utils.single_flight._release", None), \
+                mock.patch("Home.utils.single_flight.AsyncResult") as result:
+            result.return_value.state = "FAILURE"
+            with mock.patch("Home.utils.single_flight.get_redis", return_value=first):
+                claim_analysis("k", "first")
+                claim_analysis("k", "second")
+            # Reconnected, e.g. after mark_redis_down: the registered scripts must follow
+            second.set("single_flight:k", "third")
+            with mock.patch("Home.utils.single_flight.get_redis", return_value=second):
+                self.assertEqual(claim_analysis("k", "fourth"), "fourth")
+                release_analysis("k", "fourth")
+        self.assertEqual((first.script_calls, second.script_calls), (1, 2))
+        self.assertIsNone(second.get("single_flight:k"))
+
+    def test_claim_analysis_without_redis_owns_every_request(self):
+        with mock.patch("Home.utils.single_flight.get_redis", return_value=None):
+            self.assertEqual(claim_analysis("k", "first"), "first")
+            self.assertEqual(claim_analysis("k", "second"), "second")
+
+    def test_is_reusable(self):
+        with mock.patch("Home.utils.single_flight.AsyncResult") as result:
+            for state, reusable in (("PENDING", True), ("STARTED", True), ("FAILURE", False), ("REVOKED", False), ("SUCCESS", False)):
+                result.return_value.state = state
+                self.assertEqual(_is_reusable("unsaved"), reusable, state)
+        PRAnalysisResult.objects.create(task_id="good", repo_url="https://github.com/o/r", pr_number=1, analysis_result=[], head_sha="a" * 40)
+        PRAnalysisResult.objects.create(task_id="failed", repo_url="https://github.com/o/r", pr_number=1, analysis_result=[])
+        self.assertTrue(_is_reusable("good"))
+        self.assertFalse(_is_reusable("failed"))
+
+
+def _pr_file(filename, status="modified", changes=10, patch="@@ -1 +1 @@\n-a\n+b", **extra):
+    return dict({"filename": filename, "status": status, "changes": changes, "additions": changes // 2,
+                 "deletions": changes - changes // 2, "patch": patch}, **extra)
+
+
+@override_settings(PR_ANALYSIS_FILTER_ENABLED=True, PR_ANALYSIS_SKIP_GLOBS=[], PR_ANALYSIS_MAX_FILE_CHANGES=0, PR_ANALYSIS_REPO_FILE_RULES={})
+class FileFilterTests(SimpleTestCase):
+    REPO = "https://github.com/owner/repo"
+
+    def reason(self, file, repo_url=REPO):
+        skipped = classify_file(file_rules(repo_url), file)
+        return skipped[0] if skipped else None
+
+    def test_source_files_are_reviewed(self):
+        self.assertIsNone(self.reason(_pr_file("src/app.py")))
+        self.assertIsNone(self.reason(_pr_file("src/app.js", status="added")))
+
+    def test_removed_files(self):
+        self.assertEqual(classify_file(file_rules(self.REPO), _pr_file("src/old.py", status="removed", changes=12)),
+                         ("deleted", "Deleted file (+6/-6 lines)"))
+
+    def test_pure_renames(self):
+        renamed = _pr_file("src/new.py", status="renamed", changes=0, patch=None, previous_filename="src/old.py")
+        self.assertEqual(classify_file(file_rules(self.REPO), renamed), ("renamed", "Renamed from src/old.py without changes"))
+        # A rename with edits is reviewed
+        self.assertIsNone(self.reason(_pr_file("src/new.py", status="renamed", previous_filename="src/old.py")))
+
+    def test_binaries(self):
+        self.assertEqual(self.reason(_pr_file("docs/logo.png")), "binary")
+        self.assertEqual(self.reason(_pr_file("data/blob.bin", changes=0, patch=None)), "binary")
+
+    def test_lockfiles_minified_and_vendored_code(self):
+        self.assertEqual(self.reason(_pr_file("frontend/package-lock.json")), "lockfile")
+        self.assertEqual(self.reason(_pr_file("poetry.lock")), "lockfile")
+        self.assertEqual(self.reason(_pr_file("static/app.min.js")), "minified")
+        self.assertEqual(self.reason(_pr_file("static/app.js.map")), "minified")
+        self.assertEqual(self.reason(_pr_file("vendor/lib/util.go")), "vendored")
+        self.assertEqual(self.reason(_pr_file("web/node_modules/pkg/index.js")), "vendored")
+
+    def test_size_limit(self):
+        with override_settings(PR_ANALYSIS_MAX_FILE_CHANGES=100):
+            self.assertIsNone(self.reason(_pr_file("src/app.py", changes=100)))
+            self.assertEqual(self.reason(_pr_file("src/app.py", changes=101)), "too_large")
+
+    def test_skip_globs(self):
+        with override_settings(PR_ANALYSIS_SKIP_GLOBS=["docs/*", "*.snap"]):
+            self.assertEqual(self.reason(_pr_file("docs/guide/intro.md")), "excluded")
+            self.assertEqual(self.reason(_pr_file("tests/__snapshots__/app.snap")), "excluded")
+            self.assertIsNone(self.reason(_pr_file("src/docs.py")))
+
+    def test_per_repo_overrides(self):
+        rules = {
+            "owner/*": {"skip": ["generated/*"], "max_changes": 50},
+            "owner/repo": {"review": ["vendor/our-lib/*"]},
+        }
+        with override_settings(PR_ANALYSIS_REPO_FILE_RULES=rules):
+            self.assertEqual(self.reason(_pr_file("generated/api.py")), "excluded")
+            self.assertEqual(self.reason(_pr_file("src/app.py", changes=51)), "too_large")
+            # Review globs win over the built-in rules and the size limit, but not over deletions
+            self.assertIsNone(self.reason(_pr_file("vendor/our-lib/util.py", changes=500)))
+            self.assertEqual(self.reason(_pr_file("vendor/our-lib/util.py", status="removed")), "deleted")
+            self.assertEqual(self.reason(_pr_file("vendor/other/util.py")), "vendored")
+            # Other repositories keep the defaults
+            other = "https://github.com/someone/else.git"
+            self.assertIsNone(self.reason(_pr_file("generated/api.py"), other))
+            self.assertEqual(self.reason(_pr_file("vendor/our-lib/util.py"), other), "vendored")
+
+    def test_filter_disabled(self):
+        with override_settings(PR_ANALYSIS_FILTER_ENABLED=False):
+            self.assertIsNone(self.reason(_pr_file("package-lock.json", status="removed")))
+
+
+WEBHOOK_SECRET = "webhook-secret"
+
+
+def _signature(body, secret=WEBHOOK_SECRET):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+@override_settings(GITHUB_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class VerifySignatureTests(SimpleTestCase):
+    def test_valid_signature(self):
+        self.assertTrue(verify_signature(b'{"a": 1}', _signature(b'{"a": 1}')))
+
+    def test_wrong_signature(self):
+        self.assertFalse(verify_signature(b'{"a": 1}', _signature(b'{"a": 2}')))
+        self.assertFalse(verify_signature(b'{"a": 1}', _signature(b'{"a": 1}', "other-secret")))
+        self.assertFalse(verify_signature(b'{"a": 1}', _signature(b'{"a": 1}').replace("sha256=", "sha1=")))
+
+    def test_missing_signature(self):
+        self.assertFalse(verify_signature(b'{"a": 1}', None))
+        self.assertFalse(verify_signature(b'{"a": 1}', ""))
+
+    def test_no_secret_configured(self):
+        with override_settings(GITHUB_WEBHOOK_SECRET=""):
+            self.assertFalse(verify_signature(b"", "sha256=" + hmac.new(b"", b"", hashlib.sha256).hexdigest()))
+
+
+@override_settings(
+    GITHUB_WEBHOOK_SECRET=WEBHOOK_SECRET, GITHUB_WEBHOOK_ACTIONS=["opened", "synchronize", "reopened", "ready_for_review"],
+    GITHUB_WEBHOOK_DEBOUNCE_SECONDS=30, GITHUB_WEBHOOK_TERMINATE_SUPERSEDED=True, PR_ANALYSIS_SINGLE_FLIGHT_ENABLED=True,
+)
+class GitHubWebhookTests(SimpleTestCase):
+    REPO = "https://github.com/owner/repo"
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        for target in ("Home.utils.webhooks.get_redis", "Home.utils.single_flight.get_redis"):
+            patcher = mock.patch(target, return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The task is a lazy Celery proxy that mock cannot inspect, so the mocks are given explicitly
+        for name in ("analyze_repo_task", "record"):
+            patcher = mock.patch(f"Home.views.{name}", new=mock.MagicMock())
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def deliver(self, action, head_sha="a" * 40, event="pull_request", signature=None):
+        body = json.dumps({
+            "action": action,
+            "repository": {"html_url": self.REPO},
+            "pull_request": {"number": 7, "head": {"sha": head_sha}, "changed_files": 3, "additions": 40},
+        }).encode()
+        return self.client.post(
+            "/webhooks/github/", body, content_type="application/json",
+            HTTP_X_GITHUB_EVENT=event, HTTP_X_HUB_SIGNATURE_256=signature if signature is not None else _signature(body),
+        )
+
+    def test_bad_signature_is_refused(self):
+        response = self.deliver("opened", signature="sha256=" + "0" * 64)
+        self.assertEqual(response.status_code, 401)
+        response = self.deliver("opened", signature="")
+        self.assertEqual(response.status_code, 401)
+        self.analyze_repo_task.apply_async.assert_not_called()
+
+    def test_no_secret_refuses_everything(self):
+        with override_settings(GITHUB_WEBHOOK_SECRET=""):
+            self.assertEqual(self.deliver("opened").status_code, 503)
+        self.analyze_repo_task.apply_async.assert_not_called()
+
+    def test_ignored_events_and_actions(self):
+        self.assertEqual(self.deliver("opened", event="push").json()["outcome"], "ignored")
+        self.assertEqual(self.deliver("labeled").json()["outcome"], "ignored")
+        self.assertEqual(self.deliver("opened", event="ping").json()["outcome"], "ping")
+        self.analyze_repo_task.apply_async.assert_not_called()
+
+    def test_push_is_queued_after_the_debounce_window(self):
+        response = self.deliver("opened")
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body["outcome"], "queued")
+        (args, task_kwargs), options = self.analyze_repo_task.apply_async.call_args
+        self.assertEqual(args[:2], (self.REPO, 7))
+        self.assertTrue(task_kwargs["webhook"])
+        self.assertEqual((options["task_id"], options["countdown"]), (body["task_id"], 30))
+        self.record.assert_called_with(counters=[("pr_analysis_webhooks_total", 1, {"outcome": "queued"})])
+
+    def test_new_push_replaces_and_revokes_the_queued_analysis(self):
+        first = self.deliver("opened").json()["task_id"]
+        second = self.deliver("synchronize", head_sha="b" * 40).json()
+        self.assertEqual(second["revoked"], first)
+        self.analyze_repo_task.app.control.revoke.assert_called_once_with(first, terminate=True)
+        self.assertEqual(latest_analysis(self.REPO, 7), {"task_id": second["task_id"], "head_sha": "b" * 40})
+
+    def test_redelivery_of_the_same_head_coalesces(self):
+        first = self.deliver("opened").json()["task_id"]
+        again = self.deliver("reopened").json()
+        self.assertEqual((again["outcome"], again["task_id"]), ("coalesced", first))
+        self.assertEqual(self.analyze_repo_task.apply_async.call_count, 1)
+        self.analyze_repo_task.app.control.revoke.assert_not_called()
+
+    def test_closing_the_pr_revokes_its_analysis(self):
+        first = self.deliver("opened").json()["task_id"]
+        closed = self.deliver("closed").json()
+        self.assertEqual((closed["outcome"], closed["revoked"]), ("closed", first))
+        self.analyze_repo_task.app.control.revoke.assert_called_once_with(first, terminate=True)
+        self.assertTrue(is_superseded(self.REPO, 7, first))
+
+class AnalysisListingTests(TestCase):
+    def setUp(self):
+        same_time = timezone.now() - timedelta(hours=1)
+        for n in range(5):
+            analysis = PRAnalysisResult.objects.create(task_id=f"t{n}", repo_url="https://github.com/o/r", pr_number=n, analysis_result=[])
+            # t1, t2 and t3 share a timestamp; the id breaks the tie
+            created_at = same_time if n in (1, 2, 3) else same_time + timedelta(minutes=n - 2)
+            PRAnalysisResult.objects.filter(pk=analysis.pk).update(created_at=created_at)
+
+    def page(self, **params):
+        response = self.client.get("/api/get_all_analyses/", params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [row["task_id"] for row in body["results"]], body["next_cursor"]
+
+    def test_pages_cover_every_analysis_once_across_ties(self):
+        seen, cursor = [], None
+        for _ in range(5):
+            task_ids, cursor = self.page(limit=2, **({"cursor": cursor} if cursor else {}))
+            seen += task_ids
+            if cursor is None:
+                break
+        self.assertEqual(seen, ["t4", "t3", "t2", "t1", "t0"])
+
+    def test_last_page_has_no_cursor(self):
+        self.assertEqual(self.page(limit=5), (["t4", "t3", "t2", "t1", "t0"], None))
+        task_ids, cursor = self.page(limit=4)
+        self.assertIsNotNone(cursor)
+        self.assertEqual(self.page(limit=4, cursor=cursor), (["t0"], None))
+
+    def test_malformed_cursors_are_rejected(self):
+        encode = lambda text: base64.urlsafe_b64encode(text.encode()).decode()
+        for cursor in ("not base64!", encode("no separator"), encode("2026-01-01T00:00:00+00:00|x"),
+                       encode("yesterday|5"), encode("a|b|c"), base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+                       encode(f"{timezone.now().isoformat()}|{10 ** 30}"), encode("2026-01-01T00:00:00|5")):
+            response = self.client.get("/api/get_all_analyses/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+        self.assertEqual(self.client.get("/api/get_all_analyses/", {"limit": "many"}).status_code, 400)
+
+
+
+@override_settings(
+    PR_ANALYSIS_SMALL_QUEUE="pr_small", PR_ANALYSIS_LARGE_QUEUE="pr_large", PR_ANALYSIS_LARGE_PR_FILES=50,
+    PR_ANALYSIS_LARGE_PR_ADDITIONS=5000, PR_ANALYSIS_SPLIT_BATCH_FILES=40,
+)
+class RoutingTests(SimpleTestCase):
+    def route(self, changed_files=0, additions=0):
+        return route_analysis({"changed_files": changed_files, "additions": additions})
+
+    def test_small_prs_get_better_priorities_the_smaller_they_are(self):
+        self.assertEqual(self.route(2, 10), {"queue": "pr_small", "priority": 0, "split": False})
+        self.assertEqual(self.route(25, 10)["priority"], 5)
+        self.assertEqual(self.route(49, 10), {"queue": "pr_small", "priority": 9, "split": False})
+        # Additions count as much as files
+        self.assertEqual(self.route(1, 4999)["priority"], 9)
+
+    def test_large_pr_thresholds(self):
+        self.assertEqual(self.route(50, 10), {"queue": "pr_large", "priority": 0, "split": True})
+        self.assertEqual(self.route(10, 5000), {"queue": "pr_large", "priority": 0, "split": False})
+        self.assertEqual(self.route(150, 10)["priority"], 2)
+        self.assertEqual(self.route(5000, 10)["priority"], MAX_PRIORITY)
+
+    def test_large_prs_split_only_above_one_batch(self):
+        with override_settings(PR_ANALYSIS_LARGE_PR_FILES=30):
+            self.assertFalse(self.route(40, 10)["split"])
+            self.assertTrue(self.route(41, 10)["split"])
+
+    def test_unknown_size_is_routed_as_small(self):
+        expected = {"queue": "pr_small", "priority": 0, "split": False}
+        self.assertEqual(route_analysis(None), expected)
+        self.assertEqual(route_analysis({}), expected)
+        self.assertEqual(route_analysis({"changed_files": None, "additions": None}), expected)
+
+    def test_split_batches(self):
+        files = [{"filename": f"f{n}.py"} for n in range(95)]
+        batches = split_batches(files)
+        self.assertEqual([(start, len(batch)) for start, batch in batches], [(0, 40), (40, 40), (80, 15)])
+        self.assertEqual([file for _, batch in batches for file in batch], files)
+        self.assertEqual([start for start, _ in split_batches(files, 50)], [0, 50])
+        self.assertEqual(split_batches([], 10), [])
+        self.assertEqual(len(split_batches(files[:3], 0)), 1)
+
+
+class LLMCacheKeyTests(SimpleTestCase):
+    def test_same_blob_under_another_path_gets_its_own_key(self):
+        self.assertNotEqual(llm_cache_key("a" * 40, "a.py"), llm_cache_key("a" * 40, "tests/a.py"))
+        self.assertEqual(llm_cache_key("a" * 40, "a.py"), llm_cache_key("a" * 40, "a.py"))
+
+    def test_prompt_and_scope_are_part_of_the_key(self):
+        key = llm_cache_key("a" * 40, "a.py")
+        self.assertNotEqual(key, llm_cache_key("a" * 40, "a.py", HUNK_PROMPT_TEMPLATE))
+        self.assertNotEqual(key, llm_cache_key("a" * 40, "a.py", scope=":hunks:3:abc"))
+
+
+class NativeJsonMigrationTests(SimpleTestCase):
+    # The migration keeps its own frozen parser, so it is tested apart from Home.utils.llm_output
+    migration = importlib.import_module("Home.migrations.0007_native_json_analyses")
+
+    def test_legacy_text_answer_is_parsed(self):
+        answer = 'Here is my review:\n```json\n{"issues": [{"type": "Bug", "line": "12", "description": " Off by one ", "suggestion": null}]}\n```'
+        self.assertEqual(self.migration._coerce_analysis(answer), {
+            "issues": [{"type": "bugs", "description": "Off by one", "suggestion": "", "line": 12}],
+        })
+
+    def test_plain_json_text_and_dicts(self):
+        expected = {"issues": [{"type": "style", "description": "Long line", "suggestion": "Wrap it", "line": "3-4"}]}
+        issue = {"type": "formatting", "line": "3-4", "description": "Long line", "suggestion": "Wrap it"}
+        self.assertEqual(self.migration._coerce_analysis(json.dumps({"issues": [issue]})), expected)
+        self.assertEqual(self.migration._coerce_analysis({"issues": [issue]}), expected)
+
+    def test_unparseable_answers_are_kept_as_raw(self):
+        self.assertEqual(self.migration._coerce_analysis("Looks good to me."), {"issues": [], "raw": "Looks good to me."})
+        self.assertEqual(self.migration._coerce_analysis({"issues": "none"}), {"issues": [], "raw": '{"issues": "none"}'})
+        self.assertEqual(self.migration._coerce_analysis(None), {"issues": []})
+
+
+@override_settings(
+    RESILIENCE_BREAKER_THRESHOLD=3, RESILIENCE_BREAKER_COOLDOWN=30, RESILIENCE_MAX_RETRIES=3,
+    RESILIENCE_BACKOFF_BASE=1, RESILIENCE_BACKOFF_MAX=30,
+)
+class ResilienceTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.redis = FakeRedis()
+        self.get_redis = mock.Mock(return_value=self.redis)
+        for name, value in (
+            ("time", self.clock), ("get_redis", self.get_redis), ("_guards", {}),
+            ("_pending_stats", {}), ("_local_stats", {}), ("_last_flush", self.clock.now),
+        ):
+            patcher = mock.patch.object(resilience, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fail(self, guard, error):
+        guard.enter()
+        return guard.leave(error)
+
+    def test_breaker_opens_then_probes_and_closes(self):
+        guard = ProviderGuard("groq", 4)
+        transitions = [self.fail(guard, TransientHTTPError(503, "down")) for _ in range(3)]
+        self.assertEqual(transitions, [None, None, "opened"])
+        with self.assertRaises(CircuitOpenError):
+            guard.enter()
+        self.clock.sleep(30)
+        guard.enter()
+        self.assertEqual(guard.state, "half_open")
+        # One probe at a time
+        with self.assertRaises(CircuitOpenError):
+            guard.enter()
+        guard.leave()
+        self.assertEqual(guard.snapshot(), {"state": "closed", "limit": 4, "in_flight": 0, "consecutive_failures": 0})
+
+    def test_failed_probe_opens_the_breaker_again(self):
+        guard = ProviderGuard("groq", 4)
+        for _ in range(3):
+            self.fail(guard, TransientHTTPError(503, "down"))
+        self.clock.sleep(30)
+        self.assertEqual(self.fail(guard, TransientHTTPError(503, "still down")), "opened")
+        self.assertEqual(guard.state, "open")
+        self.clock.sleep(29)
+        with self.assertRaises(CircuitOpenError):
+            guard.enter()
+
+    def test_answers_that_are_not_the_providers_fault_do_not_count(self):
+        guard = ProviderGuard("groq", 4)
+        for _ in range(5):
+            self.assertIsNone(self.fail(guard, ValueError("bad prompt")))
+        self.assertEqual(guard.state, "closed")
+
+    def test_throttling_halves_the_limit_and_successes_grow_it_back(self):
+        guard = ProviderGuard("github", 8)
+        self.fail(guard, TransientHTTPError(429, "slow down"))
+        self.fail(guard, TransientHTTPError(429, "slow down"))
+        self.assertEqual((guard.limit, guard.state, guard.consecutive_failures), (2, "closed", 0))
+        guard.enter()
+        guard.enter()
+        with guard.condition:
+            self.assertFalse(guard._try_enter())
+        guard.leave()
+        guard.leave()
+        self.assertAlmostEqual(guard.limit, 2.9)
+        for _ in range(50):
+            guard.enter()
+            guard.leave()
+        self.assertEqual(guard.limit, 8)
+
+    def test_backoff_is_full_jitter_and_honors_retry_after(self):
+        with mock.patch("Home.utils.resilience.random.uniform", return_value=0.5) as uniform:
+            self.assertEqual(backoff_delay(2), 0.5)
+            uniform.assert_called_with(0, 4)
+            backoff_delay(10)
+            uniform.assert_called_with(0, 30)
+            self.assertEqual(backoff_delay(0, TransientHTTPError(503, "busy", retry_after=7)), 7)
+        response = mock.Mock(status_code=429, headers={"retry-after": "12"})
+        self.assertEqual(retry_after(mock.Mock(response=response)), 12)
+        response.headers = {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}
+        self.assertIsNone(retry_after(mock.Mock(response=response)))
+
+    def test_guarded_call_retries_after_the_providers_delay(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise TransientHTTPError(503, "busy", retry_after=4)
+            return "ok"
+
+        self.assertEqual(guarded_call("groq", flaky), "ok")
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertTrue(all(delay >= 4 for delay in self.clock.sleeps))
+        stats = get_resilience_stats()
+        self.assertEqual({key: stats["groq"][key] for key in ("calls", "retries", "failures", "gave_up")},
+                         {"calls": 3, "retries": 2, "failures": 2, "gave_up": 0})
+        self.assertEqual(stats["process"]["groq"]["state"], "closed")
+
+    def test_guarded_call_does_not_retry_real_answers(self):
+        def bad_request():
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            guarded_call("groq", bad_request)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_guarded_call_gives_up_after_the_last_retry(self):
+        def down():
+            raise TransientHTTPError(503, "down")
+
+        with override_settings(RESILIENCE_BREAKER_THRESHOLD=10), self.assertRaises(TransientHTTPError):
+            guarded_call("github", down)
+        self.assertEqual(len(self.clock.sleeps), 3)
+        stats = get_resilience_stats()["github"]
+        self.assertEqual((stats["calls"], stats["retries"], stats["gave_up"]), (4, 3, 1))
+
+    def test_open_breaker_rejects_the_retry(self):
+        def down():
+            raise TransientHTTPError(503, "down")
+
+        # The third failure opens the breaker; the backoff is shorter than the cooldown
+        with self.assertRaises(CircuitOpenError):
+            guarded_call("groq", down)
+        stats = get_resilience_stats()["groq"]
+        self.assertEqual((stats["calls"], stats["breaker_opened"], stats["rejected"]), (3, 1, 1))
+
+    def test_async_calls_retry_without_touching_redis_between_flushes(self):
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 2:
+                raise TransientHTTPError(503, "busy", retry_after=1)
+            return "ok"
+
+        with mock.patch("Home.utils.resilience.asyncio.sleep", new=mock.AsyncMock()) as sleep:
+            self.assertEqual(asyncio.run(guarded_call_async("groq", lambda: flaky())), "ok")
+        sleep.assert_awaited_once()
+        self.assertGreaterEqual(sleep.await_args.args[0], 1)
+        self.assertEqual(self.redis.data, {})
+        self.assertEqual(get_resilience_stats()["groq"]["calls"], 2)
+
+    def test_counters_are_written_in_one_pipeline_per_interval(self):
+        _bump("groq", "calls")
+        _bump("groq", "calls")
+        _bump("github", "retries")
+        self.assertEqual(self.redis.data, {})
+        self.clock.sleep(resilience.FLUSH_SECONDS)
+        _bump("groq", "calls")
+        self.assertEqual(self.redis.pipelines, 1)
+        self.assertEqual(self.redis.hgetall(resilience.STATS_KEY), {b"groq:calls": b"3", b"github:retries": b"1"})
+
+    def test_counters_stay_in_the_process_without_redis(self):
+        self.redis.pipeline = mock.Mock(side_effect=redis.ConnectionError("down"))
+        with mock.patch.object(resilience, "mark_redis_down") as mark_redis_down:
+            _bump("groq", "calls")
+            resilience.flush_stats()
+        mark_redis_down.assert_called_once_with()
+        self.get_redis.return_value = None
+        _bump("groq", "calls")
+        self.assertEqual(get_resilience_stats()["groq"]["calls"], 2)
+
+
+def use_project_celery_app(test):
+    # Home.task creates a Celery app of its own on import; tasks called in tests run under the project's
+    previous = celery.current_app._get_current_object()
+    celery_app.set_current()
+    test.addCleanup(previous.set_current)
+
+
+class ParkedFilesTests(TestCase):
+    REPO = "https://github.com/owner/repo"
+    HEAD = "a" * 40
+
+    def setUp(self):
+        use_project_celery_app(self)
+
+    def test_transient_failures_park_the_file(self):
+        item = {"file_name": "b.py", "line_map": None, "cache_key": None}
+        self.assertEqual(finish_file(item, [(None, CircuitOpenError("groq circuit open"))]),
+                         {"file_name": "b.py", "analysis": {"issues": []}, "parked": "groq circuit open"})
+        self.assertNotIn("parked", finish_file(item, [(None, ValueError("bad request"))]))
+        listed = [{"filename": name} for name in ("a.py", "b.py", "c.py")]
+        results = [{"file_name": "a.py", "sha": "1"}, parked_entry("b.py", "503"), {"file_name": "c.py"}]
+        self.assertEqual(parked_files(results, listed, first_index=40), [[41, {"filename": "b.py"}]])
+
+    @override_settings(PR_ANALYSIS_PARK_RETRY_DELAY=60, PR_ANALYSIS_PARK_MAX_RETRIES=3, PR_ANALYSIS_SMALL_QUEUE="pr_small")
+    def test_parked_files_are_retried_later_and_then_given_up(self):
+        parked = [[1, {"filename": "b.py"}]]
+        with mock.patch("Home.task.retry_parked_task", new=mock.MagicMock()) as retry:
+            task._schedule_parked("t", self.REPO, 7, None, self.HEAD, parked, None, attempt=2)
+            retry.apply_async.assert_called_once_with(
+                ("t", self.REPO, 7, None, self.HEAD, parked, None, 2), countdown=120, queue="pr_small")
+            task._schedule_parked("t", self.REPO, 7, None, self.HEAD, parked, None, attempt=4)
+            task._schedule_parked("t", self.REPO, 7, None, self.HEAD, [], None)
+            self.assertEqual(retry.apply_async.call_count, 1)
+
+    def retry(self, analyzed):
+        PRAnalysisResult.objects.create(
+            task_id="t", repo_url=self.REPO, pr_number=7, head_sha=self.HEAD,
+            analysis_result=[{"file_name": "a.py", "sha": "1", "analysis": {"issues": []}},
+                             parked_entry("b.py", "503"), parked_entry("c.py", "503")],
+        )
+        parked = [[1, {"filename": "b.py"}], [2, {"filename": "c.py"}]]
+        analyze = mock.Mock(return_value=analyzed)
+        with mock.patch("Home.task._engine", return_value=("sync", analyze)), \
+                mock.patch("Home.task.publish_file_result") as publish, \
+                mock.patch("Home.task._schedule_parked") as schedule:
+            outcome = task.retry_parked_task("t", self.REPO, 7, None, self.HEAD, parked)
+        analyze.assert_called_once_with(self.REPO, 7, None, None, review_mode=None,
+                                        files=[{"filename": "b.py"}, {"filename": "c.py"}], head_sha=self.HEAD)
+        return outcome, publish, schedule
+
+    def test_retry_parked_task_merges_recovered_files(self):
+        recovered = {"file_name": "b.py", "sha": "2", "analysis": {"issues": [
+            {"type": "bugs", "line": 3, "description": "Off by one", "suggestion": ""}]}}
+        outcome, publish, schedule = self.retry(
+            {"head_sha": self.HEAD, "result": [recovered, parked_entry("c.py", "503 again")], "token_usage": {}, "timings": {}})
+        self.assertEqual((outcome["files_recovered"], outcome["files_parked"]), (1, 1))
+        stored = PRAnalysisResult.objects.get(task_id="t").analysis_result
+        self.assertEqual([entry["file_name"] for entry in stored], ["a.py", "b.py", "c.py"])
+        self.assertEqual(stored[1], recovered)
+        self.assertIn("parked", stored[2])
+        publish.assert_called_once_with("t", 1, recovered)
+        schedule.assert_called_once_with("t", self.REPO, 7, None, self.HEAD, [[2, {"filename": "c.py"}]], None, 2)
+
+    def test_failed_retry_keeps_every_file_parked(self):
+        outcome, publish, schedule = self.retry({"head_sha": None, "result": []})
+        self.assertEqual((outcome["files_recovered"], outcome["files_parked"]), (0, 2))
+        self.assertTrue(all("parked" in entry for entry in PRAnalysisResult.objects.get(task_id="t").analysis_result[1:]))
+        publish.assert_not_called()
+        self.assertEqual(len(schedule.call_args.args[5]), 2)
+
+
+def _previous_entry(file_name, sha, **extra):
+    return dict({"file_name": file_name, "sha": sha, "analysis": {"issues": []}}, **extra)
+
+
+@override_settings(PR_ANALYSIS_FILTER_ENABLED=False, METRICS_ENABLED=False)
+class IncrementalAnalysisTests(SimpleTestCase):
+    REPO = "https://github.com/owner/repo"
+    LEGACY = '{"issues": [{"type": "bug", "line": "4", "description": "Unchecked None", "suggestion": "Guard it"}]}'
+
+    def test_previous_entries_by_name_keeps_entries_with_a_sha(self):
+        kept = _previous_entry("a.py", "1")
+        previous = [kept, {"file_name": "Error", "analysis": {"issues": []}}, "not an entry", {"file_name": "b.py", "sha": None}]
+        self.assertEqual(previous_entries_by_name(previous), {"a.py": kept})
+        self.assertEqual(previous_entries_by_name(None), {})
+
+    def test_unchanged_file_is_carried_forward_with_a_parsed_analysis(self):
+        previous = previous_entries_by_name([_previous_entry("a.py", "1", analysis=self.LEGACY)])
+        carried = carry_forward(previous, _pr_file("a.py", sha="1"))
+        self.assertTrue(carried["carried_forward"])
+        self.assertEqual(carried["analysis"], {"issues": [
+            {"type": "bugs", "line": 4, "description": "Unchecked None", "suggestion": "Guard it"}]})
+
+    def test_changed_renamed_and_skipped_files_are_not_carried_forward(self):
+        previous = previous_entries_by_name([
+            _previous_entry("a.py", "1"), _previous_entry("old.py", "2"),
+            _previous_entry("docs.md", "3", skipped="docs", analysis={"issues": []}),
+        ])
+        self.assertIsNone(carry_forward(previous, _pr_file("a.py", sha="9")))
+        # Entries are looked up by the current path: a renamed file is reviewed again under its new name
+        self.assertIsNone(carry_forward(previous, _pr_file("new.py", status="renamed", sha="2", previous_filename="old.py")))
+        self.assertIsNone(carry_forward(previous, _pr_file("docs.md", sha="3")))
+
+    def test_analyze_pr_only_prepares_files_that_changed(self):
+        previous = [_previous_entry("same.py", "1", analysis=self.LEGACY), _previous_entry("edited.py", "2"), _previous_entry("old.py", "3")]
+        files = [_pr_file("same.py", sha="1"), _pr_file("edited.py", sha="20"),
+                 _pr_file("new.py", status="renamed", sha="3", previous_filename="old.py")]
+
+        def prepare(repo_url, index, file, *args):
+            return {"index": index, "file_name": file["filename"], "sha": file["sha"],
+                    "result": {"file_name": file["filename"], "sha": file["sha"], "analysis": {"issues": []}}}
+
+        with mock.patch("Home.utils.github.open_mirror", return_value=contextlib.nullcontext()), \
+                mock.patch("Home.utils.github.prepare_file", side_effect=prepare) as prepare_file, \
+                mock.patch("Home.utils.github.publish_file_result") as publish:
+            outcome = analyze_pr(self.REPO, 7, task_id="t", previous_result=previous, files=files, head_sha="b" * 40)
+        self.assertEqual(sorted(call.args[2]["filename"] for call in prepare_file.call_args_list), ["edited.py", "new.py"])
+        self.assertEqual(outcome["carried_forward"], 1)
+        self.assertEqual([entry["file_name"] for entry in outcome["result"]], ["same.py", "edited.py", "new.py"])
+        self.assertTrue(outcome["result"][0]["carried_forward"])
+        self.assertEqual(outcome["result"][0]["analysis"]["issues"][0]["line"], 4)
+        self.assertNotIn("carried_forward", outcome["result"][1])
+        self.assertEqual(publish.call_count, 3)
+
+
+def _github_response(status_code, body=b"", **headers):
+    response = requests.Response()
+    response.status_code, response._content = status_code, body
+    response.reason = {200: "OK", 304: "Not Modified", 429: "Too Many Requests"}.get(status_code, "")
+    response.headers.update(headers)
+    return response
+
+
+@override_settings(
+    GITHUB_API_URL="https://api.github.com", GITHUB_ETAG_CACHE_ENABLED=True, GITHUB_ETAG_CACHE_MAX_BYTES=1024,
+    GITHUB_RATE_LIMIT_RESERVE=50, GITHUB_RATE_LIMIT_MAX_WAIT=300, GITHUB_RATE_LIMIT_RETRIES=2, GITHUB_INLINE_TIMEOUT=3,
+)
+class GitHubGetTests(SimpleTestCase):
+    URL = "https://api.github.com/repos/owner/repo/pulls/7"
+    HEADERS = {"Authorization": "token secret"}
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.clock = FakeClock()
+        self.session = mock.Mock()
+        for target, value in (
+            ("Home.utils.github_client.get_redis", mock.Mock(return_value=self.redis)),
+            ("Home.utils.github_client.time", self.clock),
+            ("Home.utils.github_client._token_bucket", None),
+            ("Home.utils.http_pool.get_github_session", mock.Mock(return_value=self.session)),
+            ("Home.utils.resilience.get_redis", mock.Mock(return_value=None)),
+            ("Home.utils.resilience._guards", {}),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stats(self):
+        return {key.decode(): float(value) for key, value in self.redis.hgetall(github_client.STATS_KEY).items()}
+
+    def test_not_modified_is_answered_from_the_etag_cache(self):
+        link = '<https://api.github.com/repos/owner/repo/pulls/7/files?page=2>; rel="next"'
+        self.session.get.side_effect = [
+            _github_response(200, b'{"number": 7}', ETag='"v1"', Link=link),
+            _github_response(304),
+        ]
+        self.assertEqual(github_get(self.URL, self.HEADERS).json(), {"number": 7})
+        cached = github_get(self.URL, self.HEADERS)
+        self.assertIsInstance(cached, CachedResponse)
+        self.assertEqual((cached.status_code, cached.json()), (200, {"number": 7}))
+        self.assertEqual(cached.links["next"]["url"], "https://api.github.com/repos/owner/repo/pulls/7/files?page=2")
+        self.assertEqual(self.session.get.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(self.stats(), {"not_modified": 1})
+        # The 304 is free against GitHub's quota, so its token goes back to the bucket
+        bucket = self.redis.hgetall(github_client.BUCKET_KEY_PREFIX + github_client._credentials_id(self.HEADERS))
+        self.assertEqual(float(bucket[b"tokens"]), 1)
+
+    def test_etag_cache_is_per_credentials(self):
+        self.session.get.side_effect = [_github_response(200, b"{}", ETag='"v1"'), _github_response(200, b"{}")]
+        github_get(self.URL, self.HEADERS)
+        github_get(self.URL, {"Authorization": "token other"})
+        self.assertNotIn("If-None-Match", self.session.get.call_args.kwargs["headers"])
+
+    def test_waits_for_a_token_from_the_shared_bucket(self):
+        self.redis.bucket_waits = [2.5, 1.5, 0]
+        self.session.get.return_value = _github_response(200, b"{}")
+        github_get(self.URL, self.HEADERS)
+        self.assertEqual(self.clock.sleeps, [2.5, 1.5])
+        self.assertEqual(self.stats(), {"throttled_seconds": 4})
+        self.assertEqual(self.redis.script_calls, 3)
+
+    def test_raw_downloads_take_no_token(self):
+        self.session.get.return_value = _github_response(200, b"print(1)")
+        github_get("https://raw.githubusercontent.com/owner/repo/abc/app.py", self.HEADERS)
+        self.assertEqual(self.redis.script_calls, 0)
+
+    def test_rate_limited_responses_are_retried_after_retry_after(self):
+        self.session.get.side_effect = [_github_response(429, **{"Retry-After": "7"}), _github_response(200, b"{}")]
+        self.assertEqual(github_get(self.URL, self.HEADERS).status_code, 200)
+        self.assertEqual(self.clock.sleeps, [7])
+        self.assertEqual(self.stats(), {"rate_limited": 1})
+
+    def test_without_waiting_a_throttled_call_fails_fast(self):
+        self.redis.bucket_waits = [2.5]
+        with self.assertRaises(GitHubRateLimitError):
+            github_get(self.URL, self.HEADERS, wait=False)
+        self.session.get.assert_not_called()
+        self.redis.hset(github_client.QUOTA_KEY_PREFIX + github_client._credentials_id(self.HEADERS),
+                        mapping={"remaining": 10, "reset": self.clock.now + 60})
+        with self.assertRaises(GitHubRateLimitError):
+            github_get(self.URL, self.HEADERS, wait=False)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_without_waiting_one_short_attempt_is_made(self):
+        self.session.get.return_value = _github_response(429, **{"Retry-After": "7"})
+        self.assertEqual(github_get(self.URL, self.HEADERS, wait=False).status_code, 429)
+        self.session.get.assert_called_once()
+        self.assertEqual(self.session.get.call_args.kwargs["timeout"], 3)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_bucket_script_follows_a_reconnected_client(self):
+        self.session.get.return_value = _github_response(200, b"{}")
+        github_get(self.URL, self.HEADERS)
+        reconnected = FakeRedis()
+        with mock.patch("Home.utils.github_client.get_redis", return_value=reconnected):
+            github_get(self.URL, self.HEADERS)
+        self.assertEqual((self.redis.script_calls, reconnected.script_calls), (1, 1))
+
+
+def _file_entry(file_name, *issues):
+    return {"file_name": file_name, "sha": "1", "analysis": {"issues": [
+        {"type": issue_type, "line": line, "description": f"{issue_type} at {line}", "suggestion": ""} for issue_type, line in issues
+    ]}}
+
+
+class IssueStatisticsTests(TestCase):
+    REPO = "https://github.com/owner/repo"
+
+    def save(self, *entries, task_id="t"):
+        return save_analysis_result(task_id, {"repo_url": self.REPO, "pr_number": 7, "analysis_result": list(entries)})
+
+    def day(self):
+        row = IssueStatistic.objects.get(repo_url=self.REPO)
+        return {field: getattr(row, field) for field in ("analyses", "total_issues", "style", "bugs", "performance", "best_practice")}
+
+    def test_saving_a_result_again_replaces_its_counts_and_issues(self):
+        _, created = self.save(_file_entry("a.py", ("bugs", 3), ("style", "7-9")), _file_entry("b.py", ("bugs", 1)))
+        self.assertTrue(created)
+        self.assertEqual(self.day(), {"analyses": 1, "total_issues": 3, "style": 1, "bugs": 2, "performance": 0, "best_practice": 0})
+
+        _, created = self.save(_file_entry("a.py", ("performance", 12)), _file_entry("b.py"))
+        self.assertFalse(created)
+        self.assertEqual(self.day(), {"analyses": 1, "total_issues": 1, "style": 0, "bugs": 0, "performance": 1, "best_practice": 0})
+        self.assertEqual(list(Issue.objects.values_list("file_path", "type", "line")), [("a.py", "performance", 12)])
+
+    def test_other_analyses_of_the_day_are_kept(self):
+        self.save(_file_entry("a.py", ("bugs", 3)), task_id="first")
+        self.save(_file_entry("a.py", ("style", 1)), task_id="second")
+        self.save(_file_entry("a.py"), task_id="second")
+        self.assertEqual(self.day(), {"analyses": 2, "total_issues": 1, "style": 0, "bugs": 1, "performance": 0, "best_practice": 0})
+        self.assertEqual(list(Issue.objects.values_list("analysis__task_id", "type")), [("first", "bugs")])
+
+    def test_statistics_view_filters_by_day(self):
+        self.save(_file_entry("a.py", ("bugs", 3)))
+        today = timezone.localdate().isoformat()
+        self.assertEqual(self.client.get("/api/statistics/", {"since": today}).json()["total_issues_found"], 1)
+        self.assertEqual(self.client.get("/api/statistics/", {"until": "2000-01-01"}).json()["total_issues_found"], 0)
+
+    def test_malformed_dates_are_rejected(self):
+        for url in ("/api/statistics/", "/api/issues/"):
+            for params in ({"since": "abc"}, {"until": "2026-13-01"}, {"since": "2026-02-30"}, {"until": "yesterday"}):
+                self.assertEqual(self.client.get(url, params).status_code, 400, (url, params))
+            self.assertEqual(self.client.get(url, {"since": ""}).status_code, 200)
+
+
+@override_settings(
+    BATCH_MAX_CONCURRENCY=2, BATCH_SLOT_LEASE=60, BATCH_SLOT_RETRY_SECONDS=30, BATCH_STARTS_PER_MINUTE=60,
+    BATCH_MAX_WAIT=3600, BATCH_MAX_PRS=4, PR_ANALYSIS_SINGLE_FLIGHT_ENABLED=False, PR_ANALYSIS_SMALL_QUEUE="pr_small",
+)
+class BatchTests(TestCase):
+    REPO = "https://github.com/owner/repo"
+
+    def setUp(self):
+        use_project_celery_app(self)
+        self.redis = FakeRedis()
+        for target, value in (
+            ("Home.utils.batches.get_redis", mock.Mock(return_value=self.redis)),
+            ("Home.utils.batches._acquire_slot", None),
+            ("Home.utils.batches._start_bucket", None),
+            ("Home.utils.batches._renew_slot", None),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.batch = PRAnalysisBatch.objects.create(batch_id="b", status="RUNNING")
+
+    def item(self, pr_number, status="QUEUED"):
+        return PRAnalysisBatchItem.objects.create(batch=self.batch, repo_url=self.REPO, pr_number=pr_number, status=status)
+
+    def slots(self):
+        return self.redis.data.get(SLOTS_KEY, {})
+
+    def test_expand_batch_task_lists_open_prs_within_the_batch_limit(self):
+        other = "https://github.com/owner/other"
+        self.batch.status = "LISTING"
+        self.batch.save()
+        self.item(1)
+        open_prs = {self.REPO: [1, 2], other: [5, 6, 7], "https://github.com/owner/gone": RuntimeError("404 Not Found")}
+
+        def fetch_open_pr_numbers(repo_url, github_token):
+            if isinstance(open_prs[repo_url], Exception):
+                raise open_prs[repo_url]
+            return open_prs[repo_url]
+
+        with mock.patch("Home.task.fetch_open_pr_numbers", side_effect=fetch_open_pr_numbers), \
+                mock.patch("Home.task.group") as group:
+            outcome = task.expand_batch_task("b", list(open_prs), "token")
+        self.assertEqual(outcome, {"batch_id": "b", "prs": 4, "repo_errors": 2})
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "RUNNING")
+        self.assertEqual([error["repo_url"] for error in self.batch.errors], [other, "https://github.com/owner/gone"])
+        # PR 1 was listed twice but is analyzed once; the limit of four PRs leaves out PR 7
+        self.assertEqual(sorted(self.batch.items.values_list("pr_number", flat=True)), [1, 2, 5, 6])
+        signatures = list(group.call_args.args[0])
+        self.assertEqual([signature.args[0] for signature in signatures], list(self.batch.items.order_by("id").values_list("id", flat=True)))
+        self.assertEqual({(signature.options["queue"], signature.options["priority"]) for signature in signatures}, {("pr_small", MAX_PRIORITY)})
+        group.return_value.apply_async.assert_called_once_with()
+
+    def test_expand_batch_task_closes_a_batch_with_nothing_to_analyze(self):
+        with mock.patch("Home.task.fetch_open_pr_numbers", return_value=[]), mock.patch("Home.task.group") as group:
+            self.assertEqual(task.expand_batch_task("b", [self.REPO])["prs"], 0)
+        group.assert_not_called()
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "DONE")
+
+    def test_slots_are_limited_and_leases_expire(self):
+        self.assertEqual([acquire_budget(item_id) for item_id in (1, 2, 3)], [0, 0, 30])
+        # Asking again with a slot already held is fine
+        self.assertEqual(acquire_budget(1), 0)
+        self.redis.now += 61
+        self.assertEqual(acquire_budget(3), 0)
+        self.assertEqual(set(self.slots()), {"3"})
+
+    def test_renewing_keeps_a_running_item_from_expiring(self):
+        acquire_budget(1)
+        self.redis.now += 50
+        self.assertTrue(renew_slot(1))
+        self.redis.now += 50
+        self.assertEqual(acquire_budget(2), 0)
+        self.assertEqual(acquire_budget(3), 30)
+        self.assertEqual(set(self.slots()), {"1", "2"})
+        # A lease that already expired is not brought back
+        self.redis.now += 100
+        acquire_budget(4)
+        self.assertFalse(renew_slot(1))
+        self.assertNotIn("1", self.slots())
+
+    def test_holding_slot_renews_until_the_block_ends(self):
+        acquire_budget(1)
+        with override_settings(BATCH_SLOT_LEASE=0.03), holding_slot(1):
+            time.sleep(0.1)
+        calls = self.redis.script_calls
+        self.assertGreaterEqual(calls, 1 + 3)  # acquire, then the first renewal and the periodic ones
+        time.sleep(0.05)
+        self.assertEqual(self.redis.script_calls, calls)
+        with holding_slot(None):
+            pass
+        self.assertEqual(self.redis.script_calls, calls)
+
+    def test_finish_item_frees_the_slot_and_closes_the_batch(self):
+        first, second = self.item(1, "RUNNING"), self.item(2, "RUNNING")
+        acquire_budget(first.id)
+        finish_item(first.id, "SAVED", "task-1")
+        self.assertNotIn(str(first.id), self.slots())
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "RUNNING")
+        finish_item(second.id, "ERROR", error="x" * 3000)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "DONE")
+        self.assertIsNotNone(self.batch.finished_at)
+        second.refresh_from_db()
+        self.assertEqual(len(second.error), 2000)
+
+    def test_batch_progress(self):
+        self.item(1, "SAVED")
+        self.item(2, "RUNNING")
+        self.item(3)
+        self.item(4, "ERROR")
+        progress = batch_progress(self.batch, with_items=True)
+        self.assertEqual((progress["total"], progress["finished"]), (4, 2))
+        self.assertEqual(progress["counts"], {"QUEUED": 1, "RUNNING": 1, "SAVED": 1, "COALESCED": 0, "ERROR": 1})
+        self.assertEqual([item["pr_number"] for item in progress["items"]], [1, 2, 3, 4])
+        self.assertNotIn("items", batch_progress(self.batch))
+
+    def test_batch_pr_starts_its_analysis_once_it_has_a_slot(self):
+        item = self.item(7)
+        with mock.patch("Home.task.fetch_pr_details", return_value={"head": {"sha": "a" * 40}, "changed_files": 2, "additions": 10}), \
+                mock.patch("Home.task.analyze_repo_task", new=mock.MagicMock()) as analyze:
+            outcome = task.analyze_batch_pr_task(item.id)
+        self.assertEqual(outcome["status"], "RUNNING")
+        (args, task_kwargs), options = analyze.apply_async.call_args
+        self.assertEqual(args[:2], (self.REPO, 7))
+        self.assertEqual(task_kwargs["batch_item_id"], item.id)
+        self.assertEqual(options["task_id"], outcome["task_id"])
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.task_id), ("RUNNING", outcome["task_id"]))
+
+    def test_batch_pr_without_a_slot_asks_again_until_its_deadline(self):
+        acquire_budget("other-1")
+        acquire_budget("other-2")
+        item = self.item(7)
+        with self.assertRaises(Retry):
+            task.analyze_batch_pr_task(item.id)
+        PRAnalysisBatchItem.objects.filter(id=item.id).update(updated_at=timezone.now() - timedelta(seconds=3590))
+        outcome = task.analyze_batch_pr_task(item.id)
+        self.assertEqual(outcome["status"], "ERROR")
+        item.refresh_from_db()
+        self.assertEqual(item.status, "ERROR")
+        self.assertIn("BATCH_MAX_WAIT", item.error)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "DONE")
+
+
+def _unit(kind, *file_names):
+    items = [{"index": index, "file_name": name, "llm_input": f"# {name}\nvalue = 1", "prompt_template": PROMPT_TEMPLATE, "line_map": None}
+             for index, name in enumerate(file_names)]
+    return {"kind": kind, "items": items}
+
+
+@override_settings(
+    LLM_TIERING_ENABLED=True, LLM_TRIAGE_MODEL="small-model", LLM_MODEL="big-model", LLM_ESCALATE_RISK="medium", LLM_ESCALATE_COMPLEXITY=6,
+)
+class TieringTests(SimpleTestCase):
+    # Triage ratings the small model gives each file: (risk, complexity)
+    RATINGS = {"docs.py": ("low", 2), "auth.py": ("high", 3), "parser.py": ("low", 8)}
+
+    def setUp(self):
+        self.prompts = []
+        self.triage_error = None
+        patcher = mock.patch("Home.utils.github.complete_json", side_effect=self.complete_json)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def complete_json(self, prompt, parse, structure=None, model=None):
+        names = [name for name in self.RATINGS if name in prompt]
+        self.prompts.append((model, names))
+        if model == "small-model" and self.triage_error is not None:
+            raise self.triage_error
+        files = [{"file_name": name, "issues": [{"type": "bugs", "line": 1, "description": f"{model} on {name}", "suggestion": ""}]}
+                 for name in names]
+        if model == "small-model":
+            for entry in files:
+                entry["risk"], entry["complexity"] = self.RATINGS[entry["file_name"]]
+        answer = {"files": files} if structure == BATCH_STRUCTURE else files[0]
+        value, _ = parse(json.dumps(answer))
+        return value, {"requests": 1, "prompt_tokens": 100, "completion_tokens": 10, "seconds": 0.1}
+
+    def answers_by_name(self, unit, answers):
+        names = {item["index"]: item["file_name"] for item in unit["items"]}
+        return {names[index]: (analysis, error) for index, analysis, error in answers}
+
+    def test_should_escalate(self):
+        self.assertFalse(should_escalate({"risk": "low", "complexity": 5}))
+        self.assertTrue(should_escalate({"risk": "medium", "complexity": 1}))
+        self.assertTrue(should_escalate({"risk": "low", "complexity": 6}))
+        self.assertTrue(should_escalate({"risk": None, "complexity": 7}))
+        self.assertFalse(should_escalate({"risk": "low", "complexity": None}))
+        # Unrated code is never left to the triage model
+        self.assertTrue(should_escalate({"risk": None, "complexity": None}))
+
+    def test_low_risk_files_keep_the_triage_review_and_risky_ones_are_escalated(self):
+        unit = _unit("batch", "docs.py", "auth.py", "parser.py")
+        answers, usage = run_llm_unit(unit)
+        by_name = self.answers_by_name(unit, answers)
+        self.assertEqual(self.prompts, [("small-model", ["docs.py", "auth.py", "parser.py"]), ("big-model", ["auth.py", "parser.py"])])
+        docs, _ = by_name["docs.py"]
+        self.assertEqual(docs["issues"][0]["description"], "small-model on docs.py")
+        self.assertEqual(docs["triage"], {"risk": "low", "complexity": 2, "escalated": False})
+        for name in ("auth.py", "parser.py"):
+            analysis, error = by_name[name]
+            self.assertIsNone(error)
+            self.assertEqual(analysis["issues"][0]["description"], f"big-model on {name}")
+            risk, complexity = self.RATINGS[name]
+            self.assertEqual(analysis["triage"], {"risk": risk, "complexity": complexity, "escalated": True})
+        self.assertEqual({tier: tier_usage["requests"] for tier, tier_usage in usage["tiers"].items()}, {"triage": 1, "review": 1})
+        self.assertEqual(usage["tiers"]["triage"]["model"], "small-model")
+
+    def test_single_low_risk_file_makes_one_request(self):
+        answers, usage = run_llm_unit(_unit("single", "docs.py"))
+        self.assertEqual(self.prompts, [("small-model", ["docs.py"])])
+        self.assertFalse(answers[0][1]["triage"]["escalated"])
+        self.assertEqual(usage["requests"], 1)
+
+    def test_failed_triage_escalates_every_file(self):
+        self.triage_error = TransientHTTPError(503, "triage model down")
+        unit = _unit("batch", "docs.py", "auth.py")
+        answers, usage = run_llm_unit(unit)
+        self.assertEqual(self.prompts[-1], ("big-model", ["docs.py", "auth.py"]))
+        for name, (analysis, error) in self.answers_by_name(unit, answers).items():
+            self.assertIsNone(error)
+            self.assertEqual(analysis["issues"][0]["description"], f"big-model on {name}")
+            self.assertEqual(analysis["triage"], {"risk": None, "complexity": None, "escalated": True})
+        self.assertEqual(list(usage["tiers"]), ["review"])
+
+    def test_split_triaged_escalates_items_without_a_usable_answer(self):
+        items = _unit("batch", "docs.py", "auth.py", "parser.py")["items"]
+        rated = {"issues": [], "triage": {"risk": "low", "complexity": 1}}
+        kept, escalate, ratings = split_triaged(items, [(0, rated, None), (1, None, ValueError("unusable"))])
+        self.assertEqual(kept, [(0, {"issues": [], "triage": {"risk": "low", "complexity": 1, "escalated": False}}, None)])
+        self.assertEqual([item["file_name"] for item in escalate], ["auth.py", "parser.py"])
+        self.assertEqual(ratings, {0: {"risk": "low", "complexity": 1}})
+        # Errors pass through mark_escalated untouched; kept answers keep their rating
+        error = ValueError("review failed")
+        marked = mark_escalated(kept + [(1, {"issues": []}, None), (2, None, error)], ratings)
+        self.assertEqual(marked[0], kept[0])
+        self.assertEqual(marked[1][1]["triage"], {"risk": None, "complexity": None, "escalated": True})
+        self.assertEqual(marked[2], (2, None, error))
+
+
+def _source(file_name, functions):
+    body = [f"# {file_name}"]
+    for number in range(functions):
+        body += [f"def func_{number}(value):", f"    value = value * {number} + 1", "    return value", ""]
+    return "\n".join(body)
+
+
+def _completion(answer):
+    return {
+        "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(answer)}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110},
+    }
+
+
+@override_settings(
+    PR_ANALYSIS_FILTER_ENABLED=False, PR_ANALYSIS_REVIEW_MODE="full", PR_ANALYSIS_MAX_PROMPT_TOKENS=1200,
+    PR_ANALYSIS_BATCH_MAX_TOKENS=1000, PR_ANALYSIS_BATCH_MAX_FILES=8, LLM_TIERING_ENABLED=False, LLM_CACHE_ENABLED=False,
+    GIT_MIRROR_ENABLED=False, METRICS_ENABLED=False,
+)
+class AsyncEngineTests(SimpleTestCase):
+    """analyze_pr_async against httpx and Groq clients whose transports answer in-process"""
+    REPO = "https://github.com/owner/repo"
+    HEAD = "c" * 40
+    SOURCES = {"a.py": _source("a.py", 3), "b.py": _source("b.py", 4), "big.py": _source("big.py", 200)}
+
+    def setUp(self):
+        self.answered = []  # part number of every chunk answer, in the order they were sent
+        self.download_started = threading.Event()
+        self.downloads_cancelled = []
+        self.block_downloads = False
+
+    def files(self):
+        return [_pr_file(name, sha=f"sha-{name}", raw_url=f"https://raw.example/{self.HEAD}/{name}") for name in self.SOURCES]
+
+    def answer(self, request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        names = re.findall(r"^=== File: (\S+)$", prompt, re.M)
+        if names:
+            return None, {"files": [{"file_name": name, "issues": [
+                {"type": "style", "line": 1, "description": f"Batch note on {name}", "suggestion": ""}]} for name in names]}
+        name = re.search(r"File : (\S+)", prompt).group(1)
+        part = re.search(r"Part (\d+) of (\d+)", prompt)
+        part, parts = (int(part.group(1)), int(part.group(2))) if part else (1, 1)
+        return (part, parts), {"issues": [{"type": "bugs", "line": part, "description": f"{name} part {part}", "suggestion": ""}]}
+
+    def groq_sync(self, request):
+        return httpx.Response(200, json=_completion(self.answer(request)[1]))
+
+    async def groq_async(self, request):
+        part, answer = self.answer(request)
+        if part is not None:
+            # Later parts answer first, so the engine must put the chunks back in order
+            await asyncio.sleep(0.02 * (part[1] - part[0]))
+            if part[1] > 1:
+                self.answered.append(part[0])
+        return httpx.Response(200, json=_completion(answer))
+
+    async def raw_file(self, request):
+        self.download_started.set()
+        if self.block_downloads:
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                self.downloads_cancelled.append(request.url.path)
+                raise
+        return httpx.Response(200, text=self.SOURCES[request.url.path.rsplit("/", 1)[1]])
+
+    def async_clients(self):
+        stack = contextlib.ExitStack()
+        stack.enter_context(mock.patch("Home.utils.async_engine.new_async_github_client",
+                                       side_effect=lambda *args: httpx.AsyncClient(transport=httpx.MockTransport(self.raw_file))))
+        stack.enter_context(mock.patch("Home.utils.async_engine.new_async_groq_client", side_effect=lambda *args: groq.AsyncGroq(
+            api_key="x", http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.groq_async)), max_retries=0)))
+        stack.enter_context(mock.patch("Home.utils.async_engine.publish_file_result"))
+        return stack
+
+    def run_async(self, **kwargs):
+        with self.async_clients():
+            return analyze_pr_with_asyncio(self.REPO, 7, task_id="t", max_concurrency=8, head_sha=self.HEAD, **kwargs)
+
+    def run_sync(self):
+        client = groq.Groq(api_key="x", http_client=httpx.Client(transport=httpx.MockTransport(self.groq_sync)), max_retries=0)
+        with mock.patch("Home.utils.ai_agent.get_groq_client", return_value=client), \
+                mock.patch("Home.utils.github.fetch_file_content_from_raw_url", side_effect=lambda url, token=None: self.SOURCES[url.rsplit("/", 1)[1]]), \
+                mock.patch("Home.utils.github.publish_file_result"):
+            return analyze_pr(self.REPO, 7, task_id="t", max_concurrency=8, files=self.files(), head_sha=self.HEAD)
+
+    def test_async_engine_returns_the_same_result_as_analyze_pr(self):
+        expected = self.run_sync()
+        outcome = self.run_async(files=self.files())
+        self.assertEqual(set(outcome), set(expected))
+        self.assertEqual(outcome["connection_stats"]["engine"], "async")
+        self.assertEqual(outcome["result"], expected["result"])
+        self.assertEqual(outcome["parked_files"], [])
+        for key in ("requests", "batched_files", "chunked_files", "planned_prompt_tokens"):
+            self.assertEqual(outcome["token_usage"][key], expected["token_usage"][key], key)
+        self.assertEqual([entry["file_name"] for entry in outcome["result"]], ["a.py", "b.py", "big.py"])
+        self.assertEqual(outcome["token_usage"]["batched_files"], 2)
+
+    def test_chunk_answers_are_merged_in_part_order(self):
+        outcome = self.run_async(files=self.files())
+        parts = len(self.answered)
+        self.assertGreater(parts, 2)
+        self.assertEqual(self.answered, list(range(parts, 0, -1)))
+        big = outcome["result"][2]
+        self.assertEqual([issue["description"] for issue in big["analysis"]["issues"]],
+                         [f"big.py part {part}" for part in range(1, parts + 1)])
+
+    def test_failed_listing_cancels_the_pages_already_started(self):
+        self.block_downloads = True
+        self.SOURCES = {"a.py": _source("a.py", 3)}
+
+        def pages(*args):
+            yield self.files()
+            # The second page fails while the first page's download is still running
+            self.download_started.wait(5)
+            raise TransientHTTPError(502, "listing failed")
+
+        async def analyze():
+            outcome = await analyze_pr_async(self.REPO, 7, task_id="t", head_sha=self.HEAD)
+            # Give cancelled tasks a turn; anything still running now would only be stopped by asyncio.run
+            await asyncio.sleep(0.05)
+            return outcome, list(self.downloads_cancelled)
+
+        with self.async_clients(), mock.patch("Home.utils.async_engine.iter_pr_file_pages", side_effect=pages):
+            outcome, cancelled = asyncio.run(analyze())
+        self.assertEqual(outcome["result"][0]["file_name"], "Error")
+        self.assertIn("listing failed", outcome["result"][0]["analysis"]["issues"][0]["description"])
+        self.assertEqual(cancelled, [f"/{self.HEAD}/a.py"])
+        self.assertEqual(self.answered, [])
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_BUCKETS=[0.1, 1, 10])
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        for patcher in (mock.patch("Home.utils.metrics.get_redis", side_effect=lambda: self.redis),
+                        mock.patch.dict(metrics._local_values, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def record_run(self):
+        metrics.record(
+            observations=[("llm", 0.05), ("llm", 0.5), ("llm", 0.5), ("llm", 50), ("fetch", None)],
+            counters=[("pr_analysis_files_total", 3, {"outcome": "analyzed"}), ("pr_analysis_files_total", 0, {"outcome": "failed"}),
+                      ("pr_analysis_webhooks_total", 1, {"outcome": 'bad "sig"\\\nnext'})],
+        )
+
+    def test_histogram_buckets_are_cumulative_and_end_with_inf(self):
+        self.record_run()
+        self.record_run()
+        lines = metrics.render_metrics().splitlines()
+        self.assertEqual([line for line in lines if line.startswith("pr_analysis_stage_seconds")], [
+            'pr_analysis_stage_seconds_bucket{stage="llm",le="0.1"} 2',
+            'pr_analysis_stage_seconds_bucket{stage="llm",le="1.0"} 6',
+            'pr_analysis_stage_seconds_bucket{stage="llm",le="10.0"} 6',
+            'pr_analysis_stage_seconds_bucket{stage="llm",le="+Inf"} 8',
+            'pr_analysis_stage_seconds_sum{stage="llm"} 102.1',
+            'pr_analysis_stage_seconds_count{stage="llm"} 8',
+        ])
+        self.assertIn("# TYPE pr_analysis_stage_seconds histogram", lines)
+        # Every metric is declared even before it has a value, in METRICS order
+        self.assertEqual([line.split()[2] for line in lines if line.startswith("# TYPE")], list(metrics.METRICS))
+
+    def test_label_values_are_escaped(self):
+        self.record_run()
+        lines = metrics.render_metrics([("pr_analysis_provider_events_total", 4, {"provider": "groq", "event": "retries"})]).splitlines()
+        self.assertIn('pr_analysis_files_total{outcome="analyzed"} 3', lines)
+        self.assertNotIn('pr_analysis_files_total{outcome="failed"} 0', lines)
+        self.assertIn('pr_analysis_webhooks_total{outcome="bad \\"sig\\"\\\\\\nnext"} 1', lines)
+        self.assertIn('pr_analysis_provider_events_total{event="retries",provider="groq"} 4', lines)
+
+    def test_values_stay_in_the_process_without_redis(self):
+        self.redis = None
+        self.record_run()
+        self.assertIn('pr_analysis_stage_seconds_count{stage="llm"} 4', metrics.render_metrics().splitlines())
+
+    def test_metrics_view_serves_the_text_format(self):
+        self.record_run()
+        stats = {provider: {"calls": 2, "retries": 1} for provider in ("groq", "github")}
+        with mock.patch("Home.views.get_resilience_stats", return_value=stats):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        body = response.content.decode()
+        self.assertTrue(body.endswith("\n"))
+        self.assertIn('pr_analysis_stage_seconds_bucket{stage="llm",le="+Inf"} 4\n', body)
+        self.assertIn('pr_analysis_provider_events_total{event="retries",provider="github"} 1\n', body)
+
+
+def _run_git(*args, cwd=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@example.com", GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@example.com")
+    return subprocess.run(["git", *args], cwd=cwd, env=env, capture_output=True, check=True, text=True).stdout.strip()
+
+
+class GitMirrorTests(SimpleTestCase):
+    """PRMirror against a bare repository in a temp dir standing in for GitHub (file:// remote)"""
+    REPO = "https://github.com/owner/repo"
+    CONTENT = "def main():\n    return 1\n"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        work = os.path.join(cls.tmp, "work")
+        _run_git("init", "--quiet", work)
+        with open(os.path.join(work, "a.py"), "w") as handle:
+            handle.write(cls.CONTENT)
+        _run_git("add", "a.py", cwd=work)
+        _run_git("commit", "--quiet", "-m", "Add a.py", cwd=work)
+        cls.head = _run_git("rev-parse", "HEAD", cwd=work)
+        cls.blob = _run_git("rev-parse", "HEAD:a.py", cwd=work)
+        remote = os.path.join(cls.tmp, "remote", "owner", "repo.git")
+        _run_git("init", "--quiet", "--bare", remote)
+        _run_git("push", "--quiet", remote, "HEAD:refs/pull/7/head", cwd=work)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.mirrors = tempfile.mkdtemp(dir=self.tmp)
+        overrides = override_settings(GIT_MIRROR_DIR=self.mirrors, GITHUB_GIT_URL="file://" + os.path.join(self.tmp, "remote"),
+                                     GIT_MIRROR_FETCH_DEPTH=1, GIT_MIRROR_MAX_BYTES=10 * 1024 ** 2, METRICS_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def mirror(self, pr_number=7):
+        mirror = PRMirror("owner", "repo", pr_number, self.head)
+        self.addCleanup(mirror.close)
+        return mirror
+
+    def test_reads_files_by_blob_sha(self):
+        mirror = self.mirror()
+        self.assertEqual(mirror.read_file({"filename": "a.py", "sha": self.blob}), self.CONTENT)
+        # A missing object is a download, not a broken mirror
+        self.assertIsNone(mirror.read_file({"filename": "b.py", "sha": "f" * 40}))
+        self.assertEqual(mirror.read_file({"filename": "a.py", "sha": self.blob}), self.CONTENT)
+        self.assertIsNone(mirror.read_file({"filename": "c.py", "sha": "not a sha"}))
+        # A later analysis of the same head finds the commit already there
+        with mock.patch("Home.utils.git_mirror._count") as count:
+            self.assertEqual(self.mirror().read_file({"filename": "a.py", "sha": self.blob}), self.CONTENT)
+        count.assert_any_call("up_to_date")
+
+    def test_inactive_mirror_reads_nothing(self):
+        self.assertIsNone(PRMirror().read_file({"filename": "a.py", "sha": self.blob}))
+        with override_settings(GIT_MIRROR_ENABLED=True, GIT_MIRROR_MIN_FILES=20):
+            self.assertFalse(pr_mirror("owner", "repo", 7, self.head, file_count=19).active)
+            self.assertTrue(pr_mirror("owner", "repo", 7, self.head, file_count=20).active)
+
+    def test_missing_git_falls_back_to_downloads(self):
+        mirror = self.mirror()
+        with mock.patch.dict(os.environ, {"PATH": self.mirrors}):
+            self.assertIsNone(mirror.read_file({"filename": "a.py", "sha": self.blob}))
+        # The mirror gave up for this analysis: no second attempt per file
+        self.assertIsNone(mirror.read_file({"filename": "a.py", "sha": self.blob}))
+
+    def test_failed_fetch_falls_back_to_downloads(self):
+        mirror = self.mirror(pr_number=8)  # no refs/pull/8/head upstream
+        with mock.patch("Home.utils.git_mirror._git", wraps=git_mirror._git) as git:
+            self.assertIsNone(mirror.read_file({"filename": "a.py", "sha": self.blob}))
+            calls = git.call_count
+            self.assertIsNone(mirror.read_file({"filename": "a.py", "sha": self.blob}))
+        self.assertEqual(git.call_count, calls)
+        with mock.patch("Home.utils.github.fetch_file_content_from_raw_url", return_value="downloaded") as download:
+            self.assertEqual(_fetch_new_content(self.REPO, {"filename": "a.py", "sha": self.blob, "raw_url": "https://raw/a.py"}, None, mirror), "downloaded")
+        download.assert_called_once_with("https://raw/a.py", None)
+
+    def fake_mirror(self, name, size, age):
+        path = os.path.join(self.mirrors, name)
+        os.makedirs(path)
+        with open(os.path.join(path, "pack"), "wb") as handle:
+            handle.write(b"x" * size)
+        then = time.time() - age
+        os.utime(path, (then, then))
+        return path
+
+    def test_eviction_skips_kept_locked_and_recently_read_mirrors(self):
+        hour = 3600
+        oldest = self.fake_mirror("oldest.git", 1000, 4 * hour)
+        kept = self.fake_mirror("kept.git", 1000, 3 * hour)
+        locked = self.fake_mirror("locked.git", 1000, 2 * hour)
+        stale = self.fake_mirror("stale.git", 1000, hour)
+        in_use = self.fake_mirror("in_use.git", 1000, 10)
+        with override_settings(GIT_MIRROR_MAX_BYTES=2500), open(locked + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            evict_mirrors(keep=kept)
+        remaining = sorted(name for name in os.listdir(self.mirrors) if name.endswith(".git"))
+        # Least recently used first, until the rest fit: oldest and stale go, the others are skipped
+        self.assertEqual(remaining, ["in_use.git", "kept.git", "locked.git"])
+        self.assertFalse(os.path.exists(oldest) or os.path.exists(stale))
+
+    def test_eviction_is_left_to_the_worker_already_evicting(self):
+        self.fake_mirror("old.git", 1000, 3600)
+        with override_settings(GIT_MIRROR_MAX_BYTES=0), open(os.path.join(self.mirrors, git_mirror.EVICT_LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            evict_mirrors()
+        self.assertTrue(os.path.isdir(os.path.join(self.mirrors, "old.git")))
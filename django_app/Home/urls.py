@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import store_pr_analysis, get_pr_analysis, get_all_analyses, get_statistics
+from .views import store_pr_analysis, get_pr_analysis, get_all_analyses, get_statistics, get_cache_statistics, get_issues, get_llm_output_statistics, get_resilience_statistics
 from . import views
 urlpatterns = [
     path('store_pr_analysis/', views.store_pr_analysis, name='store_pr_analysis'),
     path('get_pr_analysis/<str:task_id>/', views.get_pr_analysis, name='get_pr_analysis'),
     path('get_all_analyses/', views.get_all_analyses, name='get_all_analyses'),
     path('statistics/', views.get_statistics, name='get_statistics'),
+    path('issues/', views.get_issues, name='get_issues'),
+    path('cache_statistics/', views.get_cache_statistics, name='get_cache_statistics'),
+    path('llm_output_statistics/', views.get_llm_output_statistics, name='get_llm_output_statistics'),
+    path('resilience_statistics/', views.get_resilience_statistics, name='get_resilience_statistics'),
 ]
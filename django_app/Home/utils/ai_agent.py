@@ -1,5 +1,16 @@
 import os
-from groq import Groq
+import time
+import asyncio
+import hashlib
+import threading
+import groq
+from groq import Groq, AsyncGroq
+from django.conf import settings
+from .llm_cache import make_cache_key
+from .http_pool import get_llm_http_client, new_async_llm_http_client
+from .llm_output import record_output_stats, LLMOutputError
+from .resilience import guarded_call, guarded_call_async
+from .metrics import record
 
 # Get API key from environment variable
 key = os.getenv("GROQ_API_KEY")
@@ -10,10 +21,15 @@ if not key:
         "Please set it in your .env file or environment variables."
     )
 
+_groq_client = None
+_groq_client_pid = None
+_groq_client_lock = threading.Lock()
 
+LLM_MODEL = settings.LLM_MODEL
+LLM_TEMPERATURE = 0.7  # Lower temperature for more consistent results
+LLM_TOP_P = 0.9
 
-def analyze_code_with_llm(file_content,file_name):
-    prompt=f"""
+PROMPT_TEMPLATE = """
        Analyze the Following Code
        - Code Style and Formatting issues
        - Potential Bugs and Errors
@@ -36,39 +52,300 @@ def analyze_code_with_llm(file_content,file_name):
        ]
     
     }}
-    ```json
     """
-    client=Groq(
-        api_key=key
-    )
-    try:
+
+# Used when only the changed hunks of a file are sent (review mode "hunks")
+HUNK_PROMPT_TEMPLATE = """
+       Analyze the following changes from a pull request
+       - Code Style and Formatting issues
+       - Potential Bugs and Errors
+       - Performance Improvement
+       - Best Practices
+
+    Only the changed hunks are shown, with some surrounding context. Lines marked "+" were added,
+    lines marked "-" were removed (and have no number), "..." separates hunks.
+    Report issues only for the shown code, and use the number at the start of each line as "line".
+
+    File : {file_name}
+    Changes:
+{file_content}
+
+    Provide the detailed JSON output with the structure 
+    {{
+       "issues":[
+          {{
+                "type": "<style|bugs|performance|best_practice>",
+                "line": "<line_number>",
+                "description": "<description>",
+                "suggestion": "<suggestion>"
+         
+           }}
+       ]
+    
+    }}
+    """
+
+
+# Several small files reviewed in one request; the answer is demultiplexed per file
+BATCH_PROMPT_TEMPLATE = """
+       Analyze each of the following files
+       - Code Style and Formatting issues
+       - Potential Bugs and Errors
+       - Performance Improvement
+       - Best Practices
+
+    Each file starts with a "=== File: <name>" line. Report line numbers within each file: count from 1
+    for full files, or use the number at the start of each line when changed hunks are shown.
+
+{files}
+
+    Provide the detailed JSON output with one entry per file, using the exact file names above
+    {{
+       "files":[
+          {{
+                "file_name": "<file name>",
+                "issues":[
+                   {{
+                        "type": "<style|bugs|performance|best_practice>",
+                        "line": "<line_number>",
+                        "description": "<description>",
+                        "suggestion": "<suggestion>"
+                   }}
+                ]
+          }}
+       ]
+    }}
+    """
+
+# Sent once when an answer cannot be parsed: only the broken reply goes back, not the code
+REPAIR_PROMPT_TEMPLATE = """
+    The reply below was supposed to be a single JSON object with the structure
+{structure}
+    but it is not valid JSON or does not follow that structure. Return only the corrected JSON
+    object, keeping every issue the reply contains.
+
+    Reply:
+{reply}
+    """
+ISSUES_STRUCTURE = '{"issues": [{"type": "<style|bugs|performance|best_practice>", "line": "<line_number>", "description": "<description>", "suggestion": "<suggestion>"}]}'
+BATCH_STRUCTURE = '{"files": [{"file_name": "<file name>", "issues": [{"type": "<style|bugs|performance|best_practice>", "line": "<line_number>", "description": "<description>", "suggestion": "<suggestion>"}]}]}'
+# Longest broken reply sent back for repair
+REPAIR_MAX_CHARS = 12000
+
+# Appended to the prompts sent to the triage model (LLM_TIERING_ENABLED): the rating decides
+# whether the file is reviewed again by LLM_MODEL
+TRIAGE_NOTE = """
+    Also rate the code shown: add "risk": "<low|medium|high>" (how likely it hides bugs or
+    security problems) and "complexity": <1-10> next to "issues" in the JSON object.
+    """
+BATCH_TRIAGE_NOTE = """
+    Also rate each file: add "risk": "<low|medium|high>" (how likely it hides bugs or security
+    problems) and "complexity": <1-10> to its entry in "files".
+    """
+
+# Prepended to the content when an oversized file is reviewed in pieces
+CHUNK_NOTE = "(Part {part} of {parts} of this file. Each line starts with its line number; report that number as \"line\".)\n"
+
+
+def prompt_version(prompt_template=PROMPT_TEMPLATE):
+    """Short hash of a prompt template; part of the LLM cache key so editing a prompt invalidates cached analyses"""
+    return hashlib.sha256(prompt_template.encode()).hexdigest()[:16]
+
+
+def model_signature():
+    """The model(s) an analysis comes from: LLM_MODEL, or with tiering the triage model, the review
+    model and the escalation thresholds; part of the cache and single-flight keys"""
+    if not settings.LLM_TIERING_ENABLED:
+        return LLM_MODEL
+    return f"{settings.LLM_TRIAGE_MODEL}>{LLM_MODEL}:{settings.LLM_ESCALATE_RISK}:{settings.LLM_ESCALATE_COMPLEXITY}:{prompt_version(TRIAGE_NOTE + BATCH_TRIAGE_NOTE)}"
+
+
+def llm_cache_key(blob_sha,file_name,prompt_template=PROMPT_TEMPLATE,scope=""):
+    """Cache key for a file blob analyzed with the given prompt and the current model(s) and temperature.
+
+    The file name is part of the prompt (and of what the model says about the code), so the same
+    blob under another path is analyzed on its own. scope distinguishes inputs derived from the
+    same blob, e.g. a hunk excerpt of a given patch.
+    """
+    return make_cache_key(f"{blob_sha}:{file_name}{scope}", prompt_version(prompt_template), model_signature(), LLM_TEMPERATURE)
+
+
+def build_batch_prompt(files):
+    """Prompt reviewing several (file_name, content) pairs in one request"""
+    sections="\n\n".join(f"=== File: {file_name}\n{content}" for file_name,content in files)
+    return BATCH_PROMPT_TEMPLATE.format(files=sections)
+
+
+def get_groq_client():
+    """Groq client shared by every LLM call in this process, on top of the pooled httpx client"""
+    global _groq_client, _groq_client_pid
+    if _groq_client is None or _groq_client_pid != os.getpid():
+        with _groq_client_lock:
+            if _groq_client is None or _groq_client_pid != os.getpid():
+                # Retries are left to the resilience layer, which also limits and breaks
+                _groq_client = Groq(api_key=key, http_client=get_llm_http_client(), max_retries=0)
+                _groq_client_pid = os.getpid()
+    return _groq_client
+
+
+def new_async_groq_client(max_connections=None):
+    """AsyncGroq client for one async engine run; the caller closes it (its connections belong to the run's event loop)"""
+    return AsyncGroq(api_key=key, http_client=new_async_llm_http_client(max_connections), max_retries=0)
+
+
+def _completion_options(prompt,model=None):
+    options={
         # Use an available model - llama-3.1-70b-versatile is a good alternative
         # Other options: llama-3.1-8b-instant, mixtral-8x7b-32768, gemma2-9b-it
-        comletion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Updated to available model
-            messages=[
-                {
-                    "role":"user",
-                    "content":prompt,
-                }
-            ],
-            temperature=0.7,  # Lower temperature for more consistent results
-            top_p=0.9)
-        result=comletion.choices[0].message.content
-        print("Ai analysis output",result)
-        return result
-    except Exception as e:
-        error_msg = str(e)
-        print(f"ERROR in Groq API call: {error_msg}")
-        # Return a structured error response
-        error_response = {
-            "issues": [
-                {
-                    "type": "error",
-                    "line": 0,
-                    "description": f"AI Analysis failed: {error_msg}",
-                    "suggestion": "Please check your Groq API key and model availability"
-                }
-            ]
-        }
-        return str(error_response).replace("'", '"')  # Convert to JSON string
+        "model":model or LLM_MODEL,  # Updated to available model
+        "messages":[
+            {
+                "role":"user",
+                "content":prompt,
+            }
+        ],
+        "temperature":LLM_TEMPERATURE,
+        "top_p":LLM_TOP_P,
+    }
+    if settings.LLM_JSON_MODE:
+        options["response_format"]={"type":"json_object"}
+    return options
+
+
+def _rejected_generation(error):
+    """Text of a generation Groq rejected as invalid JSON, or None for any other bad request"""
+    body=error.body if isinstance(error.body,dict) else {}
+    body=body.get("error",body) if isinstance(body.get("error"),dict) else body
+    if body.get("code")!="json_validate_failed":
+        return None
+    print("LLM generation rejected as invalid JSON, handing it to the repair step")
+    return body.get("failed_generation") or ""
+
+
+def _answer_and_usage(comletion):
+    result=comletion.choices[0].message.content
+    print("Ai analysis output",result)
+    usage={"prompt_tokens":0,"completion_tokens":0}
+    if getattr(comletion,"usage",None):
+        usage={"prompt_tokens":comletion.usage.prompt_tokens or 0,"completion_tokens":comletion.usage.completion_tokens or 0}
+    return result,usage
+
+
+def complete_prompt(prompt,model=None):
+    """Send one prompt to the LLM (model defaults to LLM_MODEL) and return (answer, usage) where usage
+    holds the actual token counts.
+
+    With LLM_JSON_MODE the model is constrained to a JSON object. If Groq rejects a generation as
+    invalid JSON, the rejected text is returned as the answer so the caller can still repair it.
+    Timeouts, 429s and 5xx are retried with backoff (resilience.guarded_call).
+    """
+    client=get_groq_client()
+    options=_completion_options(prompt,model)
+    try:
+        comletion = guarded_call("groq",lambda: client.chat.completions.create(**options))
+    except groq.BadRequestError as e:
+        rejected=_rejected_generation(e)
+        if rejected is None:
+            raise
+        return rejected,{"prompt_tokens":0,"completion_tokens":0}
+    return _answer_and_usage(comletion)
+
+
+async def complete_prompt_async(client,prompt,model=None):
+    """complete_prompt for the async engine, on an AsyncGroq client owned by the caller"""
+    options=_completion_options(prompt,model)
+    try:
+        comletion = await guarded_call_async("groq",lambda: client.chat.completions.create(**options))
+    except groq.BadRequestError as e:
+        rejected=_rejected_generation(e)
+        if rejected is None:
+            raise
+        return rejected,{"prompt_tokens":0,"completion_tokens":0}
+    return _answer_and_usage(comletion)
+
+
+def _repair_prompt(structure,text):
+    print("LLM answer did not match the schema, requesting a repair")
+    return REPAIR_PROMPT_TEMPLATE.format(structure=structure,reply=text[:REPAIR_MAX_CHARS])
+
+
+def _add_usage(usage,extra):
+    usage["requests"]+=1
+    usage["prompt_tokens"]+=extra["prompt_tokens"]
+    usage["completion_tokens"]+=extra["completion_tokens"]
+
+
+def _record_completion(stats,model,usage):
+    """Parse counters plus the completion's latency, requests and tokens for /metrics"""
+    record_output_stats(**stats)
+    model=model or LLM_MODEL
+    record(
+        observations=[("llm",usage["seconds"])],
+        counters=[
+            ("pr_analysis_llm_requests_total",usage["requests"],{"model":model}),
+            ("pr_analysis_llm_tokens_total",usage["prompt_tokens"],{"model":model,"kind":"prompt"}),
+            ("pr_analysis_llm_tokens_total",usage["completion_tokens"],{"model":model,"kind":"completion"}),
+        ],
+    )
+
+
+def _checked(value):
+    if value is None:
+        raise LLMOutputError("LLM answer is not valid JSON matching the issue schema, even after a repair request")
+    return value
+
+
+def complete_json(prompt,parse,structure=ISSUES_STRUCTURE,model=None):
+    """Complete a prompt and parse the answer once, here in the worker.
+
+    parse(text) returns (value, info) with value None when the answer is unusable; in that case
+    the broken answer is sent back once with REPAIR_PROMPT_TEMPLATE. Returns (value, usage) with
+    usage (requests, tokens, seconds) summed over both requests; raises LLMOutputError if the
+    repaired answer is unusable too.
+    """
+    started=time.monotonic()
+    text,usage=complete_prompt(prompt,model)
+    usage=dict(usage,requests=1)
+    value,info=parse(text)
+    stats={"responses":1,"extracted":info["extracted"],"dropped_issues":info["dropped"]}
+    if value is None:
+        repair_text,repair_usage=complete_prompt(_repair_prompt(structure,text),model)
+        _add_usage(usage,repair_usage)
+        value,info=parse(repair_text)
+        stats.update(repairs=1,repaired=int(value is not None),failed=int(value is None))
+        stats["dropped_issues"]+=info["dropped"]
+    usage["seconds"]=time.monotonic()-started
+    _record_completion(stats,model,usage)
+    return _checked(value),usage
+
+
+async def complete_json_async(client,prompt,parse,structure=ISSUES_STRUCTURE,model=None):
+    """complete_json for the async engine; the parse counters and metrics are written from a thread"""
+    started=time.monotonic()
+    text,usage=await complete_prompt_async(client,prompt,model)
+    usage=dict(usage,requests=1)
+    value,info=parse(text)
+    stats={"responses":1,"extracted":info["extracted"],"dropped_issues":info["dropped"]}
+    if value is None:
+        repair_text,repair_usage=await complete_prompt_async(client,_repair_prompt(structure,text),model)
+        _add_usage(usage,repair_usage)
+        value,info=parse(repair_text)
+        stats.update(repairs=1,repaired=int(value is not None),failed=int(value is None))
+        stats["dropped_issues"]+=info["dropped"]
+    usage["seconds"]=time.monotonic()-started
+    await asyncio.to_thread(_record_completion,stats,model,usage)
+    return _checked(value),usage
+
+
+def llm_error_analysis(error_msg):
+    """Structured error response recorded when the LLM call fails"""
+    return {
+        "issues": [
+            {
+                "type": "error",
+                "line": 0,
+                "description": f"AI Analysis failed: {error_msg}",
+                "suggestion": "Please check your Groq API key and model availability"
+            }
+        ]
+    }
@@ -0,0 +1,270 @@
+import asyncio
+import time
+import uuid
+from django.conf import settings
+from django.db import connections
+from .ai_agent import complete_json_async, new_async_groq_client, BATCH_STRUCTURE
+from .llm_cache import get_cached_analysis
+from .http_pool import new_async_github_client
+from .progress import publish_file_result
+from .diff_hunks import GITHUB_PATCH_CONTEXT
+from .llm_output import parse_analysis, parse_batch_answer, LLMOutputError
+from .tiering import tier_model, split_triaged, mark_escalated
+from .file_filter import file_rules
+from .resilience import guarded_call_async, TransientHTTPError
+from .metrics import new_timings, timed
+from .github import (
+    fetch_pr_details, iter_pr_file_pages, fetch_file_content,
+    new_file_item, needs_new_content, set_llm_input, failed_file_entry, parked_files, single_file_prompt, batch_prompt, finish_file,
+    new_token_usage, add_usage, count_tiering, count_listing, count_fetch, skip_file, plan_units, previous_entries_by_name, carry_forward, open_mirror, finished_result, failed_result,
+)
+
+# The async engine runs the same pipeline as analyze_pr on one event loop: raw file downloads go
+# through httpx.AsyncClient and LLM requests through AsyncGroq, so a single worker process keeps
+# dozens of files in flight without a thread per file. Blocking work that touches Django or
+# Redis (LLM cache, event stream, the rate-limited GitHub REST client) runs in worker threads.
+
+
+async def _in_thread(func, *args):
+    """Run blocking work off the event loop; the ORM refuses to run inside it"""
+    def call():
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+    return await asyncio.to_thread(call)
+
+
+async def _fetch_new_content(http, repo_url, file, github_token=None, mirror=None):
+    if mirror is not None and mirror.active:
+        content = await _in_thread(mirror.read_file, file)
+        if content is not None:
+            return content
+    if 'raw_url' not in file:
+        print(f"  Using contents API (fallback)")
+        return await _in_thread(fetch_file_content, repo_url, file['filename'], github_token)
+    headers = {"Accept": "text/plain"}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    async def get():
+        response = await http.get(file['raw_url'], headers=headers)
+        if response.status_code >= 500:
+            raise TransientHTTPError(response.status_code, response.reason_phrase, float(response.headers.get("retry-after") or 0) or None)
+        return response
+    # Raw downloads do not count against the REST quota, so they skip the shared token bucket
+    response = await guarded_call_async("github", get)
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch file from raw_url: {response.status_code} {response.text}")
+    return response.text
+
+
+async def prepare_file_async(http, slots, repo_url, index, file, github_token=None, review_mode="full", context_lines=GITHUB_PATCH_CONTEXT, mirror=None):
+    """prepare_file for the async engine: cache lookup and content fetch, never raises"""
+    file_name = file['filename']
+    hunks_only, item = new_file_item(index, file, review_mode, context_lines)
+    async with slots:
+        print(f"Preparing file: {file_name}")
+        try:
+            if item["cache_key"]:
+                cached = await _in_thread(get_cached_analysis, item["cache_key"])
+                if cached is not None:
+                    print(f"✓ Cache hit for {file_name}")
+                    item["result"] = {"analysis": cached, "file_name": file_name, "sha": item["sha"], "cached": True}
+                    return item
+            new_content = None
+            if needs_new_content(hunks_only, context_lines):
+                started = time.monotonic()
+                new_content = await _fetch_new_content(http, repo_url, file, github_token, mirror)
+                item["fetch_seconds"] = time.monotonic() - started
+                item["fetched_bytes"] = len(new_content.encode())
+            set_llm_input(item, file, new_content, hunks_only, context_lines)
+            return item
+        except Exception as file_error:
+            print(f"ERROR fetching file {file_name}: {str(file_error)}")
+            item["result"] = failed_file_entry(file_name, file_error)
+            return item
+
+
+async def _answer_unit_async(unit, items, complete, tier, answers):
+    """_answer_unit for the async engine; files missing from a batch answer are retried concurrently"""
+    triage = tier == "triage"
+    label = f" [{tier}]" if settings.LLM_TIERING_ENABLED else ""
+    if unit["kind"] == "batch":
+        print(f"Analyzing batch of {len(items)} files{label}: {', '.join(item['file_name'] for item in items)}")
+        names = [item["file_name"] for item in items]
+        try:
+            per_file = await complete(batch_prompt(items, triage), lambda text: parse_batch_answer(text, names, triage), tier, structure=BATCH_STRUCTURE)
+        except LLMOutputError as output_error:
+            print(f"  Batch answer unusable ({str(output_error)}), retrying its files singly")
+            per_file = {}
+        missing = [item for item in items if item["file_name"] not in per_file]
+        answers.extend((item["index"], per_file[item["file_name"]], None) for item in items if item["file_name"] in per_file)
+        for item in missing:
+            print(f"  {item['file_name']} missing from batch answer, retrying singly")
+        # This unit already holds its slot
+        retried = await asyncio.gather(
+            *(complete(single_file_prompt(item, triage=triage), lambda text: parse_analysis(text, triage), tier) for item in missing),
+            return_exceptions=True)
+        for item, answer in zip(missing, retried):
+            if isinstance(answer, Exception):
+                answers.append((item["index"], None, answer))
+            else:
+                answers.append((item["index"], answer, None))
+    else:
+        item = items[0]
+        if unit["kind"] == "chunk":
+            print(f"Analyzing {item['file_name']} part {unit['part']}/{unit['parts']}{label}")
+        else:
+            print(f"Analyzing file: {item['file_name']}{label}")
+        answers.append((item["index"], await complete(single_file_prompt(item, unit, triage), lambda text: parse_analysis(text, triage), tier), None))
+
+
+async def run_llm_unit_async(groq_client, slots, unit):
+    """run_llm_unit for the async engine; returns (answers, usage) and never raises"""
+    usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "tiers": {}}
+
+    async def complete(prompt, parse, tier, **kwargs):
+        value, call_usage = await complete_json_async(groq_client, prompt, parse, model=tier_model(tier), **kwargs)
+        add_usage(usage, call_usage, tier)
+        return value
+
+    answers = []
+    ratings = {}
+    async with slots:
+        try:
+            items = unit["items"]
+            if settings.LLM_TIERING_ENABLED:
+                triaged = []
+                try:
+                    await _answer_unit_async(unit, items, complete, "triage", triaged)
+                except Exception as triage_error:
+                    # A failed triage never fails the file: the review model takes it
+                    print(f"  Triage failed ({str(triage_error)}), escalating")
+                kept, items, ratings = split_triaged(unit["items"], triaged)
+                answers.extend(kept)
+            if items:
+                await _answer_unit_async(unit, items, complete, "review", answers)
+        except Exception as llm_error:
+            print(f"ERROR in Groq API call: {str(llm_error)}")
+            answered = {index for index, _, _ in answers}
+            answers.extend((item["index"], None, llm_error) for item in unit["items"] if item["index"] not in answered)
+    if settings.LLM_TIERING_ENABLED:
+        answers = mark_escalated(answers, ratings)
+    return answers, usage
+
+
+async def analyze_pr_async(repo_url, pr_number, github_token=None, task_id=None, max_concurrency=None, previous_result=None, review_mode=None, files=None, head_sha=None, first_index=0):
+    """analyze_pr on asyncio; same arguments and result, with connection_stats["engine"] "async".
+
+    Pages are listed one after another; each listed page starts its file preparations at once,
+    and its LLM requests once the whole page is prepared. max_concurrency (default
+    PR_ANALYSIS_ASYNC_MAX_CONCURRENCY) bounds both downloads and LLM requests in flight.
+    files/head_sha/first_index analyze one slice of an already listed PR, as in analyze_pr.
+    """
+    if task_id is None:
+        task_id = str(uuid.uuid4())
+    if max_concurrency is None:
+        max_concurrency = settings.PR_ANALYSIS_ASYNC_MAX_CONCURRENCY
+    if review_mode is None:
+        review_mode = settings.PR_ANALYSIS_REVIEW_MODE
+    context_lines = settings.PR_ANALYSIS_HUNK_CONTEXT_LINES
+    max_concurrency = max(1, max_concurrency)
+    try:
+        print(f"Starting analysis for PR #{pr_number} in {repo_url} (async engine)")
+        file_count = len(files) if files is not None else 0
+        if head_sha is None:
+            details = await _in_thread(fetch_pr_details, repo_url, pr_number, github_token)
+            head_sha = details['head']['sha']
+            file_count = details.get('changed_files', 0)
+        previous_by_name = previous_entries_by_name(previous_result)
+        rules = file_rules(repo_url)
+        results = []
+        listed = []  # listed file of every result, to park failed ones
+        carried = 0
+        token_usage = new_token_usage()
+        timings = new_timings()
+        samples = []  # (stage, seconds) of every page listed and file fetched
+        # Downloads and LLM requests are limited separately so slow downloads never starve the model
+        fetch_slots = asyncio.Semaphore(max_concurrency)
+        llm_slots = asyncio.Semaphore(max_concurrency)
+        page_tasks = []
+
+        async with open_mirror(repo_url, pr_number, head_sha, github_token, file_count) as mirror, new_async_github_client(max_concurrency) as http, new_async_groq_client(max_concurrency) as groq_client:
+            async def publish(index, entry):
+                results[index] = entry
+                await _in_thread(publish_file_result, task_id, first_index + index, entry)
+
+            async def run_unit(unit):
+                return unit, await run_llm_unit_async(groq_client, llm_slots, unit)
+
+            async def analyze_page(preparations):
+                pending = []
+                for item in await asyncio.gather(*preparations):
+                    count_fetch(timings, samples, item)
+                    if "result" in item:
+                        await publish(item["index"], item["result"])
+                    else:
+                        pending.append(item)
+                outstanding = {}  # file index -> [prepared item, unit answers still expected]
+                answers_by_index = {}
+                units = plan_units(pending, token_usage)
+                for unit in units:
+                    for item in unit["items"]:
+                        outstanding.setdefault(item["index"], [item, 0])[1] += 1
+                for finished in asyncio.as_completed([run_unit(unit) for unit in units]):
+                    unit, (answers, usage) = await finished
+                    add_usage(token_usage, usage)
+                    for index, analysis, error in answers:
+                        answers_by_index.setdefault(index, []).append((unit.get("part", 1), analysis, error))
+                        outstanding[index][1] -= 1
+                        if outstanding[index][1] == 0:
+                            item = outstanding.pop(index)[0]
+                            # Chunk answers may finish out of order; merge them in part order
+                            ordered = [(analysis, error) for _, analysis, error in sorted(answers_by_index.pop(index), key=lambda answer: answer[0])]
+                            entry = await _in_thread(finish_file, item, ordered)
+                            count_tiering(token_usage, entry)
+                            await publish(index, entry)
+
+            # Listing stays on the rate-limited (ETag cached, token bucket) GitHub client, in a thread
+            pages = iter([files]) if files is not None else iter_pr_file_pages(repo_url, pr_number, github_token)
+            try:
+                while True:
+                    page, seconds = await _in_thread(timed, next, pages, None)
+                    if page is None:
+                        break
+                    if files is None:
+                        count_listing(timings, samples, seconds)
+                    preparations = []
+                    for file in page:
+                        index = len(results)
+                        listed.append(file)
+                        skipped = skip_file(rules, file, token_usage)
+                        if skipped:
+                            results.append(skipped)
+                            await _in_thread(publish_file_result, task_id, first_index + index, skipped)
+                            continue
+                        carried_entry = carry_forward(previous_by_name, file)
+                        if carried_entry:
+                            results.append(carried_entry)
+                            await _in_thread(publish_file_result, task_id, first_index + index, carried_entry)
+                            carried += 1
+                            continue
+                        results.append(None)
+                        preparations.append(asyncio.create_task(
+                            prepare_file_async(http, fetch_slots, repo_url, index, file, github_token, review_mode, context_lines, mirror)))
+                    print(f"Listed {len(results)} files so far ({review_mode} mode, up to {max_concurrency} in flight)")
+                    page_tasks.append(asyncio.create_task(analyze_page(preparations)))
+                await asyncio.gather(*page_tasks)
+            finally:
+                # A failed listing must not leave downloads or LLM requests running on closed clients
+                for page_task in page_tasks:
+                    page_task.cancel()
+
+        return await _in_thread(finished_result, task_id, head_sha, results, carried, previous_result, token_usage, "async", parked_files(results, listed, first_index), timings, samples)
+    except Exception as e:
+        return failed_result(task_id, e)
+
+
+def analyze_pr_with_asyncio(*args, **kwargs):
+    """Run analyze_pr_async to completion from synchronous code (the Celery task)"""
+    return asyncio.run(analyze_pr_async(*args, **kwargs))
@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+import redis
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from Home.models import PRAnalysisBatch, PRAnalysisBatchItem
+from .github_client import TOKEN_BUCKET_SCRIPT
+from .redis_client import get_redis, mark_redis_down
+
+# Budget shared by every batch on every worker, so nightly sweeps never crowd out interactive
+# analyses: at most BATCH_MAX_CONCURRENCY batch analyses run at once (slots are leases that the
+# running analysis renews and that expire BATCH_SLOT_LEASE seconds after a worker died), and at most
+# BATCH_STARTS_PER_MINUTE of them start per minute (a token bucket, like GitHub's).
+SLOTS_KEY = "batch:slots"    # sorted set: item id -> lease expiry (Redis clock)
+STARTS_KEY = "batch:starts"  # token bucket of analysis starts
+
+ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(redis.call('TIME')[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Push an item's lease out by ARGV[1] seconds, only while it still holds its slot
+RENEW_SLOT_SCRIPT = """
+local now = tonumber(redis.call('TIME')[1])
+return redis.call('ZADD', KEYS[1], 'XX', 'CH', now + tonumber(ARGV[1]), ARGV[2])
+"""
+
+# Item statuses; QUEUED and RUNNING items are still open
+OPEN_STATUSES = ("QUEUED", "RUNNING")
+STATUSES = ("QUEUED", "RUNNING", "SAVED", "COALESCED", "ERROR")
+
+# Registered once; every call passes the current client, which changes after mark_redis_down
+_acquire_slot = None
+_start_bucket = None
+_renew_slot = None
+
+
+def acquire_budget(item_id):
+    """Take a batch slot and a start token for item_id; returns 0, or the seconds to wait before asking again.
+
+    Without Redis there is no shared budget and every item may start.
+    """
+    global _acquire_slot, _start_bucket
+    client = get_redis()
+    if client is None:
+        return 0
+    try:
+        if _acquire_slot is None:
+            _acquire_slot = client.register_script(ACQUIRE_SLOT_SCRIPT)
+            _start_bucket = client.register_script(TOKEN_BUCKET_SCRIPT)
+        if not _acquire_slot(keys=[SLOTS_KEY], args=[settings.BATCH_MAX_CONCURRENCY, settings.BATCH_SLOT_LEASE, str(item_id)], client=client):
+            return settings.BATCH_SLOT_RETRY_SECONDS
+        rate = settings.BATCH_STARTS_PER_MINUTE / 60.0
+        # Bursts of up to ten seconds' worth of starts
+        wait = float(_start_bucket(keys=[STARTS_KEY], args=[max(1, settings.BATCH_STARTS_PER_MINUTE // 6), rate], client=client))
+        if wait > 0:
+            release_slot(item_id)
+            return wait
+    except redis.RedisError as e:
+        print(f"WARNING: batch budget skipped, Redis error: {str(e)}")
+        mark_redis_down()
+    return 0
+
+
+def renew_slot(item_id):
+    """Extend item_id's lease by BATCH_SLOT_LEASE; True if it still held its slot"""
+    global _renew_slot
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        if _renew_slot is None:
+            _renew_slot = client.register_script(RENEW_SLOT_SCRIPT)
+        return bool(_renew_slot(keys=[SLOTS_KEY], args=[settings.BATCH_SLOT_LEASE, str(item_id)], client=client))
+    except redis.RedisError:
+        mark_redis_down()
+        return False
+
+
+@contextmanager
+def holding_slot(item_id):
+    """Renew item_id's lease every third of BATCH_SLOT_LEASE while the block runs (no-op for None).
+
+    Analyses can outlive one lease; only a slot whose worker died is left to expire.
+    """
+    if item_id is None:
+        yield
+        return
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(settings.BATCH_SLOT_LEASE / 3):
+            renew_slot(item_id)
+
+    renew_slot(item_id)
+    threading.Thread(target=renew, name=f"batch-slot-{item_id}", daemon=True).start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def release_slot(item_id):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.zrem(SLOTS_KEY, str(item_id))
+    except redis.RedisError:
+        mark_redis_down()
+
+
+def finish_item(item_id, status, task_id=None, error=""):
+    """Record an item's outcome, free its slot and close the batch once no item is open"""
+    release_slot(item_id)
+    item = PRAnalysisBatchItem.objects.filter(id=item_id).first()
+    if item is None:
+        return
+    update = {"status": status, "error": error[:2000], "updated_at": timezone.now()}
+    if task_id:
+        update["task_id"] = task_id
+    PRAnalysisBatchItem.objects.filter(id=item_id).update(**update)
+    close_batch_if_done(item.batch_id)
+
+
+def close_batch_if_done(batch_pk):
+    # Only a batch whose repositories are all listed (status RUNNING) can be done
+    if not PRAnalysisBatchItem.objects.filter(batch_id=batch_pk, status__in=OPEN_STATUSES).exists():
+        PRAnalysisBatch.objects.filter(id=batch_pk, status="RUNNING").update(status="DONE", finished_at=timezone.now())
+
+
+def batch_progress(batch, with_items=False):
+    """Aggregate progress of a batch: item counts per status, plus every item if asked"""
+    counts = dict.fromkeys(STATUSES, 0)
+    for row in batch.items.values("status").annotate(count=Count("id")):
+        counts[row["status"]] = row["count"]
+    total = sum(counts.values())
+    progress = {
+        "batch_id": batch.batch_id,
+        "status": batch.status,
+        "total": total,
+        "finished": total - sum(counts[status] for status in OPEN_STATUSES),
+        "counts": counts,
+        "repos": batch.repos,
+        "errors": batch.errors,
+        "created_at": batch.created_at,
+        "finished_at": batch.finished_at,
+    }
+    if with_items:
+        progress["items"] = list(batch.items.order_by("id").values("repo_url", "pr_number", "status", "task_id", "error"))
+    return progress
@@ -0,0 +1,127 @@
+import re
+from .tiering import merge_triage
+
+# Rough token estimate for code; good enough for budgeting without a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+# Lines where a new top-level definition starts (Python, JS/TS, Go, Rust, Java-ish); "..." separates diff hunks
+BOUNDARY = re.compile(
+    r"^(?:async\s+def|def|class|function|export|const|let|var|func|fn|pub|public|private|protected|interface|type|@)\b"
+    r"|^\.\.\.$"
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_on_boundaries(content, max_tokens, line_prefix_chars=0):
+    """Split content into pieces of at most max_tokens, cutting at top-level definitions where possible.
+
+    Returns a list of (start_line, text) with 1-based start lines. Definitions larger than the
+    budget are cut by line count. line_prefix_chars is counted against the budget for every line,
+    for pieces that are sent with a prefix (e.g. a line number) on each line.
+    """
+    lines = content.splitlines()
+    # Segments run from one boundary line to the next
+    starts = [0] + [i for i, line in enumerate(lines) if i and BOUNDARY.match(line)]
+    segments = [(start, lines[start:end]) for start, end in zip(starts, starts[1:] + [len(lines)])]
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    current_start, current, current_chars = 0, [], 0
+    for start, segment in segments:
+        for offset, line in enumerate(segment):
+            line_chars = len(line) + 1 + line_prefix_chars
+            at_boundary = offset == 0
+            # Close the current piece at a boundary when the whole next segment would not fit,
+            # or anywhere when the current line alone would overflow it
+            segment_chars = sum(len(l) + 1 + line_prefix_chars for l in segment) if at_boundary else 0
+            if current and (
+                (at_boundary and current_chars + segment_chars > max_chars)
+                or current_chars + line_chars > max_chars
+            ):
+                pieces.append((current_start + 1, "\n".join(current)))
+                current, current_chars = [], 0
+            if not current:
+                current_start = start + offset
+            current.append(line)
+            current_chars += line_chars
+    if current:
+        pieces.append((current_start + 1, "\n".join(current)))
+    return pieces
+
+
+def plan_llm_requests(items, max_prompt_tokens, batch_max_tokens, batch_max_files, prompt_overhead_tokens=0, chunk_overhead_tokens=0):
+    """Group prepared files into LLM requests.
+
+    items are dicts with "index", "file_name" and "llm_input", and optionally "overhead_tokens"
+    (the prompt around the file when it is sent alone; defaults to prompt_overhead_tokens) and
+    "line_prefix_chars" (added to each line when the file is sent in pieces). Returns a list of units:
+      {"kind": "single", "items": [item]}                 one file, one request
+      {"kind": "chunk", "items": [item], "start_line", "text", "part", "parts"}
+                                                           one piece of an oversized file
+      {"kind": "batch", "items": [item, ...]}             several small files in one request
+    Every unit carries "planned_tokens" (prompt estimate including template overhead). Pieces
+    also count chunk_overhead_tokens, the note sent with each of them; batches count
+    prompt_overhead_tokens once.
+    """
+    units = []
+    batch, batch_tokens = [], 0
+
+    def single(item, tokens):
+        return {"kind": "single", "items": [item], "planned_tokens": tokens + item.get("overhead_tokens", prompt_overhead_tokens)}
+
+    def flush_batch():
+        nonlocal batch, batch_tokens
+        if len(batch) == 1:
+            units.append(single(batch[0], batch_tokens))
+        elif batch:
+            units.append({"kind": "batch", "items": batch, "planned_tokens": batch_tokens + prompt_overhead_tokens})
+        batch, batch_tokens = [], 0
+
+    for item in items:
+        overhead = item.get("overhead_tokens", prompt_overhead_tokens)
+        name_tokens = estimate_tokens(item["file_name"])
+        tokens = estimate_tokens(item["llm_input"]) + name_tokens
+        if tokens + overhead > max_prompt_tokens:
+            overhead += name_tokens + chunk_overhead_tokens
+            prefix_chars = item.get("line_prefix_chars", 0)
+            pieces = split_on_boundaries(item["llm_input"], max(1, max_prompt_tokens - overhead), prefix_chars)
+            for part, (start_line, text) in enumerate(pieces, 1):
+                text_chars = len(text) + prefix_chars * len(text.splitlines())
+                units.append({
+                    "kind": "chunk", "items": [item], "start_line": start_line, "text": text,
+                    "part": part, "parts": len(pieces),
+                    "planned_tokens": text_chars // CHARS_PER_TOKEN + 1 + overhead,
+                })
+        elif tokens > batch_max_tokens:
+            units.append(single(item, tokens))
+        else:
+            if batch and (batch_tokens + tokens > batch_max_tokens or len(batch) >= batch_max_files):
+                flush_batch()
+            batch.append(item)
+            batch_tokens += tokens
+    flush_batch()
+    return units
+
+
+def merge_chunk_results(analyses):
+    """Combine the analyses for the pieces of one file into a single {"issues": [...]}.
+
+    Pieces are numbered with real file lines, so issues keep their lines. An issue repeated by
+    several pieces (same type, line and description, e.g. a file-wide remark) is kept once.
+    """
+    issues = []
+    seen = set()
+    for analysis in analyses:
+        for issue in analysis.get("issues", []):
+            key = (issue.get("type"), str(issue.get("line")), issue.get("description"))
+            if key not in seen:
+                seen.add(key)
+                issues.append(issue)
+    merged = {"issues": issues}
+    triages = [analysis["triage"] for analysis in analyses if "triage" in analysis]
+    if triages:
+        merged["triage"] = merge_triage(triages)
+    return merged
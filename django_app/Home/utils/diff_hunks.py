@@ -0,0 +1,112 @@
+import re
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# GitHub generates PR patches with 3 lines of context around each change
+GITHUB_PATCH_CONTEXT = 3
+
+
+def parse_patch(patch):
+    """Split a unified diff into hunks.
+
+    Each hunk is a list of (kind, new_line, text, position) where kind is ' ', '+' or '-'.
+    Context and added lines carry their line number in the new file; removed lines have
+    new_line None and position set to the new-file line they sit just before.
+    """
+    hunks = []
+    current = None
+    new_line = 0
+    for raw in patch.splitlines():
+        header = HUNK_HEADER.match(raw)
+        if header:
+            current = []
+            hunks.append(current)
+            new_line = int(header.group(3))
+            continue
+        if current is None or raw.startswith("\\"):  # "\ No newline at end of file"
+            continue
+        kind, text = (raw[0], raw[1:]) if raw else (" ", "")
+        if kind == "-":
+            current.append(("-", None, text, new_line))
+        elif kind in (" ", "+"):
+            current.append((kind, new_line, text, new_line))
+            new_line += 1
+    return [hunk for hunk in hunks if hunk]
+
+
+def _window(hunk, context_lines, new_lines):
+    """Trim or extend a hunk so it has exactly context_lines of context on each side (when available)"""
+    lead = 0
+    while lead < len(hunk) and hunk[lead][0] == " ":
+        lead += 1
+    if lead == len(hunk):
+        return []
+    trail = 0
+    while hunk[len(hunk) - 1 - trail][0] == " ":
+        trail += 1
+    core = hunk[lead:len(hunk) - trail]
+    leading = hunk[:lead][max(0, lead - context_lines):]
+    trailing = hunk[len(hunk) - trail:][:context_lines]
+    if new_lines is not None:
+        first = (leading or core)[0][3]
+        missing = context_lines - len(leading)
+        extra = range(max(1, first - missing), first)
+        leading = [(" ", n, new_lines[n - 1], n) for n in extra] + leading
+        tail = (core + trailing)[-1]
+        last = tail[3] if tail[1] is not None else tail[3] - 1
+        missing = context_lines - len(trailing)
+        extra = range(last + 1, min(len(new_lines), last + missing) + 1)
+        trailing = trailing + [(" ", n, new_lines[n - 1], n) for n in extra]
+    return leading + core + trailing
+
+
+def build_hunk_excerpt(patch, context_lines=GITHUB_PATCH_CONTEXT, new_content=None):
+    """Render the changed hunks of a file for the LLM.
+
+    Lines are numbered sequentially within the excerpt (removed lines get no number) and
+    the returned line_map translates those numbers back to new-file line numbers. new_content
+    is only needed when context_lines exceeds the context already present in the patch.
+    """
+    new_lines = new_content.splitlines() if new_content is not None else None
+    rendered = []
+    line_map = {}
+    last_emitted = 0
+    for hunk in parse_patch(patch):
+        window = _window(hunk, context_lines, new_lines)
+        # Extended windows can overlap the previous hunk; never show a new-file line twice
+        window = [line for line in window if line[1] is None or line[1] > last_emitted]
+        if not window:
+            continue
+        first_new_line = next((line[1] for line in window if line[1] is not None), None)
+        if rendered and first_new_line != last_emitted + 1:
+            rendered.append("...")
+        for kind, new_line, text, _ in window:
+            if new_line is None:
+                rendered.append(f"      - {text}")
+                continue
+            excerpt_line = len(line_map) + 1
+            line_map[excerpt_line] = new_line
+            rendered.append(f"{excerpt_line:>5} {kind} {text}")
+            last_emitted = new_line
+    return "\n".join(rendered), line_map
+
+
+def _remap_line(value, line_map):
+    # The LLM reports lines as ints, "12", or ranges like "12-14"
+    numbers = [int(n) for n in re.findall(r"\d+", str(value))]
+    mapped = [line_map[n] for n in numbers if n in line_map]
+    if not mapped:
+        return value
+    if len(mapped) == 1:
+        return mapped[0]
+    return f"{mapped[0]}-{mapped[-1]}"
+
+
+def remap_issue_lines(analysis, line_map):
+    """Return a copy of an analysis with excerpt line numbers rewritten to new-file line numbers"""
+    issues = []
+    for issue in analysis.get("issues", []):
+        if "line" in issue:
+            issue = dict(issue, line=_remap_line(issue["line"], line_map))
+        issues.append(issue)
+    return dict(analysis, issues=issues)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+from fnmatch import fnmatch
+from urllib.parse import urlparse
+from django.conf import settings
+
+# Classification of PR files before any download: files that cannot or need not be reviewed are
+# recorded with a skip reason and a one-line summary built from the file list alone (status,
+# changes, additions, deletions, previous_filename), so they cost neither a fetch nor an LLM call.
+
+# Built-in skip rules: reason -> globs
+DEFAULT_SKIP_RULES = {
+    "binary": [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.bmp", "*.ico", "*.webp", "*.tiff", "*.psd",
+        "*.pdf", "*.zip", "*.gz", "*.tgz", "*.bz2", "*.xz", "*.7z", "*.rar", "*.jar", "*.war",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp3", "*.mp4", "*.mov", "*.wav",
+        "*.exe", "*.dll", "*.so", "*.dylib", "*.a", "*.o", "*.class", "*.pyc", "*.wasm", "*.sqlite3", "*.db",
+    ],
+    "lockfile": [
+        "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "npm-shrinkwrap.json", "poetry.lock",
+        "Pipfile.lock", "Cargo.lock", "composer.lock", "Gemfile.lock", "go.sum", "uv.lock",
+    ],
+    "minified": ["*.min.js", "*.min.css", "*.map"],
+    "vendored": [
+        "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*",
+        "third_party/*", "*/third_party/*", "site-packages/*", "*/site-packages/*",
+    ],
+}
+
+SKIP_LABELS = {"binary": "Binary file", "lockfile": "Lock file", "minified": "Minified file", "vendored": "Vendored code", "excluded": "Excluded by a skip rule"}
+
+
+def _repo_name(repo_url):
+    parts = urlparse(repo_url.rstrip("/")).path.strip("/").split("/")
+    if len(parts) < 2:
+        return ""
+    repo = parts[1][:-4] if parts[1].endswith(".git") else parts[1]
+    return f"{parts[0]}/{repo}".lower()
+
+
+def file_rules(repo_url):
+    """The rules for one repository, or None when filtering is disabled.
+
+    PR_ANALYSIS_REPO_FILE_RULES maps "owner/repo" (globs allowed, e.g. "my-org/*") to overrides:
+    "skip" globs add to PR_ANALYSIS_SKIP_GLOBS, "review" globs are reviewed even if a skip rule
+    or the size limit matches, and "max_changes" replaces PR_ANALYSIS_MAX_FILE_CHANGES.
+    Every matching entry applies, in order.
+    """
+    if not settings.PR_ANALYSIS_FILTER_ENABLED:
+        return None
+    rules = {
+        "skip": dict(DEFAULT_SKIP_RULES, excluded=list(settings.PR_ANALYSIS_SKIP_GLOBS)),
+        "review": [],
+        "max_changes": settings.PR_ANALYSIS_MAX_FILE_CHANGES,
+    }
+    name = _repo_name(repo_url)
+    for pattern, overrides in settings.PR_ANALYSIS_REPO_FILE_RULES.items():
+        if not fnmatch(name, pattern.lower()):
+            continue
+        rules["skip"]["excluded"] = rules["skip"]["excluded"] + list(overrides.get("skip", []))
+        rules["review"] = rules["review"] + list(overrides.get("review", []))
+        if "max_changes" in overrides:
+            rules["max_changes"] = int(overrides["max_changes"])
+    return rules
+
+
+def rules_signature(repo_url):
+    """Short hash of a repository's rules, so analyses made under different rules are told apart"""
+    return hashlib.sha256(json.dumps(file_rules(repo_url), sort_keys=True).encode()).hexdigest()[:12]
+
+
+def matches(path, globs):
+    """Globs without "/" match the file name, others the whole path; "*" also crosses "/" """
+    name = path.rsplit("/", 1)[-1]
+    return any(fnmatch(path, glob) if "/" in glob else fnmatch(name, glob) for glob in globs if glob)
+
+
+def _size(file):
+    return f"+{file.get('additions', 0)}/-{file.get('deletions', 0)} lines"
+
+
+def classify_file(rules, file):
+    """(reason, summary) for a file that should not be reviewed, or None to review it"""
+    if rules is None:
+        return None
+    path = file['filename']
+    status = file.get('status')
+    changes = file.get('changes', 0)
+    # Nothing to fetch or review whatever the rules say
+    if status == "removed":
+        return "deleted", f"Deleted file ({_size(file)})"
+    if status == "renamed" and not changes:
+        return "renamed", f"Renamed from {file.get('previous_filename', '?')} without changes"
+    if status == "unchanged" or (not file.get('patch') and not changes):
+        # GitHub leaves out the patch of binary files and reports no line changes
+        return "binary", "Binary or empty change, no diff to review"
+    if matches(path, rules["review"]):
+        return None
+    for reason, globs in rules["skip"].items():
+        if matches(path, globs):
+            return reason, f"{SKIP_LABELS[reason]} ({_size(file)})"
+    if rules["max_changes"] and changes > rules["max_changes"]:
+        return "too_large", f"{changes} changed lines ({_size(file)}), over the limit of {rules['max_changes']}"
+    return None
+
+
+def skipped_entry(file, reason, summary):
+    """Result entry of a skipped file; it has no issues, so it adds nothing to issue statistics"""
+    return {
+        "file_name": file['filename'],
+        "sha": file.get('sha'),
+        "analysis": {"issues": []},
+        "skipped": reason,
+        "summary": summary,
+    }
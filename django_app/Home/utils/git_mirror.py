@@ -0,0 +1,226 @@
+import base64
+import fcntl
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from django.conf import settings
+from .metrics import record, observe
+
+# Bare git mirrors on the worker's disk, one per repository, as a bulk alternative to downloading
+# every PR file on its own. The first file of an analysis that needs content fetches the PR head
+# (refs/pull/<n>/head) into the repository's mirror, unless an earlier analysis already did; all
+# contents are then read from the object store by blob sha through one `git cat-file --batch`.
+# An flock per mirror is held only while fetching (and while evicting it), so workers on the same
+# disk reuse each other's fetches without waiting on each other's reads: blobs are immutable and
+# fetches only add objects. Readers keep the mirror's mtime fresh, and beyond GIT_MIRROR_MAX_BYTES
+# the least recently used mirrors not read in the last IN_USE_SECONDS are deleted. Anything that
+# goes wrong (no git, fetch failure, object missing, mirror evicted) falls back to the per-file download.
+
+EVICT_LOCK = ".evict.lock"
+IN_USE_SECONDS = 300   # mirrors read more recently than this are never evicted
+TOUCH_SECONDS = 60     # how often readers refresh their mirror's mtime
+_SHA = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+
+def _count(event, amount=1):
+    record(counters=[("pr_analysis_git_mirror_total", amount, {"event": event})])
+
+
+def _git(args, git_dir=None, env=None, timeout=60):
+    command = ["git"] + (["--git-dir", git_dir] if git_dir else []) + args
+    return subprocess.run(command, env=env, timeout=timeout, capture_output=True, check=True)
+
+
+def _fetch_env(github_token):
+    # The token goes in an environment-only http.extraHeader: never on the command line or in the mirror's config
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    if github_token:
+        basic = base64.b64encode(f"x-access-token:{github_token}".encode()).decode()
+        env.update(GIT_CONFIG_COUNT="1", GIT_CONFIG_KEY_0="http.extraHeader", GIT_CONFIG_VALUE_0=f"Authorization: Basic {basic}")
+    return env
+
+
+def _has_commit(path, sha):
+    try:
+        _git(["cat-file", "-e", f"{sha}^{{commit}}"], path)
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+
+def _disk_usage(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def evict_mirrors(keep=None):
+    """Delete least recently used mirrors until they fit in GIT_MIRROR_MAX_BYTES.
+
+    Mirrors being fetched (locked by any worker on this disk) or read in the last IN_USE_SECONDS are
+    left alone, and so is keep.
+    """
+    base = settings.GIT_MIRROR_DIR
+    with open(os.path.join(base, EVICT_LOCK), "a") as evict_lock:
+        try:
+            fcntl.flock(evict_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # another worker is already evicting
+        mirrors = []
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                mirrors.append((os.path.getmtime(path), path, _disk_usage(path)))
+        total = sum(size for _, _, size in mirrors)
+        for _, path, size in sorted(mirrors):
+            if total <= settings.GIT_MIRROR_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            # Lock files stay behind: deleting one another worker holds open would split the lock
+            with open(path + ".lock", "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # Checked under the lock: a reader touches the mirror before releasing it after its fetch
+                if time.time() - os.path.getmtime(path) < IN_USE_SECONDS:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            print(f"Evicted git mirror {os.path.basename(path)} ({size} bytes)")
+            total -= size
+            _count("evicted")
+
+
+class PRMirror:
+    """Contents of one PR's files read from the repository's local mirror.
+
+    Inactive mirrors (disabled, PR too small) read nothing. The fetch happens on the first read,
+    so analyses whose files all come from the LLM cache never touch git; read_file returns None
+    whenever the caller should download the file instead. Close it (or use it as a context
+    manager) to stop the reader.
+    """
+
+    def __init__(self, owner=None, repo=None, pr_number=None, head_sha=None, github_token=None):
+        self.active = owner is not None
+        self.pr_number = pr_number
+        self.head_sha = head_sha
+        self.github_token = github_token
+        self.path = os.path.join(settings.GIT_MIRROR_DIR, re.sub(r"[^\w.-]", "_", f"{owner}--{repo}") + ".git") if self.active else None
+        self.remote = f"{settings.GITHUB_GIT_URL}/{owner}/{repo}.git" if self.active else None
+        self._lock = threading.Lock()
+        self._ready = False
+        self._failed = False
+        self._reader = None
+        self._touched = 0
+
+    def _fetch(self):
+        """Bring the PR head into the mirror; called with the mirror locked exclusively"""
+        if not os.path.isdir(self.path):
+            _git(["init", "--bare", "--quiet", self.path])
+        if self.head_sha and _has_commit(self.path, self.head_sha):
+            _count("up_to_date")
+            return
+        ref = f"refs/pull/{self.pr_number}/head"
+        depth = [f"--depth={settings.GIT_MIRROR_FETCH_DEPTH}"] if settings.GIT_MIRROR_FETCH_DEPTH > 0 else []
+        print(f"Fetching {ref} into git mirror {os.path.basename(self.path)}")
+        started = time.monotonic()
+        # No auto gc: a repack would delete packs that running readers have open
+        _git(["fetch", "--quiet", "--no-tags", "--no-auto-gc", *depth, self.remote, f"+{ref}:{ref}"], self.path,
+             env=_fetch_env(self.github_token), timeout=settings.GIT_MIRROR_FETCH_TIMEOUT)
+        observe("git_fetch", time.monotonic() - started)
+        _count("fetched")
+        evict_mirrors(keep=self.path)
+
+    def _touch(self):
+        # Most recently used, and in use: eviction skips mirrors touched in the last IN_USE_SECONDS
+        now = time.time()
+        if now - self._touched >= TOUCH_SECONDS:
+            os.utime(self.path)
+            self._touched = now
+
+    def _open(self):
+        os.makedirs(settings.GIT_MIRROR_DIR, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._fetch()
+            self._touch()
+        self._reader = subprocess.Popen(["git", "--git-dir", self.path, "cat-file", "--batch"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _ensure_ready(self):
+        # Called with self._lock held
+        if self._ready or self._failed:
+            return self._ready
+        try:
+            self._open()
+            self._ready = True
+        except (OSError, subprocess.SubprocessError) as e:
+            stderr = getattr(e, "stderr", None)
+            print(f"WARNING: git mirror unavailable for PR #{self.pr_number}, downloading files instead: {str(e)} {stderr.decode(errors='replace')[:500] if stderr else ''}")
+            _count("fetch_failed")
+            self._failed = True
+            self.close()
+        return self._ready
+
+    def read_file(self, file):
+        """Content of a listed PR file from the mirror (by its blob sha), or None"""
+        sha = file.get('sha') or ""
+        if not self.active or not _SHA.match(sha):
+            return None
+        with self._lock:
+            if not self._ensure_ready():
+                return None
+            try:
+                self._touch()
+                self._reader.stdin.write(f"{sha}\n".encode())
+                self._reader.stdin.flush()
+                header = self._reader.stdout.readline().decode().split()
+                if len(header) != 3 or header[1] != "blob":
+                    _count("missing")
+                    return None
+                content = self._reader.stdout.read(int(header[2]) + 1)[:-1]  # object, then a newline
+            except (OSError, ValueError) as e:
+                print(f"WARNING: git mirror read failed, downloading files instead: {str(e)}")
+                self._failed = True
+                self._ready = False
+                self.close()
+                return None
+        _count("read")
+        return content.decode("utf-8", errors="replace")
+
+    def close(self):
+        if self._reader is not None:
+            try:
+                self._reader.stdin.close()
+                self._reader.wait(timeout=5)
+            except (OSError, subprocess.SubprocessError):
+                self._reader.kill()
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+def pr_mirror(owner, repo, pr_number, head_sha, github_token=None, file_count=0):
+    """The PRMirror of an analysis: active with GIT_MIRROR_ENABLED for PRs of at least GIT_MIRROR_MIN_FILES files"""
+    if not settings.GIT_MIRROR_ENABLED or file_count < settings.GIT_MIRROR_MIN_FILES:
+        return PRMirror()
+    return PRMirror(owner, repo, pr_number, head_sha, github_token)
@@ -1,8 +1,30 @@
-import requests
 import base64
 from urllib.parse import urlparse
 import uuid
-from .ai_agent import analyze_code_with_llm
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.db import connections
+from .ai_agent import complete_json, build_batch_prompt, llm_error_analysis, llm_cache_key, PROMPT_TEMPLATE, HUNK_PROMPT_TEMPLATE, BATCH_PROMPT_TEMPLATE, CHUNK_NOTE, BATCH_STRUCTURE, TRIAGE_NOTE, BATCH_TRIAGE_NOTE
+from .llm_cache import get_cached_analysis, store_cached_analysis
+from .http_pool import get_connection_stats
+from .github_client import github_get, get_github_client_stats
+from .progress import publish_file_result
+from .diff_hunks import build_hunk_excerpt, remap_issue_lines, GITHUB_PATCH_CONTEXT
+from .chunking import estimate_tokens, plan_llm_requests, merge_chunk_results
+from .llm_output import parse_analysis, parse_batch_answer, coerce_analysis, LLMOutputError
+from .tiering import tier_model, split_triaged, mark_escalated, add_tier_usage, merge_tiers, with_costs
+from .file_filter import file_rules, classify_file, skipped_entry
+from .resilience import is_transient, get_resilience_stats
+from .metrics import record, new_timings, rounded, timed
+from .git_mirror import pr_mirror
+
+PR_FILES_PER_PAGE = 100  # GitHub's maximum for pulls/{n}/files
+
+_worker_slots = None
+_worker_slots_lock = threading.Lock()
 
 def get_owner_and_repo(url):
     # Remove trailing slash and parse
@@ -20,23 +42,63 @@ def get_owner_and_repo(url):
     print(f"ERROR: Could not parse owner/repo from URL: {url}")
     return None,None
 
-def fetch_pr_files(repo_url,pr_number,github_token=None):
+def iter_pr_file_pages(repo_url,pr_number,github_token=None):
+    """Yield the PR's changed files one page (up to 100 files) at a time, following Link headers.
+
+    GitHub returns 30 files per page by default and at most 3000 files per PR.
+    """
     owner,repo=get_owner_and_repo(repo_url)
     if not owner or not repo:
         raise Exception(f"Invalid repository URL format: {repo_url}. Expected format: https://github.com/owner/repo")
     
-    url=f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
-    print(f"Fetching PR files from: {url}")
+    url=f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pr_number}/files?per_page={PR_FILES_PER_PAGE}"
     headers = {}
     if github_token:
         headers["Authorization"] = f"token {github_token}"  # Fixed: space after "token"
     headers["Accept"] = "application/vnd.github.v3+json"
     
-    response=requests.get(url,headers=headers)
+    page=1
+    while url:
+        print(f"Fetching PR files page {page} from: {url}")
+        response=github_get(url,headers=headers)
+        if response.status_code == 404:
+            error_data = response.json() if response.content else {}
+            error_msg = error_data.get('message', 'Not Found')
+            raise Exception(f"GitHub API 404: PR #{pr_number} not found in {owner}/{repo}. Error: {error_msg}. Please verify the PR number exists.")
+        elif response.status_code != 200:
+            error_data = response.json() if response.content else {}
+            error_msg = error_data.get('message', response.text)
+            raise Exception(f"GitHub API error {response.status_code}: {error_msg}")
+        yield response.json()
+        url=response.links.get("next",{}).get("url")
+        page+=1
+
+def iter_pr_files(repo_url,pr_number,github_token=None):
+    for files in iter_pr_file_pages(repo_url,pr_number,github_token):
+        yield from files
+
+def fetch_pr_files(repo_url,pr_number,github_token=None):
+    return list(iter_pr_files(repo_url,pr_number,github_token))
+
+
+def fetch_pr_details(repo_url,pr_number,github_token=None,wait=True):
+    """Fetch PR metadata (head/base refs and shas, changed_files, additions...)
+
+    wait=False fails fast instead of throttling or retrying (see github_get).
+    """
+    owner,repo=get_owner_and_repo(repo_url)
+    if not owner or not repo:
+        raise Exception(f"Invalid repository URL format: {repo_url}. Expected format: https://github.com/owner/repo")
+    
+    url=f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pr_number}"
+    headers = {}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    headers["Accept"] = "application/vnd.github.v3+json"
+    
+    response=github_get(url,headers=headers,wait=wait)
     if response.status_code == 404:
-        error_data = response.json() if response.content else {}
-        error_msg = error_data.get('message', 'Not Found')
-        raise Exception(f"GitHub API 404: PR #{pr_number} not found in {owner}/{repo}. Error: {error_msg}. Please verify the PR number exists.")
+        raise Exception(f"GitHub API 404: PR #{pr_number} not found in {owner}/{repo}. Please verify the PR number exists.")
     elif response.status_code != 200:
         error_data = response.json() if response.content else {}
         error_msg = error_data.get('message', response.text)
@@ -44,6 +106,30 @@ def fetch_pr_files(repo_url,pr_number,github_token=None):
     return response.json()
 
 
+def fetch_open_pr_numbers(repo_url,github_token=None):
+    """Numbers of every open PR of a repository, listed 100 per page (oldest first)"""
+    owner,repo=get_owner_and_repo(repo_url)
+    if not owner or not repo:
+        raise Exception(f"Invalid repository URL format: {repo_url}. Expected format: https://github.com/owner/repo")
+
+    url=f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}/pulls?state=open&sort=created&direction=asc&per_page=100"
+    headers = {}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    headers["Accept"] = "application/vnd.github.v3+json"
+
+    numbers=[]
+    while url:
+        response=github_get(url,headers=headers)
+        if response.status_code != 200:
+            error_data = response.json() if response.content else {}
+            error_msg = error_data.get('message', response.text)
+            raise Exception(f"GitHub API error {response.status_code} listing open PRs of {owner}/{repo}: {error_msg}")
+        numbers.extend(pull['number'] for pull in response.json())
+        url=response.links.get("next",{}).get("url")
+    return numbers
+
+
 def fetch_file_content_from_raw_url(raw_url, github_token=None):
     """Fetch file content directly from raw_url (works for PR files)"""
     headers = {}
@@ -51,7 +137,7 @@ def fetch_file_content_from_raw_url(raw_url, github_token=None):
         headers["Authorization"] = f"token {github_token}"
     headers["Accept"] = "text/plain"
     
-    response = requests.get(raw_url, headers=headers)
+    response = github_get(raw_url, headers=headers)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch file from raw_url: {response.status_code} {response.text}")
     return response.text
@@ -62,7 +148,7 @@ def fetch_file_content(repo_url,file_path,github_token=None,ref=None):
     if not owner or not repo:
         raise Exception(f"Invalid repository URL format: {repo_url}")
     
-    url=f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}"
+    url=f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}/contents/{file_path}"
     if ref:
         url += f"?ref={ref}"
     
@@ -71,57 +157,500 @@ def fetch_file_content(repo_url,file_path,github_token=None,ref=None):
         headers["Authorization"] = f"token {github_token}"
     headers["Accept"] = "application/vnd.github.v3+json"
     
-    response=requests.get(url,headers=headers)
+    response=github_get(url,headers=headers)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch file {file_path}: {response.status_code} {response.text}")
     content=response.json()
     return base64.b64decode(content['content']).decode()
 
-def analyze_pr(repo_url,pr_number,github_token=None,task_id=None):
+def _get_worker_slots():
+    """Process-wide semaphore capping in-flight file analyses across all tasks in this worker"""
+    global _worker_slots
+    if _worker_slots is None:
+        with _worker_slots_lock:
+            if _worker_slots is None:
+                _worker_slots = threading.BoundedSemaphore(settings.PR_ANALYSIS_WORKER_MAX_CONCURRENCY)
+    return _worker_slots
+
+def _fetch_new_content(repo_url,file,github_token=None,mirror=None):
+    # The repository's local git mirror (GIT_MIRROR_ENABLED) saves one download per file
+    content=mirror.read_file(file) if mirror is not None else None
+    if content is not None:
+        return content
+    # Use raw_url from PR files response (includes correct branch/ref)
+    if 'raw_url' in file:
+        print(f"  Using raw_url: {file['raw_url']}")
+        return fetch_file_content_from_raw_url(file['raw_url'], github_token)
+    # Fallback to contents API (might not work for PR files)
+    print(f"  Using contents API (fallback)")
+    return fetch_file_content(repo_url, file['filename'], github_token)
+
+def new_file_item(index,file,review_mode,context_lines):
+    """(hunks_only, item) for one PR file: the item carries "index", "file_name", "sha", "cache_key" and
+    the listed "file" (to park it for a later retry)
+
+    Files without a patch (binary or too large for GitHub to diff) are reviewed in full even in
+    hunks mode.
+    """
+    blob_sha=file.get('sha')
+    hunks_only=review_mode=="hunks" and bool(file.get('patch'))
+    if hunks_only:
+        scope=f":hunks:{context_lines}:{hashlib.sha256(file['patch'].encode()).hexdigest()}"
+        cache_key=llm_cache_key(blob_sha,file['filename'],HUNK_PROMPT_TEMPLATE,scope) if blob_sha else None
+    else:
+        cache_key=llm_cache_key(blob_sha,file['filename']) if blob_sha else None
+    return hunks_only,{"index":index,"file_name":file['filename'],"sha":blob_sha,"cache_key":cache_key,"file":file}
+
+def needs_new_content(hunks_only,context_lines):
+    # Hunk excerpts only need the new file when asking for more context than the patch carries
+    return not hunks_only or context_lines>GITHUB_PATCH_CONTEXT
+
+def set_llm_input(item,file,new_content,hunks_only,context_lines):
+    """Fill in "llm_input", "line_map" and "prompt_template"; new_content is the file's new
+    version (may be None in hunks mode when the patch's own context is enough)"""
+    if hunks_only:
+        item["llm_input"],item["line_map"]=build_hunk_excerpt(file['patch'],context_lines,new_content)
+        item["prompt_template"]=HUNK_PROMPT_TEMPLATE
+    else:
+        item["llm_input"]=new_content
+        item["line_map"]=None
+        item["prompt_template"]=PROMPT_TEMPLATE
+
+def file_error_entry(file_name,error):
+    return {
+        "file_name": file_name,
+        "analysis": {"issues": [{"type": "error", "description": f"Failed to analyze file: {str(error)}", "suggestion": "Please check file access"}]}
+    }
+
+def parked_entry(file_name,error):
+    # Groq or GitHub kept failing: no made-up issue, the file is retried later (retry_parked_task)
+    return {"file_name":file_name,"analysis":{"issues":[]},"parked":str(error)}
+
+def failed_file_entry(file_name,error):
+    """Entry of a file whose fetch or review failed: parked if the failure was transient"""
+    return parked_entry(file_name,error) if is_transient(error) else file_error_entry(file_name,error)
+
+def prepare_file(repo_url,index,file,github_token=None,review_mode="full",context_lines=GITHUB_PATCH_CONTEXT,mirror=None):
+    """Cache lookup and content fetch for one PR file; never raises.
+
+    Returns a dict with "index", "file_name", "sha" and "cache_key", plus either "result" (a
+    finished entry: cache hit or fetch error) or "llm_input", "prompt_template" and "line_map"
+    for the LLM stage. review_mode "hunks" uses only the changed hunks from the file's patch
+    (plus context_lines of context); files without a patch (binary or too large for GitHub to
+    diff) fall back to the full content. Contents come from mirror (a PRMirror) when it has them.
+    """
+    file_name=file['filename']
+    hunks_only,item=new_file_item(index,file,review_mode,context_lines)
+    cache_key=item["cache_key"]
+    with _get_worker_slots():
+        print(f"Preparing file: {file_name}")
+        try:
+            # A cache hit on the blob sha skips both the raw fetch and the LLM call
+            if cache_key:
+                cached=get_cached_analysis(cache_key)
+                if cached is not None:
+                    print(f"✓ Cache hit for {file_name}")
+                    item["result"]={"analysis":cached,"file_name":file_name,"sha":item["sha"],"cached":True}
+                    return item
+            
+            # The patch already carries GitHub's context lines; wider context needs the full file
+            new_content=None
+            if needs_new_content(hunks_only,context_lines):
+                new_content,item["fetch_seconds"]=timed(_fetch_new_content,repo_url,file,github_token,mirror)
+                item["fetched_bytes"]=len(new_content.encode())
+            set_llm_input(item,file,new_content,hunks_only,context_lines)
+            return item
+        except Exception as file_error:
+            print(f"ERROR fetching file {file_name}: {str(file_error)}")
+            import traceback
+            traceback.print_exc()
+            item["result"]=failed_file_entry(file_name,file_error)
+            return item
+        finally:
+            # Pool threads open their own DB connections (cache fallback); close them before the thread exits
+            connections.close_all()
+
+# Width of the line number column in front of each line of a full-file piece, f"{line:>5} "
+LINE_NUMBER_CHARS=6
+
+def single_file_prompt(item,unit=None,triage=False):
+    content=item["llm_input"]
+    if unit is not None and unit["kind"]=="chunk":
+        if item["line_map"] is None:
+            # Number full-file lines so answers for a piece refer to real file lines
+            lines=unit["text"].splitlines()
+            content="\n".join(f"{unit['start_line']+i:>5} {line}" for i,line in enumerate(lines))
+        else:
+            content=unit["text"]
+        content=CHUNK_NOTE.format(part=unit["part"],parts=unit["parts"])+content
+    prompt=item["prompt_template"].format(file_name=item["file_name"],file_content=content)
+    return prompt+TRIAGE_NOTE if triage else prompt
+
+def batch_prompt(items,triage=False):
+    prompt=build_batch_prompt([(item["file_name"],item["llm_input"]) for item in items])
+    return prompt+BATCH_TRIAGE_NOTE if triage else prompt
+
+def _answer_unit(unit,items,complete,tier,answers):
+    """Append (index, analysis, error) for the items of unit answered by one tier's model"""
+    triage=tier=="triage"
+    label=f" [{tier}]" if settings.LLM_TIERING_ENABLED else ""
+    if unit["kind"]=="batch":
+        print(f"Analyzing batch of {len(items)} files{label}: {', '.join(item['file_name'] for item in items)}")
+        names=[item["file_name"] for item in items]
+        try:
+            per_file=complete(batch_prompt(items,triage),lambda text:parse_batch_answer(text,names,triage),tier,structure=BATCH_STRUCTURE)
+        except LLMOutputError as output_error:
+            print(f"  Batch answer unusable ({str(output_error)}), retrying its files singly")
+            per_file={}
+        for item in items:
+            if item["file_name"] in per_file:
+                answers.append((item["index"],per_file[item["file_name"]],None))
+                continue
+            # Missing from the batched answer: review it on its own
+            print(f"  {item['file_name']} missing from batch answer, retrying singly")
+            try:
+                answers.append((item["index"],complete(single_file_prompt(item,triage=triage),lambda text:parse_analysis(text,triage),tier),None))
+            except Exception as llm_error:
+                answers.append((item["index"],None,llm_error))
+    else:
+        item=items[0]
+        if unit["kind"]=="chunk":
+            print(f"Analyzing {item['file_name']} part {unit['part']}/{unit['parts']}{label}")
+        else:
+            print(f"Analyzing file: {item['file_name']}{label}")
+        answers.append((item["index"],complete(single_file_prompt(item,unit,triage),lambda text:parse_analysis(text,triage),tier),None))
+
+def run_llm_unit(unit):
+    """Send one planned LLM request; never raises.
+
+    Returns (answers, usage) where answers is a list of (index, analysis, error) with analysis
+    the parsed and validated dict, and usage holds the actual token counts of every request made
+    (repair requests included; a batch may retry missing files singly), also per model tier.
+    With LLM_TIERING_ENABLED the unit goes to the triage model first and only the files it rates
+    risky or complex are sent again to the review model.
+    """
+    usage={"requests":0,"prompt_tokens":0,"completion_tokens":0,"tiers":{}}
+    def complete(prompt,parse,tier,**kwargs):
+        value,call_usage=complete_json(prompt,parse,model=tier_model(tier),**kwargs)
+        add_usage(usage,call_usage,tier)
+        return value
+    
+    answers=[]
+    ratings={}
+    with _get_worker_slots():
+        try:
+            items=unit["items"]
+            if settings.LLM_TIERING_ENABLED:
+                triaged=[]
+                try:
+                    _answer_unit(unit,items,complete,"triage",triaged)
+                except Exception as triage_error:
+                    # A failed triage never fails the file: the review model takes it
+                    print(f"  Triage failed ({str(triage_error)}), escalating")
+                kept,items,ratings=split_triaged(unit["items"],triaged)
+                answers.extend(kept)
+            if items:
+                _answer_unit(unit,items,complete,"review",answers)
+        except Exception as llm_error:
+            print(f"ERROR in Groq API call: {str(llm_error)}")
+            answered={index for index,_,_ in answers}
+            answers.extend((item["index"],None,llm_error) for item in unit["items"] if item["index"] not in answered)
+        finally:
+            connections.close_all()
+    if settings.LLM_TIERING_ENABLED:
+        answers=mark_escalated(answers,ratings)
+    return answers,usage
+
+def finish_file(item,answers):
+    """Turn the LLM answers for one prepared file into its result entry and cache it"""
+    file_name=item["file_name"]
+    errors=[error for _,error in answers if error is not None]
+    if errors:
+        print(f"ERROR in Groq API call for {file_name}: {str(errors[0])}")
+        # Failed entries carry no sha, so incremental runs never reuse them
+        if all(is_transient(error) for error in errors):
+            return parked_entry(file_name,errors[0])
+        return {"analysis":llm_error_analysis(str(errors[0])),"file_name":file_name}
+    analyses=[analysis for analysis,_ in answers]
+    analysis_result=analyses[0] if len(analyses)==1 else merge_chunk_results(analyses)
+    if item["line_map"] is not None:
+        analysis_result=remap_issue_lines(analysis_result,item["line_map"])
+    # Only successful completions are cached
+    if item["cache_key"]:
+        store_cached_analysis(item["cache_key"],analysis_result)
+    print(f"✓ Completed analysis for {file_name}")
+    return {"analysis":analysis_result,"file_name":file_name,"sha":item["sha"]}
+
+def new_token_usage():
+    return {"planned_prompt_tokens":0,"prompt_tokens":0,"completion_tokens":0,"requests":0,"batched_files":0,"chunked_files":0,"triaged_files":0,"escalated_files":0,"tiers":{},"skipped_files":{},"llm_calls_avoided":0}
+
+def add_usage(token_usage,usage,tier=None):
+    """Add one completion's usage (booked under tier) or one unit's usage (with its "tiers")"""
+    for key in ("requests","prompt_tokens","completion_tokens"):
+        token_usage[key]+=usage[key]
+    if tier:
+        add_tier_usage(token_usage["tiers"],tier,usage)
+    merge_tiers(token_usage["tiers"],usage.get("tiers",{}))
+
+def merge_token_usage(token_usage,other):
+    """Add the token_usage of one subtask of a split analysis"""
+    for key,value in other.items():
+        # setdefault: stored usage of older analyses may lack the newer counters
+        if key=="tiers":
+            merge_tiers(token_usage.setdefault("tiers",{}),value)
+        elif key=="skipped_files":
+            skipped=token_usage.setdefault(key,{})
+            for reason,count in value.items():
+                skipped[reason]=skipped.get(reason,0)+count
+        elif key!="cost_usd" and isinstance(value,(int,float)):
+            token_usage[key]=token_usage.get(key,0)+value
+
+def count_tiering(token_usage,entry):
+    # Finished files only, so a file reviewed in pieces counts once
+    triage=entry["analysis"].get("triage") if isinstance(entry.get("analysis"),dict) else None
+    if triage:
+        token_usage["triaged_files"]+=1
+        token_usage["escalated_files"]+=int(triage.get("escalated",False))
+
+def skip_file(rules,file,token_usage):
+    """The skipped entry of file if the filter rules exclude it (counted in token_usage), else None"""
+    skipped=classify_file(rules,file)
+    if skipped is None:
+        return None
+    reason,summary=skipped
+    print(f"Skipping {file['filename']}: {summary}")
+    token_usage["skipped_files"][reason]=token_usage["skipped_files"].get(reason,0)+1
+    # Counted as one request per file, as in single-file review
+    token_usage["llm_calls_avoided"]+=1
+    return skipped_entry(file,reason,summary)
+
+def count_listing(timings,samples,seconds):
+    timings["list_seconds"]+=seconds
+    timings["pages_listed"]+=1
+    samples.append(("list",seconds))
+
+def count_fetch(timings,samples,item):
+    # Cache hits and hunk excerpts that fit the patch fetch nothing
+    if "fetch_seconds" in item:
+        timings["fetch_seconds"]+=item["fetch_seconds"]
+        timings["files_fetched"]+=1
+        timings["bytes_fetched"]+=item["fetched_bytes"]
+        samples.append(("fetch",item["fetch_seconds"]))
+
+def file_outcome(entry):
+    """How a file finished, for pr_analysis_files_total"""
+    for outcome in ("skipped","parked","carried_forward","cached"):
+        if entry.get(outcome):
+            return outcome
+    # Failed entries carry no sha (see file_error_entry and finish_file)
+    return "reviewed" if "sha" in entry else "error"
+
+def plan_units(pending,token_usage):
+    """Plan the LLM requests for prepared files and count them in token_usage"""
+    # Budget every prompt as single_file_prompt and batch_prompt build it, triage notes included
+    tiering=settings.LLM_TIERING_ENABLED
+    for item in pending:
+        item["overhead_tokens"]=estimate_tokens(item["prompt_template"])+(estimate_tokens(TRIAGE_NOTE) if tiering else 0)
+        item["line_prefix_chars"]=LINE_NUMBER_CHARS if item["line_map"] is None else 0
+    units=plan_llm_requests(
+        pending,
+        settings.PR_ANALYSIS_MAX_PROMPT_TOKENS,
+        settings.PR_ANALYSIS_BATCH_MAX_TOKENS,
+        settings.PR_ANALYSIS_BATCH_MAX_FILES,
+        prompt_overhead_tokens=estimate_tokens(BATCH_PROMPT_TEMPLATE)+(estimate_tokens(BATCH_TRIAGE_NOTE) if tiering else 0),
+        # The placeholders are at least as long as the part numbers they become
+        chunk_overhead_tokens=estimate_tokens(CHUNK_NOTE),
+    )
+    token_usage["planned_prompt_tokens"]+=sum(unit["planned_tokens"] for unit in units)
+    token_usage["batched_files"]+=sum(len(unit["items"]) for unit in units if unit["kind"]=="batch")
+    token_usage["chunked_files"]+=len({unit["items"][0]["index"] for unit in units if unit["kind"]=="chunk"})
+    print(f"Planned {len(units)} LLM requests for {len(pending)} files")
+    return units
+
+def previous_entries_by_name(previous_result):
+    if not previous_result:
+        return {}
+    return {entry.get("file_name"):entry for entry in previous_result if isinstance(entry,dict) and entry.get("sha")}
+
+def carry_forward(previous_by_name,file):
+    """The earlier entry for file if its blob sha is unchanged (same content, same analysis), else None"""
+    previous=previous_by_name.get(file['filename'])
+    # Skipped entries are not reviews; the file is classified again under the current rules
+    if previous and not previous.get("skipped") and previous["sha"]==file.get('sha'):
+        # Entries saved before analyses were stored natively are parsed once here
+        return dict(previous,analysis=coerce_analysis(previous.get("analysis")),carried_forward=True)
+    return None
+
+def parked_files(results,listed,first_index=0):
+    """[index in the PR, listed file] of every parked entry, for retry_parked_task"""
+    return [[first_index+index,listed[index]] for index,entry in enumerate(results) if entry and entry.get("parked")]
+
+def finished_result(task_id,head_sha,results,carried,previous_result,token_usage,engine,parked=None,timings=None,samples=()):
+    """Result dict of a completed analysis, with token usage, timings and connection stats for this process.
+
+    Records the run's stage latencies (samples: (stage, seconds) pairs), file outcomes and
+    fetched bytes in the shared metrics.
+    """
+    print(f"Found {len(results)} files in PR at head {head_sha}")
+    if previous_result:
+        print(f"Incremental mode: carried forward {carried} unchanged files")
+    if len(results) == 0:
+        print(f"WARNING: PR has no files changed")
+        return {"task_id":task_id,"head_sha":head_sha,"result":[{"file_name": "No files", "analysis": {"issues": [{"type": "info", "description": "This PR has no files changed", "suggestion": "No analysis needed"}]}}]}
+    
+    with_costs(token_usage)
+    timings=rounded(dict(timings or new_timings(),llm_seconds=sum(tier["seconds"] for tier in token_usage["tiers"].values())))
+    outcomes={}
+    for entry in results:
+        outcome=file_outcome(entry)
+        outcomes[outcome]=outcomes.get(outcome,0)+1
+    record(
+        observations=samples,
+        counters=[("pr_analysis_files_total",count,{"outcome":outcome}) for outcome,count in outcomes.items()]+[("pr_analysis_fetched_bytes_total",timings["bytes_fetched"],{})],
+    )
+    connection_stats=get_connection_stats()
+    connection_stats["github_client"]=get_github_client_stats()
+    connection_stats["engine"]=engine
+    connection_stats["resilience"]=get_resilience_stats()["process"]
+    if parked:
+        print(f"Parked {len(parked)} files for a later retry")
+    print(f"Analysis complete: {len(results)} files analyzed ({engine} engine), token usage: {token_usage}, timings: {timings}, connections: {connection_stats}")
+    return {"task_id":task_id,"head_sha":head_sha,"result":results,"carried_forward":carried,"token_usage":token_usage,"timings":timings,"connection_stats":connection_stats,"parked_files":parked or []}
+
+def open_mirror(repo_url,pr_number,head_sha,github_token,file_count):
+    """The PRMirror an analysis reads file contents from (inactive unless enabled and the PR is big enough)"""
+    owner,repo=get_owner_and_repo(repo_url)
+    return pr_mirror(owner,repo,pr_number,head_sha,github_token,file_count)
+
+def failed_result(task_id,error):
+    print(f"ERROR in analyze_pr: {str(error)}")
+    import traceback
+    traceback.print_exc()
+    return {"task_id":task_id,"result":[{"file_name": "Error", "analysis": {"issues": [{"type": "error", "description": f"Analysis failed: {str(error)}", "suggestion": "Please check repository URL and PR number"}]}}]}
+
+def analyze_pr(repo_url,pr_number,github_token=None,task_id=None,max_concurrency=None,previous_result=None,review_mode=None,files=None,head_sha=None,first_index=0):
+    """Analyze every file of a PR.
+
+    The file list is paginated; each page is prepared (cache lookup, content fetch) and its
+    LLM requests start while later pages are still downloading. Requests are planned by tokens:
+    oversized files are split into pieces on definition boundaries and small files are packed
+    into batched requests up to a token budget. The returned token_usage compares planned and
+    actual prompt tokens.
+
+    Files the repository's filter rules exclude (deleted files, pure renames, binaries, lock
+    files, minified or vendored code, oversized diffs) are recorded as skipped from the file
+    list alone, before any download.
+
+    previous_result enables incremental mode: per-file entries from an earlier run whose blob sha
+    matches the current file are carried forward instead of being fetched and analyzed again.
+    review_mode is "full" (whole files) or "hunks" (changed hunks only), defaulting to settings.
+    Every finished file is published to the task's event stream as soon as it is ready.
+    With GIT_MIRROR_ENABLED, contents of big PRs are read from a local git mirror of the
+    repository (one fetch per PR head) instead of being downloaded one by one.
+
+    files/head_sha/first_index analyze one slice of an already listed PR (a batch of a split
+    analysis): no listing, and events are published at first_index + the file's position.
+    """
     # Use provided task_id or generate one if not provided (for backward compatibility)
     if task_id is None:
         task_id = str(uuid.uuid4())
+    if max_concurrency is None:
+        max_concurrency = settings.PR_ANALYSIS_MAX_CONCURRENCY
+    if review_mode is None:
+        review_mode = settings.PR_ANALYSIS_REVIEW_MODE
+    context_lines = settings.PR_ANALYSIS_HUNK_CONTEXT_LINES
     try:
         print(f"Starting analysis for PR #{pr_number} in {repo_url}")
-        pr_files=fetch_pr_files(repo_url,pr_number,github_token)
-        print(f"Found {len(pr_files)} files in PR")
+        file_count=len(files) if files is not None else 0
+        if head_sha is None:
+            details=fetch_pr_details(repo_url,pr_number,github_token)
+            head_sha=details['head']['sha']
+            file_count=details.get('changed_files',0)
+        previous_by_name=previous_entries_by_name(previous_result)
+        rules=file_rules(repo_url)
         
-        if len(pr_files) == 0:
-            print(f"WARNING: PR #{pr_number} has no files changed")
-            return {"task_id":task_id,"result":[{"file_name": "No files", "analysis": '{"issues": [{"type": "info", "description": "This PR has no files changed", "suggestion": "No analysis needed"}]}'}]}
+        results=[]
+        listed=[]             # listed file of every result, to park failed ones
+        carried=0
+        token_usage=new_token_usage()
+        timings=new_timings()
+        samples=[]            # (stage, seconds) of every page listed and file fetched
+        page_preparations=[]  # prepare futures of each listed page, in page order
+        running={}            # LLM unit future -> unit
+        outstanding={}        # file index -> [prepared item, unit answers still expected]
+        answers_by_index={}
         
-        analysis_results=[]
-        for idx, file in enumerate(pr_files, 1):
-            file_name=file['filename']
-            print(f"Analyzing file {idx}/{len(pr_files)}: {file_name}")
-            try:
-                # Use raw_url from PR files response (includes correct branch/ref)
-                if 'raw_url' in file:
-                    print(f"  Using raw_url: {file['raw_url']}")
-                    raw_content = fetch_file_content_from_raw_url(file['raw_url'], github_token)
-                else:
-                    # Fallback to contents API (might not work for PR files)
-                    print(f"  Using contents API (fallback)")
-                    raw_content = fetch_file_content(repo_url, file_name, github_token)
-                
-                analysis_result=analyze_code_with_llm(raw_content,file_name)
-                analysis_results.append({"analysis":analysis_result,"file_name":file_name})
-                print(f"✓ Completed analysis for {file_name}")
-            except Exception as file_error:
-                print(f"ERROR analyzing file {file_name}: {str(file_error)}")
-                import traceback
-                traceback.print_exc()
-                analysis_results.append({
-                    "file_name": file_name,
-                    "analysis": f'{{"issues": [{{"type": "error", "description": "Failed to analyze file: {str(file_error)}", "suggestion": "Please check file access"}}]}}'
-                })
+        def plan_ready_pages():
+            # A page is planned once all its files are prepared, so its LLM requests start
+            # while later pages are still being listed
+            while page_preparations and all(future.done() for future in page_preparations[0]):
+                pending=[]
+                for future in page_preparations.pop(0):
+                    item=future.result()
+                    count_fetch(timings,samples,item)
+                    if "result" in item:
+                        results[item["index"]]=item["result"]
+                        publish_file_result(task_id,first_index+item["index"],item["result"])
+                    else:
+                        pending.append(item)
+                for unit in plan_units(pending,token_usage):
+                    for item in unit["items"]:
+                        outstanding.setdefault(item["index"],[item,0])[1]+=1
+                    running[executor.submit(run_llm_unit,unit)]=unit
         
-        print(f"Analysis complete: {len(analysis_results)} files analyzed")
-        return {"task_id":task_id,"result":analysis_results}
+        def collect_answers():
+            for future in [future for future in running if future.done()]:
+                unit=running.pop(future)
+                answers,usage=future.result()
+                add_usage(token_usage,usage)
+                for index,analysis,error in answers:
+                    answers_by_index.setdefault(index,[]).append((unit.get("part",1),analysis,error))
+                    outstanding[index][1]-=1
+                    if outstanding[index][1]==0:
+                        item=outstanding.pop(index)[0]
+                        # Chunk answers may finish out of order; merge them in part order
+                        ordered=[(analysis,error) for _,analysis,error in sorted(answers_by_index.pop(index),key=lambda answer:answer[0])]
+                        results[index]=finish_file(item,ordered)
+                        count_tiering(token_usage,results[index])
+                        publish_file_result(task_id,first_index+index,results[index])
+        
+        # Pages are listed on their own thread; the loop below reacts to whichever of listing,
+        # preparation or LLM work finishes first
+        pages=iter([files]) if files is not None else iter_pr_file_pages(repo_url,pr_number,github_token)
+        # The mirror is closed last, once no preparation can read from it
+        with open_mirror(repo_url,pr_number,head_sha,github_token,file_count) as mirror, ThreadPoolExecutor(max_workers=1) as lister, ThreadPoolExecutor(max_workers=max(1,max_concurrency)) as executor:
+            next_page=lister.submit(timed,next,pages,None)
+            while next_page or page_preparations or running:
+                waiting=list(running)+(page_preparations[0] if page_preparations else [])+([next_page] if next_page else [])
+                wait(waiting,return_when=FIRST_COMPLETED)
+                if next_page and next_page.done():
+                    page,seconds=next_page.result()
+                    next_page=lister.submit(timed,next,pages,None) if page is not None else None
+                    if page is not None and files is None:
+                        count_listing(timings,samples,seconds)
+                    preparations=[]
+                    for file in page or []:
+                        index=len(results)
+                        listed.append(file)
+                        skipped=skip_file(rules,file,token_usage)
+                        if skipped:
+                            results.append(skipped)
+                            publish_file_result(task_id,first_index+index,skipped)
+                            continue
+                        carried_entry=carry_forward(previous_by_name,file)
+                        if carried_entry:
+                            results.append(carried_entry)
+                            publish_file_result(task_id,first_index+index,results[index])
+                            carried+=1
+                            continue
+                        results.append(None)
+                        preparations.append(executor.submit(prepare_file,repo_url,index,file,github_token,review_mode,context_lines,mirror))
+                    if page is not None:
+                        print(f"Listed {len(results)} files so far ({review_mode} mode, up to {max_concurrency} in flight)")
+                        page_preparations.append(preparations)
+                plan_ready_pages()
+                collect_answers()
+        
+        return finished_result(task_id,head_sha,results,carried,previous_result,token_usage,"sync",parked_files(results,listed,first_index),timings,samples)
     except Exception as e:
-        print(f"ERROR in analyze_pr: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {"task_id":task_id,"result":[{"file_name": "Error", "analysis": f'{{"issues": [{{"type": "error", "description": "Analysis failed: {str(e)}", "suggestion": "Please check repository URL and PR number"}}]}}'}]}
-
-
+        return failed_result(task_id,e)
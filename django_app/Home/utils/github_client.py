@@ -0,0 +1,271 @@
+import hashlib
+import json
+import time
+from urllib.parse import urlparse
+import redis
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
+from django.conf import settings
+from .http_pool import pooled_get
+from .resilience import guarded_call, record_throttled, TransientHTTPError
+from .redis_client import get_redis, mark_redis_down
+
+# Redis layout
+ETAG_KEY_PREFIX = "github:etag:"        # hash per (url, credentials): etag, last_modified, link, body
+BUCKET_KEY_PREFIX = "github:bucket:"    # token bucket per credentials, shared by all workers
+QUOTA_KEY_PREFIX = "github:quota:"      # last X-RateLimit-Remaining/Reset seen per credentials
+STATS_KEY = "github:stats"
+
+# Refill the bucket and take one token; returns the seconds to wait (0 when a token was taken).
+# Uses the Redis clock so every worker agrees on time.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Registered once; every call passes the current client, which changes after mark_redis_down
+_token_bucket = None
+
+
+class GitHubRateLimitError(Exception):
+    """Raised when waiting for GitHub quota would exceed GITHUB_RATE_LIMIT_MAX_WAIT"""
+
+
+class CachedResponse:
+    """Stand-in for requests.Response rebuilt from the ETag cache after a 304"""
+
+    def __init__(self, url, body, link=""):
+        self.url = url
+        self.status_code = 200
+        self.content = body
+        self.headers = CaseInsensitiveDict({"Link": link} if link else {})
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def links(self):
+        link = self.headers.get("Link")
+        if not link:
+            return {}
+        return {entry.get("rel") or entry.get("url"): entry for entry in parse_header_links(link)}
+
+
+def _credentials_id(headers):
+    # Cache entries and quota are per token: never serve one token's private data to another
+    auth = (headers or {}).get("Authorization", "")
+    return hashlib.sha256(auth.encode()).hexdigest()[:16] if auth else "anonymous"
+
+
+def _counts_against_quota(url):
+    # Only the REST API is rate limited; raw file downloads are not
+    return urlparse(url).netloc == urlparse(settings.GITHUB_API_URL).netloc
+
+
+def _bump(client, stat, amount=1):
+    try:
+        client.hincrbyfloat(STATS_KEY, stat, amount)
+    except redis.RedisError:
+        mark_redis_down()
+
+
+def _throttle(client, credentials, authenticated, wait=True):
+    """Wait for a token from the shared bucket and for quota reported by GitHub.
+
+    With wait=False any wait raises GitHubRateLimitError instead.
+    """
+    global _token_bucket
+    per_hour = settings.GITHUB_RATE_LIMIT_PER_HOUR if authenticated else settings.GITHUB_ANON_RATE_LIMIT_PER_HOUR
+    rate = per_hour / 3600.0
+    waited = 0.0
+    try:
+        # Quota reported by GitHub itself: stop before it runs out, until the window resets
+        quota = client.hgetall(QUOTA_KEY_PREFIX + credentials)
+        if quota:
+            remaining = int(quota.get(b"remaining", 1 << 30))
+            reset = float(quota.get(b"reset", 0))
+            delay = reset - time.time()
+            if remaining <= settings.GITHUB_RATE_LIMIT_RESERVE and delay > 0:
+                if not wait or delay > settings.GITHUB_RATE_LIMIT_MAX_WAIT:
+                    raise GitHubRateLimitError(f"GitHub quota nearly exhausted ({remaining} left), resets in {int(delay)}s")
+                print(f"GitHub quota low ({remaining} left), waiting {int(delay)}s for reset")
+                time.sleep(delay)
+                waited += delay
+        if _token_bucket is None:
+            _token_bucket = client.register_script(TOKEN_BUCKET_SCRIPT)
+        while True:
+            delay = float(_token_bucket(keys=[BUCKET_KEY_PREFIX + credentials], args=[settings.GITHUB_RATE_LIMIT_BURST, rate], client=client))
+            if delay <= 0:
+                break
+            if not wait or waited + delay > settings.GITHUB_RATE_LIMIT_MAX_WAIT:
+                raise GitHubRateLimitError(f"GitHub request budget exhausted, next slot in {int(delay)}s")
+            time.sleep(delay)
+            waited += delay
+    except redis.RedisError as e:
+        print(f"WARNING: GitHub throttling skipped, Redis error: {str(e)}")
+        mark_redis_down()
+        return
+    if waited:
+        _bump(client, "throttled_seconds", waited)
+
+
+def _record_quota(client, credentials, response):
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    if remaining is None or reset is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.hset(QUOTA_KEY_PREFIX + credentials, mapping={"remaining": remaining, "reset": reset})
+        pipe.expireat(QUOTA_KEY_PREFIX + credentials, int(float(reset)) + 60)
+        pipe.execute()
+    except redis.RedisError:
+        mark_redis_down()
+
+
+def _retry_delay(response):
+    """Seconds to wait before retrying a rate-limited response, or None if it is not one"""
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        return float(retry_after)
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return max(0.0, float(response.headers.get("X-RateLimit-Reset", time.time())) - time.time())
+    return None
+
+
+def _checked_server_error(response):
+    if response.status_code >= 500:
+        raise TransientHTTPError(response.status_code, response.reason, float(response.headers.get("Retry-After") or 0) or None)
+    return response
+
+
+def guarded_get(url, headers=None):
+    """pooled_get with connection errors, timeouts and 5xx retried under the GitHub breaker"""
+    return guarded_call("github", lambda: _checked_server_error(pooled_get(url, headers=headers)))
+
+
+def _quick_get(url, headers=None):
+    """One attempt with the short GITHUB_INLINE_TIMEOUT, for calls made while a client waits"""
+    return _checked_server_error(pooled_get(url, headers=headers, timeout=settings.GITHUB_INLINE_TIMEOUT))
+
+
+def github_get(url, headers=None, wait=True):
+    """GET a GitHub URL with conditional-request caching and shared rate limiting.
+
+    A stored ETag/Last-Modified is sent as If-None-Match/If-Modified-Since; a 304 (free against
+    the quota) is answered from the cache. REST API calls take a token from a Redis token bucket
+    shared by all workers and wait when GitHub reports the quota close to exhausted. Rate-limited
+    responses are retried after Retry-After/X-RateLimit-Reset. Without Redis this is a plain GET.
+    Transient failures are retried with backoff by the resilience layer either way.
+
+    With wait=False (calls made inside an HTTP request) nothing waits or retries: one attempt with
+    GITHUB_INLINE_TIMEOUT, and GitHubRateLimitError wherever throttling would have waited.
+    """
+    headers = dict(headers or {})
+    get = guarded_get if wait else _quick_get
+    client = get_redis()
+    if client is None:
+        return get(url, headers=headers)
+
+    credentials = _credentials_id(headers)
+    limited = _counts_against_quota(url)
+    cache_key = ETAG_KEY_PREFIX + hashlib.sha256(f"{credentials}:{headers.get('Accept', '')}:{url}".encode()).hexdigest()
+    cached = {}
+    if settings.GITHUB_ETAG_CACHE_ENABLED:
+        try:
+            cached = client.hgetall(cache_key)
+        except redis.RedisError:
+            mark_redis_down()
+    if cached.get(b"etag"):
+        headers["If-None-Match"] = cached[b"etag"].decode()
+    elif cached.get(b"last_modified"):
+        headers["If-Modified-Since"] = cached[b"last_modified"].decode()
+
+    retries = settings.GITHUB_RATE_LIMIT_RETRIES if wait else 0
+    for attempt in range(retries + 1):
+        if limited:
+            _throttle(client, credentials, authenticated="Authorization" in headers, wait=wait)
+        response = get(url, headers=headers)
+        if limited:
+            _record_quota(client, credentials, response)
+        delay = _retry_delay(response)
+        if delay is None or attempt == retries:
+            break
+        if delay > settings.GITHUB_RATE_LIMIT_MAX_WAIT:
+            raise GitHubRateLimitError(f"GitHub rate limit hit, retry after {int(delay)}s")
+        print(f"GitHub rate limited ({response.status_code}), retrying in {int(delay)}s")
+        _bump(client, "rate_limited")
+        record_throttled("github")
+        time.sleep(delay)
+
+    if response.status_code == 304 and cached.get(b"body") is not None:
+        _bump(client, "not_modified")
+        if limited:
+            # 304s do not count against GitHub's quota, so give the token back
+            try:
+                client.hincrbyfloat(BUCKET_KEY_PREFIX + credentials, "tokens", 1)
+            except redis.RedisError:
+                mark_redis_down()
+        return CachedResponse(url, cached[b"body"], cached.get(b"link", b"").decode())
+    if response.status_code == 304:
+        # The cached body vanished between the lookup and the response; ask again unconditionally
+        headers.pop("If-None-Match", None)
+        headers.pop("If-Modified-Since", None)
+        response = get(url, headers=headers)
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if (
+        settings.GITHUB_ETAG_CACHE_ENABLED
+        and response.status_code == 200
+        and (etag or last_modified)
+        and len(response.content) <= settings.GITHUB_ETAG_CACHE_MAX_BYTES
+    ):
+        try:
+            pipe = client.pipeline()
+            pipe.delete(cache_key)
+            pipe.hset(cache_key, mapping={
+                "etag": etag or "",
+                "last_modified": last_modified or "",
+                "link": response.headers.get("Link", ""),
+                "body": response.content,
+            })
+            pipe.expire(cache_key, settings.GITHUB_ETAG_CACHE_TTL)
+            pipe.execute()
+        except redis.RedisError:
+            mark_redis_down()
+    return response
+
+
+def get_github_client_stats():
+    """Shared counters: 304s served from cache, rate-limit retries, seconds spent throttled"""
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        return {k.decode(): float(v) for k, v in client.hgetall(STATS_KEY).items()}
+    except redis.RedisError:
+        mark_redis_down()
+        return {}
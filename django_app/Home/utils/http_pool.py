@@ -0,0 +1,138 @@
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# Connection pools are created lazily per worker process: sockets must not be shared across
+# the fork that Celery's prefork pool does after importing this module.
+_lock = threading.Lock()
+_github_session = None
+_github_session_pid = None
+_llm_http_client = None
+_llm_http_client_pid = None
+_llm_stats = {"requests": 0, "new_connections": 0}
+# Requests made by the async engine's GitHub clients in this process
+_github_async_stats = {"requests": 0, "new_connections": 0}
+
+
+def get_github_session():
+    """Keep-alive requests.Session shared by every GitHub call in this process"""
+    global _github_session, _github_session_pid
+    if _github_session is None or _github_session_pid != os.getpid():
+        with _lock:
+            if _github_session is None or _github_session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,  # api.github.com, github.com, raw.githubusercontent.com
+                    pool_maxsize=settings.GITHUB_HTTP_POOL_SIZE,
+                    pool_block=False,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _github_session, _github_session_pid = session, os.getpid()
+    return _github_session
+
+
+def pooled_get(url, headers=None, **kwargs):
+    """GET through the pooled GitHub session with the configured (connect, read) timeouts"""
+    kwargs.setdefault("timeout", (settings.GITHUB_CONNECT_TIMEOUT, settings.GITHUB_READ_TIMEOUT))
+    return get_github_session().get(url, headers=headers, **kwargs)
+
+
+def _trace_llm_connection(event_name, info):
+    if event_name == "connection.connect_tcp.complete":
+        with _lock:
+            _llm_stats["new_connections"] += 1
+
+
+def _on_llm_request(request):
+    with _lock:
+        _llm_stats["requests"] += 1
+    # httpcore reports every new TCP connection through the trace extension
+    request.extensions["trace"] = _trace_llm_connection
+
+
+def get_llm_http_client():
+    """httpx client with a bounded keep-alive pool, handed to the Groq SDK"""
+    global _llm_http_client, _llm_http_client_pid
+    if _llm_http_client is None or _llm_http_client_pid != os.getpid():
+        with _lock:
+            if _llm_http_client is None or _llm_http_client_pid != os.getpid():
+                _llm_http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings.LLM_HTTP_POOL_SIZE,
+                        max_keepalive_connections=settings.LLM_HTTP_POOL_SIZE,
+                    ),
+                    timeout=httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+                    event_hooks={"request": [_on_llm_request]},
+                )
+                _llm_http_client_pid = os.getpid()
+                _llm_stats.update(requests=0, new_connections=0)
+    return _llm_http_client
+
+
+def _async_request_hook(stats):
+    async def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with _lock:
+                stats["new_connections"] += 1
+
+    async def on_request(request):
+        with _lock:
+            stats["requests"] += 1
+        # The async interface of httpcore only accepts coroutine trace callbacks
+        request.extensions["trace"] = trace
+    return on_request
+
+
+def new_async_llm_http_client(max_connections=None):
+    """httpx.AsyncClient for the async engine's Groq client.
+
+    Async clients are bound to the event loop they first run on, so each run creates its own
+    and closes it when done; requests are counted with the shared LLM stats.
+    """
+    max_connections = max_connections or settings.LLM_HTTP_POOL_SIZE
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        event_hooks={"request": [_async_request_hook(_llm_stats)]},
+    )
+
+
+def new_async_github_client(max_connections=None):
+    """httpx.AsyncClient for the async engine's raw file downloads (one per run, like the LLM client)"""
+    max_connections = max_connections or settings.GITHUB_HTTP_POOL_SIZE
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(settings.GITHUB_READ_TIMEOUT, connect=settings.GITHUB_CONNECT_TIMEOUT),
+        follow_redirects=True,
+        event_hooks={"request": [_async_request_hook(_github_async_stats)]},
+    )
+
+
+def _reuse_rate(requests_made, new_connections):
+    if not requests_made:
+        return 0.0
+    return round(max(0, requests_made - new_connections) / requests_made, 4)
+
+
+def get_connection_stats():
+    """Requests vs new connections for the GitHub and LLM pools of this process"""
+    github = {"requests": 0, "new_connections": 0}
+    if _github_session is not None and _github_session_pid == os.getpid():
+        for adapter in set(_github_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    github["requests"] += pool.num_requests
+                    github["new_connections"] += pool.num_connections
+    with _lock:
+        github["requests"] += _github_async_stats["requests"]
+        github["new_connections"] += _github_async_stats["new_connections"]
+        llm = dict(_llm_stats)
+    github["reuse_rate"] = _reuse_rate(github["requests"], github["new_connections"])
+    llm["reuse_rate"] = _reuse_rate(llm["requests"], llm["new_connections"])
+    return {"pid": os.getpid(), "github": github, "llm": llm}
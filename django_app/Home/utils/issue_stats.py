@@ -0,0 +1,151 @@
+import re
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from Home.models import PRAnalysisResult, IssueStatistic, Issue
+from .llm_output import ISSUE_TYPES, coerce_analysis
+
+# Rows per INSERT when writing Issue rows
+ISSUE_BATCH_SIZE = 500
+
+
+def native_result_entries(analysis_result):
+    """Per-file entries with "analysis" as a validated dict; legacy JSON strings are parsed here, once"""
+    if not isinstance(analysis_result, list):
+        return analysis_result
+    return [
+        dict(entry, analysis=coerce_analysis(entry.get("analysis"))) if isinstance(entry, dict) else entry
+        for entry in analysis_result
+    ]
+
+
+def iter_issues(analysis_result):
+    """Yield (file_name, issue) for every issue of one stored analysis"""
+    if not isinstance(analysis_result, list):
+        return
+    for file_result in analysis_result:
+        if not isinstance(file_result, dict):
+            continue
+        analysis = file_result.get("analysis")
+        if not isinstance(analysis, dict):
+            # Rows saved before analyses were stored natively
+            analysis = coerce_analysis(analysis)
+        for issue in analysis.get("issues", []):
+            yield file_result.get("file_name", ""), issue if isinstance(issue, dict) else {}
+
+
+def count_issues(analysis_result):
+    """Count the issues of one stored analysis: {"total_issues": n, "style": n, ...}"""
+    counts = dict.fromkeys(("total_issues",) + ISSUE_TYPES, 0)
+    for _, issue in iter_issues(analysis_result):
+        counts["total_issues"] += 1
+        issue_type = str(issue.get("type", "")).lower()
+        if issue_type in ISSUE_TYPES:
+            counts[issue_type] += 1
+    return counts
+
+
+def _first_line(value):
+    # The LLM reports lines as ints, "12", or ranges like "12-14"
+    match = re.search(r"\d+", str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+
+def build_issue_rows(result):
+    """Unsaved Issue rows for every issue in a saved PRAnalysisResult"""
+    return [
+        Issue(
+            analysis=result,
+            repo_url=result.repo_url,
+            pr_number=result.pr_number,
+            file_path=str(file_name)[:1000],
+            type=str(issue.get("type", "")).lower()[:50],
+            line=_first_line(issue.get("line")),
+            description=str(issue.get("description", "")),
+            suggestion=str(issue.get("suggestion", "")),
+            created_at=result.created_at,
+        )
+        for file_name, issue in iter_issues(result.analysis_result)
+    ]
+
+
+def _add_to_day(repo_url, day, counts, sign):
+    updates = {field: F(field) + sign * value for field, value in counts.items() if value}
+    updates["analyses"] = F("analyses") + sign
+    if not IssueStatistic.objects.filter(repo_url=repo_url, day=day).update(**updates):
+        try:
+            with transaction.atomic():
+                IssueStatistic.objects.create(repo_url=repo_url, day=day, analyses=sign, **{field: sign * value for field, value in counts.items()})
+        except IntegrityError:
+            # Another worker created the row first
+            IssueStatistic.objects.filter(repo_url=repo_url, day=day).update(**updates)
+
+
+def save_analysis_result(task_id, defaults):
+    """update_or_create a PRAnalysisResult (with its file_count) and keep IssueStatistic and Issue in step with it.
+
+    Per-file analyses are stored as native JSON objects, whatever form the caller passed.
+
+    Replacing an existing result first takes its old counts and issue rows back out, so
+    re-saving a task never counts it twice.
+    """
+    analysis_result = native_result_entries(defaults.get("analysis_result"))
+    defaults = dict(defaults, analysis_result=analysis_result, file_count=len(analysis_result) if isinstance(analysis_result, list) else 0)
+    with transaction.atomic():
+        previous = PRAnalysisResult.objects.select_for_update().filter(task_id=task_id).first()
+        if previous is not None:
+            _add_to_day(previous.repo_url, timezone.localdate(previous.created_at), count_issues(previous.analysis_result), -1)
+            previous.issues.all().delete()
+        obj, created = PRAnalysisResult.objects.update_or_create(task_id=task_id, defaults=defaults)
+        _add_to_day(obj.repo_url, timezone.localdate(obj.created_at), count_issues(obj.analysis_result), 1)
+        Issue.objects.bulk_create(build_issue_rows(obj), batch_size=ISSUE_BATCH_SIZE)
+    return obj, created
+
+
+def get_issue_statistics(repo_url=None, since=None, until=None):
+    """Sum the per-day rows, optionally for one repository and/or a date range"""
+    rows = IssueStatistic.objects.all()
+    if repo_url:
+        rows = rows.filter(repo_url=repo_url)
+    if since:
+        rows = rows.filter(day__gte=since)
+    if until:
+        rows = rows.filter(day__lte=until)
+    totals = rows.aggregate(**{field: Sum(field) for field in ("analyses", "total_issues") + ISSUE_TYPES})
+    return {
+        "total_analyses": totals["analyses"] or 0,
+        "total_issues_found": totals["total_issues"] or 0,
+        "issues_by_type": {issue_type: totals[issue_type] or 0 for issue_type in ISSUE_TYPES},
+    }
+
+
+def rebuild_issue_statistics(batch_size=500):
+    """Recompute every IssueStatistic row from the stored results; returns the number of analyses read"""
+    per_day = {}
+    read = 0
+    for result in PRAnalysisResult.objects.only("repo_url", "created_at", "analysis_result").iterator(chunk_size=batch_size):
+        key = (result.repo_url, timezone.localdate(result.created_at))
+        row = per_day.setdefault(key, dict.fromkeys(("analyses", "total_issues") + ISSUE_TYPES, 0))
+        row["analyses"] += 1
+        for field, value in count_issues(result.analysis_result).items():
+            row[field] += value
+        read += 1
+    with transaction.atomic():
+        IssueStatistic.objects.all().delete()
+        IssueStatistic.objects.bulk_create(
+            [IssueStatistic(repo_url=repo_url, day=day, **row) for (repo_url, day), row in per_day.items()],
+            batch_size=batch_size,
+        )
+    return read
+
+
+def rebuild_issues(batch_size=ISSUE_BATCH_SIZE):
+    """Recreate the Issue rows of every stored analysis; returns the number of issues written"""
+    written = 0
+    for result in PRAnalysisResult.objects.iterator(chunk_size=batch_size):
+        with transaction.atomic():
+            result.issues.all().delete()
+            rows = build_issue_rows(result)
+            Issue.objects.bulk_create(rows, batch_size=batch_size)
+        written += len(rows)
+    return written
@@ -0,0 +1,149 @@
+import json
+import hashlib
+import threading
+import time
+from datetime import timedelta
+import redis
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .redis_client import get_redis, mark_redis_down
+
+# Redis layout: one string per entry plus a sorted set of last-access times used for LRU eviction
+KEY_PREFIX = "llm_cache:entry:"
+LRU_KEY = "llm_cache:lru"
+STATS_KEY = "llm_cache:stats"
+
+# Counters for the database fallback, which only runs while Redis is down
+_local_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_local_stats_lock = threading.Lock()
+
+
+def make_cache_key(blob_sha, prompt_version, model, temperature):
+    """Build the content address for one file analysis"""
+    raw = f"{blob_sha}:{prompt_version}:{model}:{temperature}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _count(stat, amount=1, client=None):
+    if client is not None:
+        try:
+            client.hincrby(STATS_KEY, stat, amount)
+            return
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_stats_lock:
+        _local_stats[stat] += amount
+
+
+def _decode(value):
+    # Entries are validated analyses serialized by store_cached_analysis
+    try:
+        analysis = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return analysis if isinstance(analysis, dict) else None
+
+
+def get_cached_analysis(key):
+    """Return the cached analysis dict for key, or None on a miss"""
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    client = get_redis()
+    if client is not None:
+        try:
+            value = client.get(KEY_PREFIX + key)
+            if value is None:
+                _count("misses", client=client)
+                return None
+            # Sliding TTL and LRU bump on every hit
+            pipe = client.pipeline()
+            pipe.expire(KEY_PREFIX + key, settings.LLM_CACHE_TTL)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.hincrby(STATS_KEY, "hits", 1)
+            pipe.execute()
+            return _decode(value)
+        except redis.RedisError as e:
+            print(f"WARNING: LLM cache read from Redis failed, using database: {str(e)}")
+            mark_redis_down()
+    # The cache must never fail an analysis, so database errors degrade to a miss
+    try:
+        value = _db_get(key)
+        return _decode(value) if value is not None else None
+    except DatabaseError as e:
+        print(f"WARNING: LLM cache read from database failed: {str(e)}")
+        return None
+
+
+def store_cached_analysis(key, analysis):
+    """Store a successful analysis dict and evict least recently used entries over the limit"""
+    if not settings.LLM_CACHE_ENABLED:
+        return
+    analysis = json.dumps(analysis)
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            pipe.set(KEY_PREFIX + key, analysis, ex=settings.LLM_CACHE_TTL)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.hincrby(STATS_KEY, "stores", 1)
+            pipe.zcard(LRU_KEY)
+            size = pipe.execute()[-1]
+            overflow = size - settings.LLM_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                evicted = [k.decode() for k, _ in client.zpopmin(LRU_KEY, overflow)]
+                if evicted:
+                    client.delete(*[KEY_PREFIX + k for k in evicted])
+                    client.hincrby(STATS_KEY, "evictions", len(evicted))
+            return
+        except redis.RedisError as e:
+            print(f"WARNING: LLM cache write to Redis failed, using database: {str(e)}")
+            mark_redis_down()
+    try:
+        _db_store(key, analysis)
+    except DatabaseError as e:
+        print(f"WARNING: LLM cache write to database failed: {str(e)}")
+
+
+def get_cache_stats():
+    """Hit/miss counters from Redis plus the local database-fallback counters"""
+    stats = {"redis": {}, "database": dict(_local_stats)}
+    client = get_redis()
+    if client is not None:
+        try:
+            stats["redis"] = {k.decode(): int(v) for k, v in client.hgetall(STATS_KEY).items()}
+            stats["redis"]["entries"] = client.zcard(LRU_KEY)
+        except redis.RedisError:
+            mark_redis_down()
+    hits = stats["redis"].get("hits", 0) + stats["database"]["hits"]
+    misses = stats["redis"].get("misses", 0) + stats["database"]["misses"]
+    stats["hit_rate"] = round(hits / (hits + misses), 4) if hits + misses else 0.0
+    return stats
+
+
+def _db_get(key):
+    from Home.models import LLMCacheEntry
+    entry = LLMCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        _count("misses")
+        return None
+    now = timezone.now()
+    if entry.last_accessed_at < now - timedelta(seconds=settings.LLM_CACHE_TTL):
+        entry.delete()
+        _count("misses")
+        _count("evictions")
+        return None
+    LLMCacheEntry.objects.filter(pk=entry.pk).update(last_accessed_at=now)
+    _count("hits")
+    return entry.analysis
+
+
+def _db_store(key, analysis):
+    from Home.models import LLMCacheEntry
+    LLMCacheEntry.objects.update_or_create(key=key, defaults={"analysis": analysis, "last_accessed_at": timezone.now()})
+    _count("stores")
+    overflow = LLMCacheEntry.objects.count() - settings.LLM_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = list(LLMCacheEntry.objects.order_by("last_accessed_at").values_list("pk", flat=True)[:overflow])
+        LLMCacheEntry.objects.filter(pk__in=stale).delete()
+        _count("evictions", len(stale))
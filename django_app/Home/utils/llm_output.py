@@ -0,0 +1,215 @@
+import json
+import threading
+import redis
+from .redis_client import get_redis, mark_redis_down
+
+# Issue types the prompts ask for; the pipeline itself also records "error", "warning" and "info"
+ISSUE_TYPES = ("style", "bugs", "performance", "best_practice")
+# Common spellings of those types in model answers
+TYPE_ALIASES = {
+    "bug": "bugs", "error_prone": "bugs",
+    "best practice": "best_practice", "best-practice": "best_practice", "best_practices": "best_practice",
+    "formatting": "style", "code_style": "style",
+    "perf": "performance",
+}
+# Triage ratings, lowest first
+RISK_LEVELS = ("low", "medium", "high")
+
+
+class LLMOutputError(Exception):
+    """Raised when an LLM answer cannot be parsed into the issue schema"""
+
+
+STATS_KEY = "llm_output:stats"
+# Used while Redis is down
+_local_stats = {}
+_local_stats_lock = threading.Lock()
+
+
+def extract_json(text):
+    """Parse the JSON object embedded in an LLM answer (prose and ``` fences are ignored).
+
+    Returns None when no JSON object can be parsed.
+    """
+    if not isinstance(text, str):
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def _clean_line(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    # Ranges like "12-14" are kept as text; placeholders like "<line_number>" are dropped
+    return value if value and value[0].isdigit() else None
+
+
+def clean_issue(issue):
+    """Validate one issue against the schema; returns the normalized issue or None if unusable.
+
+    Schema: {"type": str, "line": int | "a-b" | absent, "description": str, "suggestion": str}
+    """
+    if not isinstance(issue, dict):
+        return None
+    description = issue.get("description")
+    if not isinstance(description, str) or not description.strip():
+        return None
+    issue_type = str(issue.get("type") or "best_practice").strip().lower()
+    cleaned = {
+        "type": TYPE_ALIASES.get(issue_type, issue_type),
+        "description": description.strip(),
+        "suggestion": str(issue.get("suggestion") or "").strip(),
+    }
+    line = _clean_line(issue.get("line"))
+    if line is not None:
+        cleaned["line"] = line
+    return cleaned
+
+
+def clean_triage(data):
+    """{"risk", "complexity"} from a triage answer; a missing or invalid rating is None"""
+    risk = str(data.get("risk") or "").strip().lower()
+    complexity = data.get("complexity")
+    if isinstance(complexity, str) and complexity.strip().isdigit():
+        complexity = int(complexity.strip())
+    if isinstance(complexity, bool) or not isinstance(complexity, (int, float)):
+        complexity = None
+    return {
+        "risk": risk if risk in RISK_LEVELS else None,
+        "complexity": min(10, max(1, int(complexity))) if complexity is not None else None,
+    }
+
+
+def clean_analysis(data):
+    """Validate a parsed {"issues": [...]} object.
+
+    Returns (analysis, dropped) where dropped counts issues that did not match the schema, or
+    (None, 0) when data is not an analysis at all: an object without an "issues" list ({},
+    {"error": ...}) is a wrong answer to repair, not a clean review. A stored "triage" record
+    (rating plus whether the file was escalated) is kept.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("issues"), list):
+        return None, 0
+    issues = [clean_issue(issue) for issue in data["issues"]]
+    kept = [issue for issue in issues if issue is not None]
+    analysis = {"issues": kept}
+    if isinstance(data.get("raw"), str):
+        analysis["raw"] = data["raw"]
+    if isinstance(data.get("triage"), dict):
+        analysis["triage"] = dict(clean_triage(data["triage"]), escalated=bool(data["triage"].get("escalated")))
+    return analysis, len(issues) - len(kept)
+
+
+def _loads(text):
+    """Strict parse first (JSON mode answers); fall back to the object embedded in prose or fences"""
+    try:
+        return json.loads(text), False
+    except (TypeError, ValueError):
+        data = extract_json(text)
+        return data, data is not None
+
+
+def parse_analysis(text, triage=False):
+    """Parse and validate a single-file answer.
+
+    Returns (analysis, info) where analysis is {"issues": [...]} or None if the answer is not
+    usable, and info holds "extracted" (JSON had to be cut out of prose) and "dropped" counts.
+    With triage the answer's "risk"/"complexity" rating is kept under analysis["triage"].
+    """
+    data, extracted = _loads(text)
+    analysis, dropped = clean_analysis(data)
+    if triage and analysis is not None:
+        analysis["triage"] = clean_triage(data)
+    return analysis, {"extracted": int(extracted and analysis is not None), "dropped": dropped}
+
+
+def parse_batch_answer(text, file_names, triage=False):
+    """Parse and validate a batched answer {"files": [{"file_name", "issues"}]}.
+
+    Returns ({file_name: analysis}, info), or (None, info) if the answer is not usable. Files
+    missing from a usable answer are left out so the caller can retry them. With triage each
+    file's rating is kept as in parse_analysis.
+    """
+    data, extracted = _loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get("files"), list):
+        return None, {"extracted": 0, "dropped": 0}
+    wanted = set(file_names)
+    issues_by_file = {}
+    ratings = {}
+    for entry in data["files"]:
+        if isinstance(entry, dict) and entry.get("file_name") in wanted and isinstance(entry.get("issues"), list):
+            issues_by_file.setdefault(entry["file_name"], []).extend(entry["issues"])
+            ratings.setdefault(entry["file_name"], clean_triage(entry))
+    per_file = {}
+    dropped = 0
+    for file_name, issues in issues_by_file.items():
+        per_file[file_name], file_dropped = clean_analysis({"issues": issues})
+        if triage:
+            per_file[file_name]["triage"] = ratings[file_name]
+        dropped += file_dropped
+    return per_file, {"extracted": int(extracted), "dropped": dropped}
+
+
+def coerce_analysis(value):
+    """Native analysis for a stored value: validated dicts pass through, legacy JSON strings are
+    parsed once, and unparseable text is kept under "raw" so nothing is lost."""
+    if isinstance(value, dict):
+        analysis, _ = clean_analysis(value)
+        if analysis is not None:
+            return analysis
+        return {"issues": [], "raw": json.dumps(value)}
+    if isinstance(value, str):
+        analysis, _ = parse_analysis(value)
+        if analysis is not None:
+            return analysis
+        return {"issues": [], "raw": value}
+    return {"issues": []}
+
+
+def record_output_stats(**counts):
+    """Add to the shared parse counters (responses, extracted, repairs, repaired, failed, dropped_issues)"""
+    counts = {stat: amount for stat, amount in counts.items() if amount}
+    if not counts:
+        return
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            for stat, amount in counts.items():
+                pipe.hincrby(STATS_KEY, stat, amount)
+            pipe.execute()
+            return
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_stats_lock:
+        for stat, amount in counts.items():
+            _local_stats[stat] = _local_stats.get(stat, 0) + amount
+
+
+def get_output_stats():
+    """Parse counters plus parse_failure_rate (answers still unusable after the repair request)"""
+    stats = dict.fromkeys(("responses", "extracted", "repairs", "repaired", "failed", "dropped_issues"), 0)
+    client = get_redis()
+    if client is not None:
+        try:
+            for stat, amount in client.hgetall(STATS_KEY).items():
+                stats[stat.decode()] = int(amount)
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_stats_lock:
+        for stat, amount in _local_stats.items():
+            stats[stat] = stats.get(stat, 0) + amount
+    responses = stats["responses"]
+    stats["parse_failure_rate"] = round(stats["failed"] / responses, 4) if responses else 0.0
+    stats["first_pass_failure_rate"] = round(stats["repairs"] / responses, 4) if responses else 0.0
+    return stats
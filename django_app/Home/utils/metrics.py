@@ -0,0 +1,194 @@
+import threading
+import time
+from datetime import datetime
+import redis
+from django.conf import settings
+from .redis_client import get_redis, mark_redis_down
+
+# Pipeline metrics shared by every worker through one Redis hash and served by the /metrics view
+# in the Prometheus text format. Per-stage latencies are histograms of pr_analysis_stage_seconds:
+#   list        one page of the PR file list
+#   fetch       one file's content (raw download, contents API or git mirror)
+#   git_fetch   one git fetch of a PR head into the repository's mirror (GIT_MIRROR_ENABLED)
+#   llm         one completion, retries and the repair request included
+#   db_write    saving one analysis (result, issue rows, statistics)
+#   queue_wait  from enqueue (before_task_publish) to the task starting on a worker
+#   analysis    one whole analysis, from the first GitHub call to the last answer
+# Counters are kept per label set. Without Redis, values stay in this process.
+
+METRICS_KEY = "metrics:pipeline"
+STAGE_HISTOGRAM = "pr_analysis_stage_seconds"
+
+# name -> (type, help); the order of the /metrics output
+METRICS = {
+    STAGE_HISTOGRAM: ("histogram", "Seconds spent per pipeline stage"),
+    "pr_analysis_files_total": ("counter", "PR files finished, by outcome"),
+    "pr_analysis_fetched_bytes_total": ("counter", "Bytes of file content fetched from GitHub"),
+    "pr_analysis_llm_requests_total": ("counter", "LLM completions, by model"),
+    "pr_analysis_llm_tokens_total": ("counter", "LLM tokens, by model and kind (prompt, completion)"),
+    "pr_analysis_tasks_total": ("counter", "Analyses saved, by status"),
+    "pr_analysis_webhooks_total": ("counter", "GitHub webhook deliveries, by outcome"),
+    "pr_analysis_git_mirror_total": ("counter", "Git mirror fetches, reads, misses and evictions"),
+    "pr_analysis_provider_events_total": ("counter", "Calls, retries and circuit breaker events per provider"),
+}
+
+_local_values = {}
+_local_lock = threading.Lock()
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("|", "/")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def _bucket(seconds):
+    for bound in settings.METRICS_BUCKETS:
+        if seconds <= bound:
+            return repr(float(bound))
+    return "+Inf"
+
+
+def record(observations=(), counters=()):
+    """Add stage latencies and counter increments in one Redis round trip.
+
+    observations are (stage, seconds) pairs for pr_analysis_stage_seconds; counters are
+    (name, amount, labels) triples. Metrics never fail the pipeline.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    updates = {}
+    for stage, seconds in observations:
+        if seconds is None:
+            continue
+        for field, amount in ((f"h|{stage}|{_bucket(seconds)}", 1), (f"h|{stage}|sum", seconds), (f"h|{stage}|count", 1)):
+            updates[field] = updates.get(field, 0) + amount
+    for name, amount, labels in counters:
+        if amount:
+            field = f"c|{name}|{_labels(labels)}"
+            updates[field] = updates.get(field, 0) + amount
+    if not updates:
+        return
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for field, amount in updates.items():
+                pipe.hincrbyfloat(METRICS_KEY, field, amount)
+            pipe.execute()
+            return
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_lock:
+        for field, amount in updates.items():
+            _local_values[field] = _local_values.get(field, 0) + amount
+
+
+def observe(stage, seconds):
+    record(observations=[(stage, seconds)])
+
+
+def _values():
+    values = {}
+    client = get_redis()
+    if client is not None:
+        try:
+            values = {field.decode(): float(value) for field, value in client.hgetall(METRICS_KEY).items()}
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_lock:
+        for field, value in _local_values.items():
+            values[field] = values.get(field, 0) + value
+    return values
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics(extra_counters=()):
+    """Every metric in the Prometheus text exposition format (version 0.0.4).
+
+    extra_counters are (name, value, labels) triples read from elsewhere (e.g. resilience stats).
+    """
+    values = _values()
+    series = {name: [] for name in METRICS}
+    stages = {}
+    for field, value in values.items():
+        kind, name, rest = field.split("|", 2)
+        if kind == "c":
+            series.setdefault(name, []).append((rest, value))
+        else:
+            stages.setdefault(name, {})[rest] = value
+    for name, value, labels in extra_counters:
+        series.setdefault(name, []).append((_labels(labels), value))
+
+    lines = []
+    for name, entries in series.items():
+        metric_type, help_text = METRICS.get(name, ("counter", name))
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        if name == STAGE_HISTOGRAM:
+            for stage, fields in sorted(stages.items()):
+                cumulative = 0
+                for bound in [repr(float(bound)) for bound in settings.METRICS_BUCKETS] + ["+Inf"]:
+                    cumulative += fields.get(bound, 0)
+                    lines.append(f'{name}_bucket{{{_labels({"stage": stage})},le="{bound}"}} {_number(cumulative)}')
+                lines.append(f'{name}_sum{{{_labels({"stage": stage})}}} {_number(fields.get("sum", 0))}')
+                lines.append(f'{name}_count{{{_labels({"stage": stage})}}} {_number(fields.get("count", 0))}')
+        for labels, value in sorted(entries):
+            lines.append(f"{name}{{{labels}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def new_timings():
+    """Per-analysis timing breakdown; stage seconds are summed over files, so stages that overlap
+    (fetches and LLM requests run side by side) can add up to more than the analysis took"""
+    return {"list_seconds": 0.0, "pages_listed": 0, "fetch_seconds": 0.0, "files_fetched": 0, "bytes_fetched": 0, "llm_seconds": 0.0}
+
+
+def merge_timings(timings, other):
+    """Add the timings of one subtask of a split analysis"""
+    for key, value in (other or {}).items():
+        if isinstance(value, (int, float)):
+            timings[key] = timings.get(key, 0) + value
+    return timings
+
+
+def rounded(timings):
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in timings.items()}
+
+
+def timed(func, *args):
+    """(func(*args), seconds it took)"""
+    started = time.monotonic()
+    value = func(*args)
+    return value, time.monotonic() - started
+
+
+def queue_wait_seconds(request):
+    """Seconds a task waited in its queue, from the enqueued_at header stamped at publish time.
+
+    Tasks with an ETA (countdown) are measured from the ETA. None for eager or unstamped tasks.
+    """
+    enqueued_at = getattr(request, "enqueued_at", None) or (getattr(request, "headers", None) or {}).get("enqueued_at")
+    if not enqueued_at:
+        return None
+    eta = getattr(request, "eta", None)
+    if eta:
+        try:
+            enqueued_at = max(float(enqueued_at), datetime.fromisoformat(eta).timestamp())
+        except (TypeError, ValueError):
+            pass
+    return max(0.0, time.time() - float(enqueued_at))
+
+
+def stamp_enqueued_at(headers=None, **kwargs):
+    """before_task_publish handler: record when the task entered its queue"""
+    if headers is not None and settings.METRICS_ENABLED:
+        headers.setdefault("enqueued_at", time.time())
+
+
+def observe_queue_wait(task=None, **kwargs):
+    """task_prerun handler: add the task's queue wait to the histogram"""
+    if task is not None:
+        observe("queue_wait", queue_wait_seconds(task.request))
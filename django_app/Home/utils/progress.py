@@ -0,0 +1,36 @@
+import json
+import redis
+from django.conf import settings
+from .redis_client import get_redis, mark_redis_down
+
+# One Redis stream per task. A stream (not pub/sub) lets a client that connects late, or
+# reconnects with Last-Event-ID, replay what it missed. Entries have two fields: "event"
+# (started, file, done) and "data" (JSON).
+EVENTS_KEY_PREFIX = "pr_analysis:events:"
+
+
+def events_key(task_id):
+    return EVENTS_KEY_PREFIX + str(task_id)
+
+
+def publish_event(task_id, event, data):
+    """Append an event to the task's stream; progress reporting never fails the analysis"""
+    if not task_id:
+        return
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.xadd(events_key(task_id), {"event": event, "data": json.dumps(data)},
+                  maxlen=settings.PR_ANALYSIS_EVENTS_MAX_LEN, approximate=True)
+        pipe.expire(events_key(task_id), settings.PR_ANALYSIS_EVENTS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"WARNING: could not publish {event} event for task {task_id}: {str(e)}")
+        mark_redis_down()
+
+
+def publish_file_result(task_id, index, entry):
+    """Publish one finished per-file entry at its position in the final result list"""
+    publish_event(task_id, "file", {"index": index, "entry": entry})
@@ -0,0 +1,37 @@
+import time
+import threading
+import redis
+from django.conf import settings
+
+# How long to wait before trying Redis again after a failed connection
+RETRY_INTERVAL_SECONDS = 30
+
+_client = None
+_retry_at = 0
+_lock = threading.Lock()
+
+def get_redis():
+    """Return the shared Redis client for this process, or None if Redis is unreachable"""
+    global _client, _retry_at
+    if _client is not None:
+        return _client
+    if time.time() < _retry_at:
+        return None
+    with _lock:
+        if _client is not None:
+            return _client
+        try:
+            client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=2)
+            client.ping()
+            _client = client
+        except redis.RedisError as e:
+            print(f"WARNING: Redis unavailable at {settings.REDIS_URL}: {str(e)}")
+            _retry_at = time.time() + RETRY_INTERVAL_SECONDS
+    return _client
+
+def mark_redis_down():
+    """Drop the shared client after a command failed so the next call reconnects"""
+    global _client, _retry_at
+    with _lock:
+        _client = None
+        _retry_at = time.time() + RETRY_INTERVAL_SECONDS
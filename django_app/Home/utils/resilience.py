@@ -0,0 +1,308 @@
+import asyncio
+import random
+import threading
+import time
+import groq
+import httpx
+import redis
+import requests
+from django.conf import settings
+from .redis_client import get_redis, mark_redis_down
+
+# Shared resilience layer for the Groq and GitHub calls of one worker process. Each provider has
+# an adaptive concurrency limit (halved on 429, grown back by one per limit successful calls) and
+# a circuit breaker (opened by consecutive failures, probed again after a cooldown). Transient
+# failures are retried with jittered exponential backoff that honors Retry-After; what still
+# fails is raised to the pipeline, which parks the file for a later retry.
+
+STATS_KEY = "resilience:stats"  # hash of "<provider>:<counter>" shared by all workers
+COUNTERS = ("calls", "retries", "throttled", "failures", "gave_up", "breaker_opened", "rejected")
+PROVIDERS = ("groq", "github")
+# Counters are added up in memory and written to Redis in one pipeline at most this often, so
+# calls never wait on Redis; the end of every analysis (and every stats read) flushes as well
+FLUSH_SECONDS = 5
+
+_local_stats = {}  # counters that could not be written to Redis
+_pending_stats = {}  # counters not written yet
+_last_flush = 0.0
+_local_stats_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit breaker is open"""
+
+
+class TransientHTTPError(Exception):
+    """A response worth retrying (5xx) from a client that does not raise on status"""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _bump(provider, counter, amount=1, flush=True):
+    """Count in memory; with flush, write the pending counters once FLUSH_SECONDS have passed"""
+    key = f"{provider}:{counter}"
+    with _local_stats_lock:
+        _pending_stats[key] = _pending_stats.get(key, 0) + amount
+    if flush and _flush_due():
+        flush_stats()
+
+
+def _flush_due():
+    return time.monotonic() - _last_flush >= FLUSH_SECONDS
+
+
+def flush_stats():
+    """Write this process's pending counters to Redis in one round trip (kept locally without Redis)"""
+    global _pending_stats, _last_flush
+    with _local_stats_lock:
+        pending, _pending_stats = _pending_stats, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, amount in pending.items():
+                pipe.hincrby(STATS_KEY, key, amount)
+            pipe.execute()
+            return
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_stats_lock:
+        for key, amount in pending.items():
+            _local_stats[key] = _local_stats.get(key, 0) + amount
+
+
+def _status_code(error):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_throttled(error):
+    return _status_code(error) == 429
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, 408/409/429 and 5xx; anything else is a real answer"""
+    if isinstance(error, (groq.APIConnectionError, requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    status = _status_code(error)
+    if isinstance(error, (groq.APIStatusError, TransientHTTPError)) and status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return False
+
+
+def is_transient(error):
+    """True for failures that say nothing about the file: worth parking it and trying again later"""
+    from .github_client import GitHubRateLimitError
+    return isinstance(error, (CircuitOpenError, GitHubRateLimitError)) or is_retryable(error)
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait (Retry-After), or None"""
+    if isinstance(error, TransientHTTPError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, never shorter than the provider's Retry-After"""
+    delay = random.uniform(0, min(settings.RESILIENCE_BACKOFF_MAX, settings.RESILIENCE_BACKOFF_BASE * (2 ** attempt)))
+    asked = retry_after(error) if error is not None else None
+    return max(delay, asked) if asked is not None else delay
+
+
+class ProviderGuard:
+    """Adaptive concurrency limit and circuit breaker of one provider in this process"""
+
+    def __init__(self, provider, max_limit):
+        self.provider = provider
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def _try_enter(self):
+        # Called with the condition held. Returns True when the call may start now.
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < settings.RESILIENCE_BREAKER_COOLDOWN:
+                raise CircuitOpenError(f"{self.provider} circuit open after {self.consecutive_failures} consecutive failures")
+            self.state = "half_open"
+        if self.state == "half_open":
+            # One probe at a time decides whether the provider is back
+            if self.probing:
+                raise CircuitOpenError(f"{self.provider} circuit half-open, probe in flight")
+            self.probing = True
+        elif self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def enter(self):
+        with self.condition:
+            while not self._try_enter():
+                self.condition.wait(0.5)
+
+    async def enter_async(self):
+        # The event loop must not block on the condition; poll instead
+        while True:
+            with self.condition:
+                if self._try_enter():
+                    return
+            await asyncio.sleep(0.05)
+
+    def leave(self, error=None):
+        """Record the outcome of one call; returns the breaker transition ("opened") if any"""
+        transition = None
+        with self.condition:
+            self.in_flight -= 1
+            if self.state == "half_open":
+                self.probing = False
+            if error is not None and is_throttled(error):
+                # Rate limited: fewer calls at once, but the provider is up
+                self.limit = max(1.0, self.limit / 2)
+            elif error is not None and is_retryable(error):
+                self.consecutive_failures += 1
+                if self.state == "half_open" or self.consecutive_failures >= settings.RESILIENCE_BREAKER_THRESHOLD:
+                    transition = "opened" if self.state != "open" else None
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+            else:
+                # Success (or an answer that is not the provider's fault)
+                self.consecutive_failures = 0
+                self.state = "closed"
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+        return transition
+
+    def snapshot(self):
+        with self.condition:
+            return {"state": self.state, "limit": round(self.limit, 2), "in_flight": self.in_flight, "consecutive_failures": self.consecutive_failures}
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(provider):
+    if provider not in _guards:
+        with _guards_lock:
+            if provider not in _guards:
+                max_limit = settings.LLM_MAX_CONCURRENCY if provider == "groq" else settings.GITHUB_MAX_CONCURRENCY
+                _guards[provider] = ProviderGuard(provider, max_limit)
+    return _guards[provider]
+
+
+def _after_failure(provider, guard, error, attempt, flush=True):
+    """Count a failed attempt; returns the delay before the next one, or None to give up"""
+    if guard.leave(error) == "opened":
+        print(f"WARNING: {provider} circuit breaker opened")
+        _bump(provider, "breaker_opened", flush=flush)
+    if not is_retryable(error):
+        return None
+    _bump(provider, "throttled" if is_throttled(error) else "failures", flush=flush)
+    if attempt >= settings.RESILIENCE_MAX_RETRIES:
+        _bump(provider, "gave_up", flush=flush)
+        return None
+    _bump(provider, "retries", flush=flush)
+    delay = backoff_delay(attempt, error)
+    print(f"{provider} call failed ({str(error)[:200]}), retry {attempt + 1}/{settings.RESILIENCE_MAX_RETRIES} in {delay:.1f}s")
+    return delay
+
+
+def guarded_call(provider, func):
+    """Call func() under the provider's limit and breaker, retrying transient failures.
+
+    Raises CircuitOpenError while the breaker is open, and the last error once retries are used up.
+    """
+    guard = get_guard(provider)
+    attempt = 0
+    while True:
+        try:
+            guard.enter()
+        except CircuitOpenError:
+            _bump(provider, "rejected")
+            raise
+        _bump(provider, "calls")
+        try:
+            result = func()
+        except Exception as error:
+            delay = _after_failure(provider, guard, error, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        guard.leave()
+        return result
+
+
+async def guarded_call_async(provider, func):
+    """guarded_call for coroutines: func() returns the awaitable to retry"""
+    guard = get_guard(provider)
+    attempt = 0
+    while True:
+        try:
+            await guard.enter_async()
+        except CircuitOpenError:
+            _bump(provider, "rejected", flush=False)
+            raise
+        # Counting is in memory; only the periodic flush talks to Redis, off the event loop
+        _bump(provider, "calls", flush=False)
+        if _flush_due():
+            await asyncio.to_thread(flush_stats)
+        try:
+            result = await func()
+        except Exception as error:
+            delay = _after_failure(provider, guard, error, attempt, flush=False)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        guard.leave()
+        return result
+
+
+def record_throttled(provider):
+    """Shrink the provider's limit for a rate limit handled elsewhere (GitHub's own retry loop)"""
+    guard = get_guard(provider)
+    with guard.condition:
+        guard.limit = max(1.0, guard.limit / 2)
+    _bump(provider, "throttled")
+
+
+def get_resilience_stats():
+    """Retry and breaker counters per provider (all workers), plus this process's limits and breaker states.
+
+    Other workers' latest counts show up after their next flush (at most FLUSH_SECONDS behind while busy).
+    """
+    flush_stats()
+    stats = {provider: dict.fromkeys(COUNTERS, 0) for provider in PROVIDERS}
+    counts = {}
+    client = get_redis()
+    if client is not None:
+        try:
+            counts = {key.decode(): int(value) for key, value in client.hgetall(STATS_KEY).items()}
+        except redis.RedisError:
+            mark_redis_down()
+    with _local_stats_lock:
+        for key, value in _local_stats.items():
+            counts[key] = counts.get(key, 0) + value
+    for key, value in counts.items():
+        provider, _, counter = key.partition(":")
+        stats.setdefault(provider, {})[counter] = value
+    stats["process"] = {provider: guard.snapshot() for provider, guard in list(_guards.items())}
+    return stats
@@ -0,0 +1,31 @@
+from django.conf import settings
+
+# Priorities follow the Redis transport: 0 is served first, 9 last
+MAX_PRIORITY = 9
+
+
+def route_analysis(details):
+    """Queue, priority and split decision for one PR from its metadata (changed_files, additions).
+
+    PRs reaching PR_ANALYSIS_LARGE_PR_FILES files or PR_ANALYSIS_LARGE_PR_ADDITIONS added lines go
+    to the large queue, so they never sit in front of small ones. Within a queue smaller PRs get
+    a better priority. Large PRs with more files than one batch are split across workers.
+    Unknown sizes (metadata unavailable) are treated as small.
+    """
+    changed_files = (details or {}).get("changed_files") or 0
+    additions = (details or {}).get("additions") or 0
+    size = max(changed_files / settings.PR_ANALYSIS_LARGE_PR_FILES, additions / settings.PR_ANALYSIS_LARGE_PR_ADDITIONS)
+    if size < 1:
+        # Spread small PRs over the whole priority range: a 2-file PR goes ahead of a 40-file one
+        return {"queue": settings.PR_ANALYSIS_SMALL_QUEUE, "priority": int(size * (MAX_PRIORITY + 1)), "split": False}
+    return {
+        "queue": settings.PR_ANALYSIS_LARGE_QUEUE,
+        "priority": min(MAX_PRIORITY, int(size) - 1),
+        "split": changed_files > settings.PR_ANALYSIS_SPLIT_BATCH_FILES,
+    }
+
+
+def split_batches(files, batch_files=None):
+    """Contiguous (first_index, files) slices of a listed PR, one per subtask"""
+    batch_files = max(1, batch_files or settings.PR_ANALYSIS_SPLIT_BATCH_FILES)
+    return [(start, files[start:start + batch_files]) for start in range(0, len(files), batch_files)]
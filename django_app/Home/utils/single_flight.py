@@ -0,0 +1,101 @@
+import hashlib
+import redis
+from celery.result import AsyncResult
+from django.conf import settings
+from Home.models import PRAnalysisResult
+from .ai_agent import model_signature, PROMPT_TEMPLATE, HUNK_PROMPT_TEMPLATE, BATCH_PROMPT_TEMPLATE, prompt_version
+from .file_filter import rules_signature
+from .redis_client import get_redis, mark_redis_down
+
+# single_flight:<key> -> task id of the analysis that owns (repo, PR, head sha, model/prompts)
+KEY_PREFIX = "single_flight:"
+
+# Replace the owner only if it is still the task we looked at, so two requests that both saw a
+# failed owner cannot both take over
+REPLACE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Release only our own claim
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Registered once; every call passes the current client, which changes after mark_redis_down
+_replace = None
+_release = None
+
+
+def analysis_key(repo_url, pr_number, head_sha, review_mode):
+    """Identity of an analysis: same key, same files, filter rules, model and prompts, so the same answer"""
+    parts = [
+        repo_url.rstrip("/").lower(), str(pr_number), head_sha, review_mode,
+        str(settings.PR_ANALYSIS_HUNK_CONTEXT_LINES) if review_mode == "hunks" else "",
+        rules_signature(repo_url), model_signature(), prompt_version(PROMPT_TEMPLATE), prompt_version(HUNK_PROMPT_TEMPLATE), prompt_version(BATCH_PROMPT_TEMPLATE),
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _is_reusable(task_id):
+    """An owner can be reused while it is queued or running, or once it saved a good result"""
+    saved = PRAnalysisResult.objects.filter(task_id=task_id).values_list("head_sha", flat=True).first()
+    if saved is not None:
+        # Failed analyses are saved without a head sha
+        return bool(saved)
+    return AsyncResult(task_id).state not in ("FAILURE", "REVOKED", "SUCCESS")
+
+
+def claim_analysis(key, task_id):
+    """Try to make task_id the owner of key.
+
+    Returns the task id that should serve the request: task_id itself when the caller must
+    enqueue it, or the id of an in-flight or completed analysis to coalesce with. Without
+    Redis every caller owns its own analysis.
+    """
+    global _replace
+    client = get_redis()
+    if client is None:
+        return task_id
+    ttl = settings.PR_ANALYSIS_SINGLE_FLIGHT_TTL
+    try:
+        for _ in range(3):
+            if client.set(KEY_PREFIX + key, task_id, nx=True, ex=ttl):
+                return task_id
+            owner = client.get(KEY_PREFIX + key)
+            if owner is None:
+                continue  # Expired or released in between; try to claim again
+            owner = owner.decode()
+            if _is_reusable(owner):
+                return owner
+            if _replace is None:
+                _replace = client.register_script(REPLACE_SCRIPT)
+            if _replace(keys=[KEY_PREFIX + key], args=[owner, task_id, ttl], client=client):
+                print(f"Single-flight owner {owner} failed, replaced by {task_id}")
+                return task_id
+    except redis.RedisError as e:
+        print(f"WARNING: single-flight unavailable, Redis error: {str(e)}")
+        mark_redis_down()
+    return task_id
+
+
+def release_analysis(key, task_id):
+    """Give up ownership after a failed run so the next request starts a fresh analysis"""
+    global _release
+    if not key:
+        return
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        if _release is None:
+            _release = client.register_script(RELEASE_SCRIPT)
+        _release(keys=[KEY_PREFIX + key], args=[task_id], client=client)
+    except redis.RedisError:
+        mark_redis_down()
@@ -0,0 +1,84 @@
+from django.conf import settings
+from .llm_output import RISK_LEVELS
+
+# Model tiers: with LLM_TIERING_ENABLED every file is reviewed by the "triage" model first and
+# files it rates risky or complex are reviewed again by the "review" model (LLM_MODEL)
+TIER_COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "seconds")
+
+
+def tier_model(tier):
+    return settings.LLM_TRIAGE_MODEL if tier == "triage" else settings.LLM_MODEL
+
+
+def should_escalate(triage):
+    """True if a triage rating calls for the review model; unrated code is always escalated"""
+    risk, complexity = triage.get("risk"), triage.get("complexity")
+    if risk is None and complexity is None:
+        return True
+    if risk is not None and settings.LLM_ESCALATE_RISK in RISK_LEVELS and RISK_LEVELS.index(risk) >= RISK_LEVELS.index(settings.LLM_ESCALATE_RISK):
+        return True
+    return complexity is not None and complexity >= settings.LLM_ESCALATE_COMPLEXITY
+
+
+def split_triaged(items, triaged):
+    """Sort the items of a unit after triage.
+
+    Returns (kept, escalate, ratings): kept answers (the triage model's review stands), the items
+    to send to the review model, and the triage rating of every answered item by index. Items
+    without a usable triage answer are escalated.
+    """
+    by_index = {index: analysis for index, analysis, error in triaged if error is None and analysis is not None}
+    ratings = {index: analysis["triage"] for index, analysis in by_index.items()}
+    kept, escalate = [], []
+    for item in items:
+        analysis = by_index.get(item["index"])
+        if analysis is not None and not should_escalate(analysis["triage"]):
+            kept.append((item["index"], dict(analysis, triage=dict(analysis["triage"], escalated=False)), None))
+        else:
+            escalate.append(item)
+    return kept, escalate, ratings
+
+
+def mark_escalated(answers, ratings):
+    """Record the triage rating on the review model's answers"""
+    return [
+        (index, dict(analysis, triage=dict(ratings.get(index, {"risk": None, "complexity": None}), escalated=True))
+         if analysis is not None and "triage" not in analysis else analysis, error)
+        for index, analysis, error in answers
+    ]
+
+
+def merge_triage(triages):
+    """One rating for a file reviewed in pieces: its riskiest, most complex piece"""
+    risks = [triage["risk"] for triage in triages if triage.get("risk")]
+    complexities = [triage["complexity"] for triage in triages if triage.get("complexity")]
+    return {
+        "risk": max(risks, key=RISK_LEVELS.index) if risks else None,
+        "complexity": max(complexities) if complexities else None,
+        "escalated": any(triage.get("escalated") for triage in triages),
+    }
+
+
+def add_tier_usage(tiers, tier, usage):
+    """Book one completion's usage (requests, tokens, seconds) under its tier"""
+    entry = tiers.setdefault(tier, dict(dict.fromkeys(TIER_COUNTERS, 0), model=tier_model(tier)))
+    for counter in TIER_COUNTERS:
+        entry[counter] += usage.get(counter, 0)
+
+
+def merge_tiers(tiers, other):
+    """Add the per-tier usage of one unit (or one subtask) to a running total"""
+    for tier, usage in other.items():
+        add_tier_usage(tiers, tier, usage)
+
+
+def with_costs(token_usage):
+    """Add cost_usd per tier (from LLM_PRICES) and in total; unknown models cost 0"""
+    total = 0.0
+    for usage in token_usage.get("tiers", {}).values():
+        prompt_price, completion_price = settings.LLM_PRICES.get(usage.get("model"), (0, 0))
+        usage["seconds"] = round(usage["seconds"], 3)
+        usage["cost_usd"] = round((usage["prompt_tokens"] * prompt_price + usage["completion_tokens"] * completion_price) / 1e6, 6)
+        total += usage["cost_usd"]
+    token_usage["cost_usd"] = round(total, 6)
+    return token_usage
@@ -0,0 +1,67 @@
+import hashlib
+import hmac
+import json
+import redis
+from django.conf import settings
+from .redis_client import get_redis, mark_redis_down
+
+# webhook:latest:<PR> -> {"task_id", "head_sha"} of the newest analysis a webhook scheduled for the
+# PR. Webhook analyses are queued with a countdown (the debounce window); each new push replaces
+# the PR's latest task, and the one it replaced is revoked. A task that starts anyway (revoke
+# lost, worker restarted) finds it is no longer the latest and stops before doing any work.
+LATEST_KEY_PREFIX = "webhook:latest:"
+
+
+def verify_signature(body, signature):
+    """True if signature (X-Hub-Signature-256) is the HMAC-SHA256 of body under GITHUB_WEBHOOK_SECRET"""
+    if not settings.GITHUB_WEBHOOK_SECRET or not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(settings.GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def _latest_key(repo_url, pr_number):
+    return LATEST_KEY_PREFIX + hashlib.sha256(f"{repo_url.rstrip('/').lower()}#{pr_number}".encode()).hexdigest()
+
+
+def latest_analysis(repo_url, pr_number):
+    """{"task_id", "head_sha"} of the PR's newest webhook analysis, or None"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        latest = client.get(_latest_key(repo_url, pr_number))
+    except redis.RedisError:
+        mark_redis_down()
+        return None
+    return json.loads(latest) if latest else None
+
+
+def replace_latest(repo_url, pr_number, task_id, head_sha):
+    """Make task_id the PR's latest webhook analysis; returns the one it replaced, or None.
+
+    A closed PR gets task_id None, which supersedes whatever is still queued or running.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        previous = client.set(_latest_key(repo_url, pr_number), json.dumps({"task_id": task_id, "head_sha": head_sha}),
+                              ex=settings.PR_ANALYSIS_SINGLE_FLIGHT_TTL, get=True)
+    except redis.RedisError:
+        mark_redis_down()
+        return None
+    return json.loads(previous) if previous else None
+
+
+def is_superseded(repo_url, pr_number, task_id):
+    """True once a newer push (or the PR closing) replaced task_id; False without Redis or a record"""
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        latest = client.get(_latest_key(repo_url, pr_number))
+    except redis.RedisError:
+        mark_redis_down()
+        return False
+    return latest is not None and json.loads(latest)["task_id"] != task_id
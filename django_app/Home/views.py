@@ -1,14 +1,36 @@
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .task import analyze_repo_task
+from .task import analyze_repo_task, expand_batch_task
 from celery.result import AsyncResult
 from rest_framework.response import Response
 from Home.models import PRAnalysisResult
 import json
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+import uuid
+import base64
+from django.conf import settings
+import binascii
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from .models import PRAnalysisResult
+from .utils.llm_cache import get_cache_stats
+from .utils.llm_output import get_output_stats
+from .utils.resilience import get_resilience_stats, PROVIDERS
+from .utils.metrics import render_metrics, record
+from .utils.issue_stats import save_analysis_result, get_issue_statistics
+from .utils.single_flight import analysis_key, claim_analysis
+from .utils.github import fetch_pr_details
+from .utils.routing import route_analysis
+from .utils.webhooks import verify_signature, latest_analysis, replace_latest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .utils.batches import batch_progress
+from .models import Issue, PRAnalysisBatch, PRAnalysisBatchItem
+from .serializers import IssueSerializer
 
 
 @api_view(['POST'])
@@ -17,14 +39,174 @@ def start_task(request):
     repo_url=data.get('repo_url')
     pr_number=data.get('pr_number')
     github_token=data.get('github_token')
-    task=analyze_repo_task.delay(repo_url,pr_number,github_token)
+    incremental=str(data.get('incremental', False)).lower() in ('true', '1')
+    review_mode=data.get('review_mode')  # "full" or "hunks"; None uses settings.PR_ANALYSIS_REVIEW_MODE
+    force=str(data.get('force', False)).lower() in ('true', '1')  # Always start a new analysis
+
+    # PR metadata gives the head sha for single flight and the size for queue routing. The client
+    # is waiting, so the lookup fails fast (short timeout, no throttling waits or retries)
+    details=None
+    try:
+        details=fetch_pr_details(repo_url,pr_number,github_token,wait=False)
+    except Exception as e:
+        # The task reports GitHub errors itself; just don't coalesce, and route as a small PR
+        print(f"Could not fetch PR details for {repo_url} #{pr_number}: {str(e)}")
+
+    # Single flight: identical requests for the same PR head share one analysis
+    task_id=str(uuid.uuid4())
+    owner=task_id
+    key=None
+    if details and settings.PR_ANALYSIS_SINGLE_FLIGHT_ENABLED and not force:
+        key=analysis_key(repo_url,pr_number,details['head']['sha'],review_mode or settings.PR_ANALYSIS_REVIEW_MODE)
+        owner=claim_analysis(key,task_id)
+    if owner!=task_id:
+        print(f"Coalesced request for {repo_url} #{pr_number} into task {owner}")
+        return Response({
+            "task_id":owner,
+            "status":"Task Coalesced",
+            "coalesced":True,
+        })
+
+    route=route_analysis(details)
+    task=analyze_repo_task.apply_async(
+        (repo_url,pr_number,github_token,incremental,review_mode),
+        {"single_flight_key":key,"split":route["split"]},
+        task_id=task_id,queue=route["queue"],priority=route["priority"],
+    )
+    print(f"Queued task {task.id} for {repo_url} #{pr_number} on {route['queue']} (priority {route['priority']}, split {route['split']})")
 
     return Response({
         "task_id":task.id,
-        "status":"Task Started"
+        "status":"Task Started",
+        "coalesced":False,
+        "queue":route["queue"],
+    })
+
+
+@api_view(['POST'])
+def start_batch(request):
+    """Analyze many PRs as one batch: "prs" ([{"repo_url", "pr_number"}]) and/or every open PR of "repos".
+
+    Open PRs are listed and the analyses fanned out by expand_batch_task; progress is read from
+    batch_status_view with the returned batch_id.
+    """
+    data=request.data
+    prs=data.get('prs') or []
+    repos=data.get('repos') or []
+    github_token=data.get('github_token')
+    incremental=str(data.get('incremental', False)).lower() in ('true', '1')
+    review_mode=data.get('review_mode')
+    force=str(data.get('force', False)).lower() in ('true', '1')
+    if not isinstance(prs,list) or not isinstance(repos,list) or not (prs or repos):
+        return Response({"error":"Send a list of PRs in \"prs\" and/or repositories in \"repos\""},status=400)
+    if len(prs)>settings.BATCH_MAX_PRS or len(repos)>settings.BATCH_MAX_REPOS:
+        return Response({"error":f"At most {settings.BATCH_MAX_PRS} PRs and {settings.BATCH_MAX_REPOS} repositories per batch"},status=400)
+    try:
+        pairs={(pr['repo_url'],int(pr['pr_number'])) for pr in prs}
+        repos=list(dict.fromkeys(str(repo) for repo in repos))
+    except (KeyError,TypeError,ValueError):
+        return Response({"error":"Every PR needs a repo_url and a numeric pr_number"},status=400)
+
+    batch=PRAnalysisBatch.objects.create(batch_id=str(uuid.uuid4()),repos=repos)
+    PRAnalysisBatchItem.objects.bulk_create([PRAnalysisBatchItem(batch=batch,repo_url=repo_url,pr_number=pr_number) for repo_url,pr_number in sorted(pairs)])
+    expand_batch_task.apply_async((batch.batch_id,repos,github_token,incremental,review_mode,force),queue=settings.PR_ANALYSIS_SMALL_QUEUE)
+    print(f"Started batch {batch.batch_id}: {len(pairs)} PRs, {len(repos)} repositories to sweep")
+    return Response({
+        "batch_id":batch.batch_id,
+        "status":"Batch Started",
+        "prs":len(pairs),
+        "repos":len(repos),
     })
 
 
+@api_view(['GET'])
+def batch_status_view(request,batch_id):
+    """Aggregate progress of a batch; ?items=true lists every PR with its status and task id"""
+    batch=PRAnalysisBatch.objects.filter(batch_id=batch_id).first()
+    if batch is None:
+        return Response({"error":"Batch ID not found"},status=404)
+    with_items=request.query_params.get('items','').lower() in ('true','1')
+    return Response(batch_progress(batch,with_items))
+
+
+def _revoke_superseded(previous, task_id):
+    """Revoke the PR's earlier webhook analysis (previous, from replace_latest) unless it is task_id"""
+    if not previous or not previous.get("task_id") or previous["task_id"]==task_id:
+        return None
+    try:
+        analyze_repo_task.app.control.revoke(previous["task_id"],terminate=settings.GITHUB_WEBHOOK_TERMINATE_SUPERSEDED)
+        print(f"Revoked superseded task {previous['task_id']} (head {previous['head_sha']})")
+    except Exception as e:
+        # The task still checks whether it was superseded before it starts working
+        print(f"WARNING: could not revoke superseded task {previous['task_id']}: {str(e)}")
+    return previous["task_id"]
+
+
+def _webhook_response(outcome,body,status=200):
+    record(counters=[("pr_analysis_webhooks_total",1,{"outcome":outcome})])
+    return JsonResponse(dict(body,outcome=outcome),status=status)
+
+
+@csrf_exempt
+@require_POST
+def github_webhook(request):
+    """GitHub webhook: pull_request events queue an analysis of the new head (see GITHUB_WEBHOOK_* settings).
+
+    The analysis starts GITHUB_WEBHOOK_DEBOUNCE_SECONDS after the last push to the PR; each push
+    revokes the PR's earlier webhook analysis, and closing the PR revokes the last one.
+    """
+    if not settings.GITHUB_WEBHOOK_SECRET:
+        return _webhook_response("rejected",{"error":"GITHUB_WEBHOOK_SECRET is not configured"},503)
+    if not verify_signature(request.body,request.headers.get("X-Hub-Signature-256")):
+        return _webhook_response("rejected",{"error":"Invalid signature"},401)
+    event=request.headers.get("X-GitHub-Event")
+    if event=="ping":
+        return _webhook_response("ping",{"status":"pong"})
+    if event!="pull_request":
+        return _webhook_response("ignored",{"status":f"Ignored {event} event"})
+    try:
+        payload=json.loads(request.body)
+        pull_request=payload["pull_request"]
+        repo_url=payload["repository"]["html_url"]
+        pr_number=pull_request["number"]
+        head_sha=pull_request["head"]["sha"]
+    except (ValueError,KeyError,TypeError) as e:
+        return _webhook_response("rejected",{"error":f"Malformed pull_request payload: {str(e)}"},400)
+    action=payload.get("action")
+
+    if action=="closed":
+        revoked=_revoke_superseded(replace_latest(repo_url,pr_number,None,None),None)
+        return _webhook_response("closed",{"status":"PR closed","revoked":revoked})
+    if action not in settings.GITHUB_WEBHOOK_ACTIONS:
+        return _webhook_response("ignored",{"status":f"Ignored {action} action"})
+
+    latest=latest_analysis(repo_url,pr_number)
+    if latest and latest["head_sha"]==head_sha:
+        # Redelivered event, or one that did not move the head (reopened, ready_for_review)
+        return _webhook_response("coalesced",{"task_id":latest["task_id"],"status":"Task Coalesced","coalesced":True})
+
+    task_id=str(uuid.uuid4())
+    owner=task_id
+    key=None
+    if settings.PR_ANALYSIS_SINGLE_FLIGHT_ENABLED:
+        key=analysis_key(repo_url,pr_number,head_sha,settings.PR_ANALYSIS_REVIEW_MODE)
+        owner=claim_analysis(key,task_id)
+    # The payload's pull_request carries the same metadata as fetch_pr_details, so GitHub is not asked
+    revoked=_revoke_superseded(replace_latest(repo_url,pr_number,owner,head_sha),owner)
+    if owner!=task_id:
+        print(f"Coalesced webhook for {repo_url} #{pr_number} into task {owner}")
+        return _webhook_response("coalesced",{"task_id":owner,"status":"Task Coalesced","coalesced":True,"revoked":revoked})
+
+    route=route_analysis(pull_request)
+    analyze_repo_task.apply_async(
+        (repo_url,pr_number,settings.GITHUB_TOKEN,settings.GITHUB_WEBHOOK_INCREMENTAL,None),
+        {"single_flight_key":key,"split":route["split"],"webhook":True},
+        task_id=task_id,queue=route["queue"],priority=route["priority"],countdown=settings.GITHUB_WEBHOOK_DEBOUNCE_SECONDS,
+    )
+    print(f"Webhook queued task {task_id} for {repo_url} #{pr_number} at {head_sha} in {settings.GITHUB_WEBHOOK_DEBOUNCE_SECONDS}s on {route['queue']}")
+    return _webhook_response("queued",{"task_id":task_id,"status":"Task Scheduled","coalesced":False,"queue":route["queue"],"revoked":revoked},202)
+
+
 @api_view(['GET'])
 def task_status_view(request,task_id):
     result=AsyncResult(task_id)    
@@ -58,8 +240,8 @@ def store_pr_analysis(request):
             return Response({"error": "Missing required fields"}, status=400)
 
         # Store result in database
-        obj, created = PRAnalysisResult.objects.update_or_create(
-            task_id=task_id,
+        obj, created = save_analysis_result(
+            task_id,
             defaults={"repo_url": repo_url, "pr_number": pr_number, "analysis_result": analysis_result}
         )
 
@@ -96,7 +278,9 @@ def get_pr_analysis(request, task_id):
             "task_id": pr_result.task_id,
             "repo_url": pr_result.repo_url,
             "pr_number": pr_result.pr_number,
+            "head_sha": pr_result.head_sha,
             "analysis_result": analysis_result,
+            "timings": pr_result.timings,
             "created_at": pr_result.created_at.isoformat(),
             "debug": {
                 "result_type": str(type(analysis_result)),
@@ -113,52 +297,141 @@ def get_pr_analysis(request, task_id):
         return Response({"error": f"Failed to retrieve analysis: {str(e)}"}, status=500)
 
 
+ANALYSES_DEFAULT_LIMIT = 50
+ANALYSES_MAX_LIMIT = 200
+
+
+def _encode_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    created_at, pk = datetime.fromisoformat(created_at), int(pk)
+    # _encode_cursor only writes aware timestamps and real ids; anything else was edited by hand
+    if created_at.tzinfo is None or not 0 < pk < 2 ** 63:
+        raise ValueError("cursor was not issued by this endpoint")
+    return created_at, pk
+
+
 @api_view(['GET'])
 def get_all_analyses(request):
-    """Get all PR analyses with pagination"""
-    analyses = PRAnalysisResult.objects.all().order_by('-created_at')
+    """Get PR analyses, newest first, with keyset pagination.
+
+    ?limit=N (default 50, max 200) and ?cursor=<next_cursor of the previous page>. Only the
+    listed columns are read; the analysis_result JSON is never loaded.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get("limit", ANALYSES_DEFAULT_LIMIT)), ANALYSES_MAX_LIMIT))
+        cursor = _decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    except (ValueError, UnicodeDecodeError, binascii.Error) as e:
+        return Response({"error": f"Invalid pagination parameters: {str(e)}"}, status=400)
+
+    analyses = PRAnalysisResult.objects.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = cursor
+        analyses = analyses.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(analyses.values("id", "task_id", "repo_url", "pr_number", "created_at", "file_count")[:limit + 1])
+    next_cursor = _encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
     results = []
-    for analysis in analyses:
+    for row in rows[:limit]:
         results.append({
-            "task_id": analysis.task_id,
-            "repo_url": analysis.repo_url,
-            "pr_number": analysis.pr_number,
-            "created_at": analysis.created_at.isoformat(),
-            "file_count": len(analysis.analysis_result) if isinstance(analysis.analysis_result, list) else 0,
+            "task_id": row["task_id"],
+            "repo_url": row["repo_url"],
+            "pr_number": row["pr_number"],
+            "created_at": row["created_at"].isoformat(),
+            "file_count": row["file_count"],
         })
-    return Response({"count": len(results), "results": results})
+    return Response({"count": len(results), "results": results, "next_cursor": next_cursor})
+
+
+def _parse_day(value):
+    """A YYYY-MM-DD query parameter as a date, None when absent; ValueError when it is malformed"""
+    if not value:
+        return None
+    # parse_date returns None for text that is not a date at all and raises for impossible dates
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"{value!r} is not a YYYY-MM-DD date")
+    return day
 
 
 @api_view(['GET'])
 def get_statistics(request):
-    """Get statistics about all analyses"""
-    total_analyses = PRAnalysisResult.objects.count()
-    analyses = PRAnalysisResult.objects.all()
-    
-    total_issues = 0
-    issue_types = {"style": 0, "bugs": 0, "performance": 0, "best_practice": 0}
-    
-    for analysis in analyses:
-        if isinstance(analysis.analysis_result, list):
-            for file_result in analysis.analysis_result:
-                if isinstance(file_result.get("analysis"), str):
-                    try:
-                        import json
-                        analysis_data = json.loads(file_result["analysis"])
-                        if "issues" in analysis_data:
-                            for issue in analysis_data["issues"]:
-                                total_issues += 1
-                                issue_type = issue.get("type", "").lower()
-                                if issue_type in issue_types:
-                                    issue_types[issue_type] += 1
-                    except:
-                        pass
-    
-    return Response({
-        "total_analyses": total_analyses,
-        "total_issues_found": total_issues,
-        "issues_by_type": issue_types,
-    })
+    """Get statistics about all analyses, optionally ?repo_url=...&since=YYYY-MM-DD&until=YYYY-MM-DD"""
+    try:
+        since = _parse_day(request.GET.get("since"))
+        until = _parse_day(request.GET.get("until"))
+    except ValueError as e:
+        return Response({"error": f"Invalid date: {str(e)}"}, status=400)
+    # Counts are maintained per repository and day as results are saved (Home/utils/issue_stats.py)
+    return Response(get_issue_statistics(request.GET.get("repo_url"), since, until))
+
+
+ISSUES_DEFAULT_LIMIT = 100
+ISSUES_MAX_LIMIT = 1000
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+@api_view(['GET'])
+def get_issues(request):
+    """Filter issues across analyses, newest first.
+
+    Query params (all optional): repo_url, pr_number, type, file (path prefix), task_id,
+    since/until (YYYY-MM-DD, inclusive) and limit.
+    """
+    issues = Issue.objects.select_related('analysis').order_by('-created_at', '-id')
+    try:
+        if request.GET.get("repo_url"):
+            issues = issues.filter(repo_url=request.GET["repo_url"])
+        if request.GET.get("pr_number"):
+            issues = issues.filter(pr_number=int(request.GET["pr_number"]))
+        if request.GET.get("type"):
+            issues = issues.filter(type=request.GET["type"].lower())
+        if request.GET.get("file"):
+            issues = issues.filter(file_path__startswith=request.GET["file"])
+        if request.GET.get("task_id"):
+            issues = issues.filter(analysis__task_id=request.GET["task_id"])
+        since = _parse_day(request.GET.get("since"))
+        until = _parse_day(request.GET.get("until"))
+        limit = min(int(request.GET.get("limit", ISSUES_DEFAULT_LIMIT)), ISSUES_MAX_LIMIT)
+    except ValueError as e:
+        return Response({"error": f"Invalid filter: {str(e)}"}, status=400)
+    # Bounds on the raw column (not created_at__date) so the created_at indexes apply
+    if since:
+        issues = issues.filter(created_at__gte=_start_of_day(since))
+    if until:
+        issues = issues.filter(created_at__lt=_start_of_day(until + timedelta(days=1)))
+    results = IssueSerializer(issues[:max(0, limit)], many=True).data
+    return Response({"count": len(results), "results": results})
+
+
+@api_view(['GET'])
+def get_cache_statistics(request):
+    """Get hit/miss counters for the LLM result cache"""
+    return Response(get_cache_stats())
+
+
+@api_view(['GET'])
+def get_llm_output_statistics(request):
+    """Get parse/repair counters and the parse-failure rate of LLM answers"""
+    return Response(get_output_stats())
+
+
+@api_view(['GET'])
+def get_resilience_statistics(request):
+    """Get retry, throttling and circuit breaker counters for the Groq and GitHub calls"""
+    return Response(get_resilience_stats())
 
-    
 
+def metrics(request):
+    """Pipeline metrics of all workers in the Prometheus text format, for scraping"""
+    resilience = get_resilience_stats()
+    provider_events = [
+        ("pr_analysis_provider_events_total", value, {"provider": provider, "event": event})
+        for provider in PROVIDERS for event, value in resilience[provider].items()
+    ]
+    return HttpResponse(render_metrics(provider_events), content_type="text/plain; version=0.0.4; charset=utf-8")
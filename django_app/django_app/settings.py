@@ -1,5 +1,8 @@
 import os
+import json
+import tempfile
 from pathlib import Path
+from kombu import Queue
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -119,12 +122,169 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379")
+
 CELERY_BROKER_URL="redis://127.0.0.1:6379"
 CELERY_RESULT_BACKEND="redis://127.0.0.1:6379"
 CELERY_ACCEPT_CONTENT=['application/json']
 CELERY_RESULT_SERIALIZER="json"
 CELERY_TASK_SERIALIZER="json"
 CELERY_RESULT_EXPIRES=60*60*24
+# Honor message priorities on the Redis broker (0 highest .. 9 lowest)
+CELERY_BROKER_TRANSPORT_OPTIONS={"queue_order_strategy": "priority", "priority_steps": list(range(10)), "sep": ":"}
+
+# PR analysis pipeline
+# Max files fetched/analyzed concurrently within one analyze_repo_task
+PR_ANALYSIS_MAX_CONCURRENCY = int(os.getenv("PR_ANALYSIS_MAX_CONCURRENCY", "8"))
+# Max files in flight across all tasks running in one worker process
+PR_ANALYSIS_WORKER_MAX_CONCURRENCY = int(os.getenv("PR_ANALYSIS_WORKER_MAX_CONCURRENCY", "16"))
+# "sync" runs the pipeline on a thread pool (requests + Groq); "async" on one event loop per task
+# (httpx + AsyncGroq), so a worker process keeps many files in flight without a thread each
+PR_ANALYSIS_ENGINE = os.getenv("PR_ANALYSIS_ENGINE", "sync")
+# Downloads and LLM requests in flight per task with the async engine
+PR_ANALYSIS_ASYNC_MAX_CONCURRENCY = int(os.getenv("PR_ANALYSIS_ASYNC_MAX_CONCURRENCY", "32"))
+# "full" sends whole files to the LLM, "hunks" only the changed hunks plus context lines
+PR_ANALYSIS_REVIEW_MODE = os.getenv("PR_ANALYSIS_REVIEW_MODE", "full")
+PR_ANALYSIS_HUNK_CONTEXT_LINES = int(os.getenv("PR_ANALYSIS_HUNK_CONTEXT_LINES", "3"))
+# Token budgets (estimated at ~4 chars/token): files above MAX_PROMPT_TOKENS are split on
+# function/class boundaries, files up to BATCH_MAX_TOKENS are packed together into one request
+PR_ANALYSIS_MAX_PROMPT_TOKENS = int(os.getenv("PR_ANALYSIS_MAX_PROMPT_TOKENS", "6000"))
+PR_ANALYSIS_BATCH_MAX_TOKENS = int(os.getenv("PR_ANALYSIS_BATCH_MAX_TOKENS", "2000"))
+PR_ANALYSIS_BATCH_MAX_FILES = int(os.getenv("PR_ANALYSIS_BATCH_MAX_FILES", "8"))
+
+# File filter, applied to the PR file list before any download. Deleted files, pure renames,
+# binaries, lock files, minified and vendored code are recorded as skipped, as are files matching
+# SKIP_GLOBS (comma separated; globs without "/" match the file name, others the path) or
+# changing more than MAX_FILE_CHANGES lines (0: no limit)
+PR_ANALYSIS_FILTER_ENABLED = os.getenv("PR_ANALYSIS_FILTER_ENABLED", "true").lower() == "true"
+PR_ANALYSIS_SKIP_GLOBS = [glob.strip() for glob in os.getenv("PR_ANALYSIS_SKIP_GLOBS", "").split(",") if glob.strip()]
+PR_ANALYSIS_MAX_FILE_CHANGES = int(os.getenv("PR_ANALYSIS_MAX_FILE_CHANGES", "0"))
+# Per-repo rules as JSON: {"owner/repo": {"skip": [globs], "review": [globs], "max_changes": n}};
+# keys may be globs ("my-org/*"), "review" globs are always reviewed
+PR_ANALYSIS_REPO_FILE_RULES = json.loads(os.getenv("PR_ANALYSIS_REPO_FILE_RULES", "{}"))
+
+# GitHub API (override for GitHub Enterprise)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+# Conditional requests: ETag/Last-Modified per URL are kept in Redis and 304s answered from there
+GITHUB_ETAG_CACHE_ENABLED = os.getenv("GITHUB_ETAG_CACHE_ENABLED", "true").lower() == "true"
+GITHUB_ETAG_CACHE_TTL = int(os.getenv("GITHUB_ETAG_CACHE_TTL", str(60*60*24)))
+GITHUB_ETAG_CACHE_MAX_BYTES = int(os.getenv("GITHUB_ETAG_CACHE_MAX_BYTES", str(1024*1024)))
+# Token bucket shared by all workers through Redis, per GitHub token
+GITHUB_RATE_LIMIT_PER_HOUR = int(os.getenv("GITHUB_RATE_LIMIT_PER_HOUR", "5000"))
+GITHUB_ANON_RATE_LIMIT_PER_HOUR = int(os.getenv("GITHUB_ANON_RATE_LIMIT_PER_HOUR", "60"))
+GITHUB_RATE_LIMIT_BURST = int(os.getenv("GITHUB_RATE_LIMIT_BURST", "50"))
+# Stop spending when GitHub reports this many calls left, until the window resets
+GITHUB_RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "50"))
+GITHUB_RATE_LIMIT_MAX_WAIT = float(os.getenv("GITHUB_RATE_LIMIT_MAX_WAIT", "300"))  # seconds, then fail
+GITHUB_RATE_LIMIT_RETRIES = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "2"))
+
+# Local bare git mirror per repository on the worker's disk. PRs with at least MIN_FILES changed files
+# fetch refs/pull/<n>/head once per head (FETCH_DEPTH commits, 0: full history) and read file contents
+# from it instead of downloading each file. Least recently used mirrors are deleted beyond MAX_BYTES
+GIT_MIRROR_ENABLED = os.getenv("GIT_MIRROR_ENABLED", "false").lower() == "true"
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", os.path.join(tempfile.gettempdir(), "pr_reviewer_git_mirrors"))
+GIT_MIRROR_MAX_BYTES = int(os.getenv("GIT_MIRROR_MAX_BYTES", str(10*1024**3)))
+GIT_MIRROR_MIN_FILES = int(os.getenv("GIT_MIRROR_MIN_FILES", "20"))
+GIT_MIRROR_FETCH_DEPTH = int(os.getenv("GIT_MIRROR_FETCH_DEPTH", "1"))
+GIT_MIRROR_FETCH_TIMEOUT = float(os.getenv("GIT_MIRROR_FETCH_TIMEOUT", "600"))  # seconds
+# Git remote base for mirrors (override for GitHub Enterprise)
+GITHUB_GIT_URL = os.getenv("GITHUB_GIT_URL", "https://github.com").rstrip("/")
+
+# GitHub webhook (/webhooks/github/), verified with SECRET (webhooks are refused without one). pull_request
+# events with one of ACTIONS analyze the PR head DEBOUNCE_SECONDS later, so only the last of several quick
+# pushes is analyzed; analyses of older heads still queued or running are revoked (and with
+# TERMINATE_SUPERSEDED, killed mid-run). GITHUB_TOKEN is used for these analyses (private repositories)
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+GITHUB_WEBHOOK_ACTIONS = [action.strip() for action in os.getenv("GITHUB_WEBHOOK_ACTIONS", "opened,synchronize,reopened,ready_for_review").split(",") if action.strip()]
+GITHUB_WEBHOOK_DEBOUNCE_SECONDS = int(os.getenv("GITHUB_WEBHOOK_DEBOUNCE_SECONDS", "30"))
+GITHUB_WEBHOOK_TERMINATE_SUPERSEDED = os.getenv("GITHUB_WEBHOOK_TERMINATE_SUPERSEDED", "true").lower() == "true"
+GITHUB_WEBHOOK_INCREMENTAL = os.getenv("GITHUB_WEBHOOK_INCREMENTAL", "true").lower() == "true"
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN") or None
+
+# Routing by PR size (changed_files/additions from the PR metadata). PRs reaching either limit go to
+# the large queue and, above SPLIT_BATCH_FILES files, are split into per-batch subtasks (a chord)
+PR_ANALYSIS_SMALL_QUEUE = os.getenv("PR_ANALYSIS_SMALL_QUEUE", "pr_small")
+PR_ANALYSIS_LARGE_QUEUE = os.getenv("PR_ANALYSIS_LARGE_QUEUE", "pr_large")
+PR_ANALYSIS_LARGE_PR_FILES = int(os.getenv("PR_ANALYSIS_LARGE_PR_FILES", "50"))
+PR_ANALYSIS_LARGE_PR_ADDITIONS = int(os.getenv("PR_ANALYSIS_LARGE_PR_ADDITIONS", "5000"))
+PR_ANALYSIS_SPLIT_BATCH_FILES = int(os.getenv("PR_ANALYSIS_SPLIT_BATCH_FILES", "40"))
+# A worker started without -Q consumes both queues; tasks sent without a queue (chord callbacks,
+# batch callbacks, parked retries) go to the small one
+CELERY_TASK_DEFAULT_QUEUE = PR_ANALYSIS_SMALL_QUEUE
+CELERY_TASK_QUEUES = [Queue(PR_ANALYSIS_SMALL_QUEUE), Queue(PR_ANALYSIS_LARGE_QUEUE)]
+
+# Batch analyses (start_batch): explicit PRs and every open PR of whole repositories. Batch PRs queue at the
+# lowest priority and share one budget across all batches and workers: at most MAX_CONCURRENCY analyses
+# running at once (a slot is freed when its analysis reports back; running analyses renew its lease, so it
+# only expires SLOT_LEASE seconds after a worker died) and STARTS_PER_MINUTE started; PRs over budget ask
+# again after SLOT_RETRY_SECONDS and fail once they have waited MAX_WAIT seconds
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_STARTS_PER_MINUTE = int(os.getenv("BATCH_STARTS_PER_MINUTE", "60"))
+BATCH_SLOT_LEASE = int(os.getenv("BATCH_SLOT_LEASE", "3600"))
+BATCH_SLOT_RETRY_SECONDS = int(os.getenv("BATCH_SLOT_RETRY_SECONDS", "30"))
+BATCH_MAX_WAIT = int(os.getenv("BATCH_MAX_WAIT", str(60*60*24)))
+BATCH_MAX_PRS = int(os.getenv("BATCH_MAX_PRS", "5000"))  # per batch, explicit and listed
+BATCH_MAX_REPOS = int(os.getenv("BATCH_MAX_REPOS", "500"))
+
+# Single flight: start_task requests for the same PR head, model and prompts share one analysis
+PR_ANALYSIS_SINGLE_FLIGHT_ENABLED = os.getenv("PR_ANALYSIS_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+PR_ANALYSIS_SINGLE_FLIGHT_TTL = int(os.getenv("PR_ANALYSIS_SINGLE_FLIGHT_TTL", str(60*60*24)))  # seconds a finished analysis is reused
+
+# Per-task event streams (Redis) that the gateway relays to browsers as Server-Sent Events
+PR_ANALYSIS_EVENTS_TTL = int(os.getenv("PR_ANALYSIS_EVENTS_TTL", str(60*60)))  # seconds after the last event
+PR_ANALYSIS_EVENTS_MAX_LEN = int(os.getenv("PR_ANALYSIS_EVENTS_MAX_LEN", "10000"))
+
+# Resilience around Groq and GitHub calls. Timeouts, 429s and 5xx are retried up to MAX_RETRIES times
+# with jittered exponential backoff (BASE * 2^attempt seconds, capped at BACKOFF_MAX) that honors
+# Retry-After. A 429 halves the provider's concurrency limit per worker process, which grows back
+# by one per limit successful calls.
+RESILIENCE_MAX_RETRIES = int(os.getenv("RESILIENCE_MAX_RETRIES", "3"))
+RESILIENCE_BACKOFF_BASE = float(os.getenv("RESILIENCE_BACKOFF_BASE", "1"))
+RESILIENCE_BACKOFF_MAX = float(os.getenv("RESILIENCE_BACKOFF_MAX", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "32"))
+# Circuit breaker: after THRESHOLD consecutive failures calls fail fast for COOLDOWN seconds, then one
+# probe call decides. Files that could not be fetched or reviewed are parked, not stored as errors,
+# and retried after PARK_RETRY_DELAY seconds (doubling per round, up to PARK_MAX_RETRIES rounds)
+RESILIENCE_BREAKER_THRESHOLD = int(os.getenv("RESILIENCE_BREAKER_THRESHOLD", "5"))
+RESILIENCE_BREAKER_COOLDOWN = float(os.getenv("RESILIENCE_BREAKER_COOLDOWN", "30"))
+PR_ANALYSIS_PARK_RETRY_DELAY = int(os.getenv("PR_ANALYSIS_PARK_RETRY_DELAY", "60"))
+PR_ANALYSIS_PARK_MAX_RETRIES = int(os.getenv("PR_ANALYSIS_PARK_MAX_RETRIES", "3"))
+
+# Pipeline metrics (per-stage latency histograms, file, token and task counters), shared by all
+# workers through Redis and served at /metrics in the Prometheus text format
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Upper bounds (seconds) of the latency histogram buckets
+METRICS_BUCKETS = [float(bound) for bound in os.getenv("METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300").split(",") if bound.strip()]
+
+# HTTP connection pools (one per worker process, reused across files and tasks)
+GITHUB_HTTP_POOL_SIZE = int(os.getenv("GITHUB_HTTP_POOL_SIZE", "16"))  # keep-alive connections per GitHub host
+GITHUB_CONNECT_TIMEOUT = float(os.getenv("GITHUB_CONNECT_TIMEOUT", "5"))
+GITHUB_READ_TIMEOUT = float(os.getenv("GITHUB_READ_TIMEOUT", "30"))
+# Timeout of the one GitHub call start_task makes while its client waits (PR details)
+GITHUB_INLINE_TIMEOUT = float(os.getenv("GITHUB_INLINE_TIMEOUT", "3"))
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "16"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+
+# Models. With tiering every file is first triaged by LLM_TRIAGE_MODEL, and only files it rates at least
+# LLM_ESCALATE_RISK (low|medium|high) or LLM_ESCALATE_COMPLEXITY (1-10) are reviewed again by LLM_MODEL
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_TIERING_ENABLED = os.getenv("LLM_TIERING_ENABLED", "false").lower() == "true"
+LLM_TRIAGE_MODEL = os.getenv("LLM_TRIAGE_MODEL", "llama-3.1-8b-instant")
+LLM_ESCALATE_RISK = os.getenv("LLM_ESCALATE_RISK", "medium")
+LLM_ESCALATE_COMPLEXITY = int(os.getenv("LLM_ESCALATE_COMPLEXITY", "6"))
+# USD per million [prompt, completion] tokens, for the per-tier cost stored with each analysis
+LLM_PRICES = json.loads(os.getenv("LLM_PRICES", '{"llama-3.3-70b-versatile": [0.59, 0.79], "llama-3.1-8b-instant": [0.05, 0.08]}'))
+
+# Constrain LLM answers to a JSON object (Groq JSON mode); answers are parsed and validated once in the worker
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+
+# LLM result cache, keyed on file blob sha + prompt version + model + temperature
+# Redis is used when reachable, otherwise the LLMCacheEntry table
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(60*60*24*7)))  # seconds since last access
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))  # LRU eviction beyond this
 
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
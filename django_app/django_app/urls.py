@@ -15,10 +15,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
-from Home.views import start_task, task_status_view
+from Home.views import start_task, task_status_view, metrics, github_webhook, start_batch, batch_status_view
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("start_task/", start_task, name='start_task'),
     path("task_status_view/<str:task_id>/", task_status_view, name='task_status_view'),
+    path("start_batch/", start_batch, name='start_batch'),
+    path("batch_status/<str:batch_id>/", batch_status_view, name='batch_status_view'),
     path('api/', include('Home.urls')),
+    path("metrics", metrics, name='metrics'),
+    path("webhooks/github/", github_webhook, name='github_webhook'),
 ]
@@ -1,10 +1,52 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import os
+import json
+import time
 import httpx
+import redis
+import redis.asyncio as aioredis
 
-app = FastAPI(title="PR Review System API", version="1.0.0")
+DJANGO_URL=os.getenv("DJANGO_URL","http://127.0.0.1:8080").rstrip("/")
+REDIS_URL=os.getenv("REDIS_URL","redis://127.0.0.1:6379")
+# Same Redis as CELERY_RESULT_BACKEND in django_app/settings.py; task states are read from it directly
+CELERY_RESULT_BACKEND=os.getenv("CELERY_RESULT_BACKEND","redis://127.0.0.1:6379")
+CELERY_TASK_META_PREFIX="celery-task-meta-"
+# Must match Home/utils/progress.py in the Django app
+EVENTS_KEY_PREFIX="pr_analysis:events:"
+SSE_KEEPALIVE_SECONDS=int(os.getenv("SSE_KEEPALIVE_SECONDS","15"))
+GATEWAY_HTTP_POOL_SIZE=int(os.getenv("GATEWAY_HTTP_POOL_SIZE","50"))
+GATEWAY_CONNECT_TIMEOUT=float(os.getenv("GATEWAY_CONNECT_TIMEOUT","5"))
+GATEWAY_READ_TIMEOUT=float(os.getenv("GATEWAY_READ_TIMEOUT","30"))
+# Upper bounds (seconds) of the gateway's request latency histogram
+GATEWAY_METRICS_BUCKETS=[float(bound) for bound in os.getenv("GATEWAY_METRICS_BUCKETS","0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",") if bound.strip()]
+
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    # One keep-alive pool to Django and one to Redis for the whole process, instead of a
+    # new connection per request
+    app.state.django=httpx.AsyncClient(
+        base_url=DJANGO_URL,
+        limits=httpx.Limits(max_connections=GATEWAY_HTTP_POOL_SIZE,max_keepalive_connections=GATEWAY_HTTP_POOL_SIZE,keepalive_expiry=60),
+        timeout=httpx.Timeout(GATEWAY_READ_TIMEOUT,connect=GATEWAY_CONNECT_TIMEOUT),
+    )
+    app.state.redis=aioredis.from_url(REDIS_URL)
+    app.state.results=app.state.redis if CELERY_RESULT_BACKEND==REDIS_URL else aioredis.from_url(CELERY_RESULT_BACKEND)
+    try:
+        yield
+    finally:
+        await app.state.django.aclose()
+        if app.state.results is not app.state.redis:
+            await app.state.results.aclose()
+        await app.state.redis.aclose()
+
+
+app = FastAPI(title="PR Review System API", version="1.0.0", lifespan=lifespan)
 
 # CORS Configuration
 app.add_middleware(
@@ -15,39 +57,206 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gateway metrics for /metrics, per process (the pipeline's own metrics are on Django's /metrics):
+# request counts per route, method and status, and a latency histogram per route
+_request_counts={}   # (route, method, status) -> requests
+_request_latency={}  # route -> {"buckets": [count per bucket, +Inf last], "sum": seconds, "count": n}
+_requests_in_flight=0
+
+
+@app.middleware("http")
+async def record_request_metrics(request:Request,call_next):
+    global _requests_in_flight
+    _requests_in_flight+=1
+    started=time.monotonic()
+    status=500
+    try:
+        response=await call_next(request)
+        status=response.status_code
+        return response
+    finally:
+        # Streaming responses (task events) are timed until their headers are sent
+        _requests_in_flight-=1
+        seconds=time.monotonic()-started
+        # The route template, not the path, so task ids do not each become a series
+        route=getattr(request.scope.get("route"),"path","unmatched")
+        key=(route,request.method,status)
+        _request_counts[key]=_request_counts.get(key,0)+1
+        latency=_request_latency.setdefault(route,{"buckets":[0]*(len(GATEWAY_METRICS_BUCKETS)+1),"sum":0.0,"count":0})
+        latency["buckets"][next((i for i,bound in enumerate(GATEWAY_METRICS_BUCKETS) if seconds<=bound),len(GATEWAY_METRICS_BUCKETS))]+=1
+        latency["sum"]+=seconds
+        latency["count"]+=1
+
+
+@app.get("/metrics",response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Gateway request metrics in the Prometheus text format"""
+    lines=[
+        "# HELP gateway_requests_total HTTP requests handled by the gateway",
+        "# TYPE gateway_requests_total counter",
+    ]
+    for (route,method,status),count in sorted(_request_counts.items()):
+        lines.append(f'gateway_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+    lines+=[
+        "# HELP gateway_request_seconds Gateway request latency",
+        "# TYPE gateway_request_seconds histogram",
+    ]
+    for route,latency in sorted(_request_latency.items()):
+        cumulative=0
+        for bound,count in zip([repr(bound) for bound in GATEWAY_METRICS_BUCKETS]+["+Inf"],latency["buckets"]):
+            cumulative+=count
+            lines.append(f'gateway_request_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+        lines.append(f'gateway_request_seconds_sum{{route="{route}"}} {latency["sum"]!r}')
+        lines.append(f'gateway_request_seconds_count{{route="{route}"}} {latency["count"]}')
+    lines+=[
+        "# HELP gateway_requests_in_flight Requests the gateway is handling",
+        "# TYPE gateway_requests_in_flight gauge",
+        f"gateway_requests_in_flight {_requests_in_flight}",
+    ]
+    return PlainTextResponse("\n".join(lines)+"\n",media_type="text/plain; version=0.0.4")
+
+
 # we can say this work as a serializer
 class AnalyzePRRequest(BaseModel):
     repo_url:str
     pr_number:int
     github_token: Optional[str]=None
+    incremental: bool=False  # Only re-analyze files changed since the last analyzed head
+    review_mode: Optional[str]=None  # "full" or "hunks"
+    force: bool=False  # Start a new analysis even if an identical one is running or done
 
 @app.post("/start_task")
 async def start_task_endpoint(task_request:AnalyzePRRequest):
     data={
         "repo_url": task_request.repo_url,
         "pr_number": task_request.pr_number,
-        "github_token": task_request.github_token
-
+        "github_token": task_request.github_token,
+        "incremental": task_request.incremental,
+        "force": task_request.force,
     }
+    if task_request.review_mode:
+        data["review_mode"]=task_request.review_mode
 
-    async with httpx.AsyncClient() as client:
-        response=await client.post(
-            "http://127.0.0.1:8080/start_task/",
-            data=data
-
-        )
-        if response.status_code!=200:
-            return {"error":"failed to start task","details":response.text}
+    response=await app.state.django.post("/start_task/",json=data)
+    if response.status_code!=200:
+        return {"error":"failed to start task","details":response.text}
     print(data)
     task_id=response.json().get('task_id')
-    return{"task_id":task_id,"status":"task started"}
+    coalesced=response.json().get('coalesced',False)
+    return{"task_id":task_id,"status":"task coalesced" if coalesced else "task started","coalesced":coalesced}
+
+
+# Passed through to Django, which verifies the signature over the untouched body
+WEBHOOK_HEADERS=("content-type","x-github-event","x-github-delivery","x-hub-signature-256")
+
+
+@app.post("/webhooks/github")
+async def github_webhook_endpoint(request:Request):
+    """GitHub webhook (pull_request events), relayed as is to Django's /webhooks/github/"""
+    headers={name:value for name,value in request.headers.items() if name.lower() in WEBHOOK_HEADERS}
+    try:
+        response=await app.state.django.post("/webhooks/github/",content=await request.body(),headers=headers)
+    except httpx.HTTPError as e:
+        print(f"ERROR relaying webhook to Django: {str(e)}")
+        # GitHub shows failed deliveries and lets them be redelivered
+        return Response(content=json.dumps({"error":"backend unavailable"}),status_code=502,media_type="application/json")
+    return Response(content=response.content,status_code=response.status_code,media_type="application/json")
+
+
+class BatchPR(BaseModel):
+    repo_url:str
+    pr_number:int
+
+class AnalyzeBatchRequest(BaseModel):
+    prs:List[BatchPR]=[]  # Explicit PRs
+    repos:List[str]=[]  # Repositories whose open PRs are all analyzed
+    github_token: Optional[str]=None
+    incremental: bool=False
+    review_mode: Optional[str]=None
+    force: bool=False
+
+@app.post("/start_batch")
+async def start_batch_endpoint(batch_request:AnalyzeBatchRequest):
+    response=await app.state.django.post("/start_batch/",json=batch_request.model_dump(exclude_none=True))
+    if response.status_code!=200:
+        return {"error":"failed to start batch","details":response.text}
+    return response.json()
+
+
+@app.get("/batch_status/{batch_id}/")
+async def batch_status_endpoint(batch_id:str,items:bool=False):
+    try:
+        response=await app.state.django.get(f"/batch_status/{batch_id}/",params={"items":str(items).lower()})
+        return response.json()
+    except (httpx.HTTPError,ValueError) as e:
+        print(f"ERROR fetching batch status from Django: {str(e)}")
+    return {"message":"something went wrong"}
+
+
+async def _status_from_result_backend(task_id):
+    """Same answer as Django's task_status_view, read straight from Celery's Redis backend.
+
+    Returns None when the backend cannot be read, so the caller can ask Django instead.
+    """
+    try:
+        meta=await app.state.results.get(CELERY_TASK_META_PREFIX+task_id)
+    except redis.RedisError as e:
+        print(f"WARNING: result backend unavailable, asking Django: {str(e)}")
+        return None
+    if meta is None:
+        # Celery only writes the meta once the task reaches a state worth storing
+        return {"task_id":task_id,"status":"PENDING"}
+    meta=json.loads(meta)
+    if meta.get("status")=="SUCCESS":
+        return {"task_id":task_id,"status":"SUCCESS","result":meta.get("result")}
+    return {"task_id":task_id,"status":meta.get("status")}
 
 
 @app.get("/task_status/{task_id}/")
 async def task_status_endpoint(task_id:str):
-    async with httpx.AsyncClient() as client:
-        response=await client.get(
-            f"http://127.0.0.1:8080/task_status_view/{task_id}/",
-        )
+    status=await _status_from_result_backend(task_id)
+    if status is not None:
+        return status
+    try:
+        response=await app.state.django.get(f"/task_status_view/{task_id}/")
         return response.json()
+    except (httpx.HTTPError,ValueError) as e:
+        print(f"ERROR fetching task status from Django: {str(e)}")
     return {"message":"something went wrong"}
+
+
+def _sse(event,data,event_id=None):
+    lines=[]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines)+"\n\n"
+
+
+@app.get("/task_events/{task_id}/")
+async def task_events_endpoint(task_id:str,request:Request):
+    """Server-Sent Events: replays the task's progress stream and follows it until "done".
+
+    Events are "started", "file" ({"index", "entry"} for every finished file) and "done"
+    ({"status", ...}). Each event id is its Redis stream id, so a reconnecting EventSource
+    resumes after the last event it received (Last-Event-ID).
+    """
+    last_id=request.headers.get("last-event-id") or "0-0"
+
+    async def stream():
+        nonlocal last_id
+        yield "retry: 2000\n\n"
+        while not await request.is_disconnected():
+            entries=await app.state.redis.xread({EVENTS_KEY_PREFIX+task_id:last_id},block=SSE_KEEPALIVE_SECONDS*1000,count=100)
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            for entry_id,fields in entries[0][1]:
+                last_id=entry_id.decode()
+                event=fields[b"event"].decode()
+                yield _sse(event,fields[b"data"].decode(),last_id)
+                if event=="done":
+                    return
+
+    return StreamingResponse(stream(),media_type="text/event-stream",headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
@@ -176,7 +176,18 @@ export default function AnalysisDetail() {
                     {fileResult.file_name}
                   </h2>
 
-                  {issues.length === 0 ? (
+                  {/* Files left out before review (deleted, binary, lock files, ...) */}
+                  {fileResult.skipped ? (
+                    <div style={{ padding: '1rem', background: '#f7fafc', borderRadius: '8px', color: '#718096' }}>
+                      <span className="badge badge-info" style={{ marginRight: '0.5rem' }}>skipped: {fileResult.skipped}</span>
+                      {fileResult.summary}
+                    </div>
+                  ) : fileResult.parked ? (
+                    <div style={{ padding: '1rem', background: '#fefcbf', borderRadius: '8px', color: '#744210' }}>
+                      <Loader size={18} style={{ marginRight: '0.5rem', display: 'inline' }} />
+                      Not analyzed yet, will be retried: {fileResult.parked}
+                    </div>
+                  ) : issues.length === 0 && !parsed.raw ? (
                     <div style={{ padding: '1rem', background: '#c6f6d5', borderRadius: '8px', color: '#22543d' }}>
                       <CheckCircle size={18} style={{ marginRight: '0.5rem', display: 'inline' }} />
                       No issues found! Great job! 🎉
@@ -218,7 +229,8 @@ export default function AnalysisDetail() {
                     </div>
                   )}
 
-                  {parsed.raw && !parsed.issues && (
+                  {/* Answers that could not be parsed are kept verbatim under "raw" */}
+                  {parsed.raw && issues.length === 0 && (
                     <div style={{ marginTop: '1rem', padding: '1rem', background: '#f7fafc', borderRadius: '8px' }}>
                       <pre style={{ whiteSpace: 'pre-wrap', fontSize: '0.875rem', color: '#4a5568' }}>
                         {parsed.raw}
@@ -1,6 +1,6 @@
 import { useState } from 'react'
 import { useNavigate, Link } from 'react-router-dom'
-import { startPRAnalysis, getTaskStatus, getPRAnalysis } from '../services/api'
+import { startPRAnalysis, getTaskStatus, getPRAnalysis, subscribeToTaskEvents } from '../services/api'
 import { Loader, CheckCircle, AlertCircle, Send } from 'lucide-react'
 
 export default function AnalyzePR() {
@@ -15,11 +15,13 @@ export default function AnalyzePR() {
   const [success, setSuccess] = useState(null)
   const [taskId, setTaskId] = useState(null)
   const [status, setStatus] = useState(null)
+  const [fileResults, setFileResults] = useState([])
 
   const handleSubmit = async (e) => {
     e.preventDefault()
     setError(null)
     setSuccess(null)
+    setFileResults([])
     setLoading(true)
 
     try {
@@ -33,14 +35,42 @@ export default function AnalyzePR() {
       setSuccess('Analysis started successfully!')
       setStatus('PENDING')
       
-      // Poll for status
-      pollTaskStatus(response.task_id)
+      watchTask(response.task_id)
     } catch (err) {
       setError(err.message)
       setLoading(false)
     }
   }
 
+  // Analyses arrive as parsed JSON objects
+  const countIssues = (analysis) => analysis?.issues?.length ?? 0
+
+  // Per-file results arrive as they finish; polling is only a fallback when the stream is unavailable
+  const watchTask = (id) => {
+    subscribeToTaskEvents(id, {
+      onFile: ({ index, entry }) => {
+        setStatus('ANALYZING')
+        setFileResults((previous) => {
+          const next = previous.filter((file) => file.index !== index)
+          return [...next, { index, fileName: entry.file_name, issues: countIssues(entry.analysis) }]
+            .sort((a, b) => a.index - b.index)
+        })
+      },
+      onDone: (result) => {
+        setLoading(false)
+        if (result.status === 'SAVED') {
+          setSuccess('Analysis completed! Redirecting...')
+          setTimeout(() => {
+            navigate(`/analysis/${id}`)
+          }, 500)
+        } else {
+          setError('Analysis failed: ' + (result.error || 'please try again.'))
+        }
+      },
+      onError: () => pollTaskStatus(id),
+    })
+  }
+
   const pollTaskStatus = async (id) => {
     const interval = setInterval(async () => {
       try {
@@ -172,6 +202,22 @@ export default function AnalyzePR() {
           </button>
         </form>
 
+        {fileResults.length > 0 && (
+          <div style={{ marginTop: '1.5rem' }}>
+            <p style={{ marginBottom: '0.5rem', fontWeight: 600 }}>
+              {fileResults.length} file{fileResults.length === 1 ? '' : 's'} analyzed so far
+            </p>
+            <ul style={{ listStyle: 'none', padding: 0, maxHeight: '240px', overflowY: 'auto' }}>
+              {fileResults.map((file) => (
+                <li key={file.index} style={{ display: 'flex', justifyContent: 'space-between', padding: '0.25rem 0', color: '#4a5568' }}>
+                  <code>{file.fileName}</code>
+                  <span>{file.issues} issue{file.issues === 1 ? '' : 's'}</span>
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
+
         {taskId && (
           <div style={{ marginTop: '1.5rem', padding: '1rem', background: '#f7fafc', borderRadius: '8px' }}>
             <p style={{ marginBottom: '0.5rem', fontWeight: 600 }}>Task ID:</p>
@@ -7,6 +7,8 @@ export default function Dashboard() {
   const [analyses, setAnalyses] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     loadAnalyses()
@@ -17,6 +19,7 @@ export default function Dashboard() {
       setLoading(true)
       const data = await getAllAnalyses()
       setAnalyses(data.results || [])
+      setNextCursor(data.next_cursor || null)
       setError(null)
     } catch (err) {
       setError(err.message)
@@ -25,6 +28,19 @@ export default function Dashboard() {
     }
   }
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true)
+      const data = await getAllAnalyses(nextCursor)
+      setAnalyses((previous) => [...previous, ...(data.results || [])])
+      setNextCursor(data.next_cursor || null)
+    } catch (err) {
+      setError(err.message)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const formatDate = (dateString) => {
     const date = new Date(dateString)
     return date.toLocaleString()
@@ -103,6 +119,11 @@ export default function Dashboard() {
                 </div>
               </Link>
             ))}
+            {nextCursor && (
+              <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            )}
           </div>
         )}
       </div>
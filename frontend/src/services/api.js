@@ -32,6 +32,22 @@ export const getTaskStatus = async (taskId) => {
   }
 }
 
+// Live progress over Server-Sent Events from the FastAPI gateway.
+// handlers: onFile({ index, entry }), onDone({ status, ... }), onError(). Returns the EventSource.
+export const subscribeToTaskEvents = (taskId, { onFile, onDone, onError }) => {
+  const source = new EventSource(`${FASTAPI_BASE_URL}/task_events/${taskId}/`)
+  source.addEventListener('file', (event) => onFile?.(JSON.parse(event.data)))
+  source.addEventListener('done', (event) => {
+    source.close()
+    onDone?.(JSON.parse(event.data))
+  })
+  source.onerror = () => {
+    // EventSource reconnects on its own (resuming from Last-Event-ID) unless the stream is gone
+    if (source.readyState === EventSource.CLOSED) onError?.()
+  }
+  return source
+}
+
 export const getPRAnalysis = async (taskId) => {
   try {
     const response = await api.get(`/api/get_pr_analysis/${taskId}/`)
@@ -41,9 +57,10 @@ export const getPRAnalysis = async (taskId) => {
   }
 }
 
-export const getAllAnalyses = async () => {
+// One page of analyses, newest first; pass the previous page's next_cursor to continue
+export const getAllAnalyses = async (cursor = null) => {
   try {
-    const response = await api.get('/api/get_all_analyses/')
+    const response = await api.get('/api/get_all_analyses/', { params: cursor ? { cursor } : {} })
     return response.data
   } catch (error) {
     throw new Error(error.response?.data?.error || 'Failed to get analyses')
@@ -50,7 +50,7 @@ echo -e "  redis-server\n"
 echo -e "${GREEN}Terminal 2 (Celery Worker):${NC}"
 echo -e "  source env/bin/activate"
 echo -e "  cd django_app"
-echo -e "  celery -A django_app worker -l info\n"
+echo -e "  celery -A django_app worker -l info -Q pr_small,pr_large\n"
 echo -e "${GREEN}Terminal 3 (Django Backend):${NC}"
 echo -e "  source env/bin/activate"
 echo -e "  cd django_app"